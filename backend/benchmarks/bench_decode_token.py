@@ -0,0 +1,30 @@
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+os.environ.setdefault('SECRET_KEY', '6749a721572bd937a4e9e4a3ce412517ba28916d7280d2f6b1b150d5503f49fd')
+os.environ.setdefault('ALGORITHM', 'HS256')
+os.environ.setdefault('ACCESS_TOKEN_EXPIRE_MINUTES', '30')
+os.environ.setdefault('REFRESH_TOKEN_EXPIRE_DAYS', '30')
+
+from security import create_access_token, decode_token, decode_token_cached, token_cache
+
+NUMBER = 20000
+
+
+def main():
+    token = create_access_token(42)
+    token_cache.clear()
+    decode_token_cached(token)
+
+    plain = min(timeit.repeat(lambda: decode_token(token), number=NUMBER, repeat=5)) / NUMBER
+    cached = min(timeit.repeat(lambda: decode_token_cached(token), number=NUMBER, repeat=5)) / NUMBER
+
+    print(f"decode_token        {plain * 1e6:8.2f} us/call")
+    print(f"decode_token_cached {cached * 1e6:8.2f} us/call")
+    print(f"saved per request   {(plain - cached) * 1e6:8.2f} us ({plain / cached:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Overhead of metrics collection on real requests.
+
+    python benchmarks/bench_metrics.py --requests 2000 --rounds 5
+
+Runs the app in process through httpx ASGITransport on a temporary sqlite
+database, with the memory token store and without note cache, so no redis
+or postgres is needed. Rounds with metrics on and off are interleaved.
+End to end numbers are noisy within a few percent, the last line measures the
+instrumentation alone and relates it to the measured request time.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+os.environ.setdefault('SECRET_KEY', '6749a721572bd937a4e9e4a3ce412517ba28916d7280d2f6b1b150d5503f49fd')
+os.environ.setdefault('ALGORITHM', 'HS256')
+os.environ.setdefault('ACCESS_TOKEN_EXPIRE_MINUTES', '30')
+os.environ.setdefault('REFRESH_TOKEN_EXPIRE_DAYS', '30')
+os.environ.setdefault('REDIS_HOST', 'localhost')
+os.environ.setdefault('REDIS_PORT', '6379')
+os.environ['DATABASE_URL'] = f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench_metrics.db"
+os.environ['TOKEN_STORE_BACKEND'] = 'memory'
+os.environ['NOTE_CACHE_ENABLED'] = 'false'
+
+import httpx
+
+import main
+import metrics
+
+
+async def run(client, paths, headers, count: int) -> float:
+    start = time.perf_counter()
+    for i in range(count):
+        response = await client.get(paths[i % len(paths)], headers=headers)
+        assert response.status_code == 200, response.text
+    return count / (time.perf_counter() - start)
+
+
+async def instrumentation_cost(count: int = 100_000) -> float:
+    # microseconds the middleware and two timed calls add to one request
+    class Route:
+        path = '/bench/{id}'
+
+    async def endpoint(scope, receive, send):
+        scope['route'] = Route
+        await timed_call()
+        await timed_call()
+        await send({'type': 'http.response.start', 'status': 200})
+
+    @metrics.timed(metrics.db_query_duration_seconds, 'bench')
+    async def timed_call():
+        pass
+
+    async def send(message):
+        pass
+
+    middleware = metrics.MetricsMiddleware(endpoint)
+    timings = {}
+    for enabled in (False, True):
+        metrics.METRICS_ENABLED = enabled
+        start = time.perf_counter()
+        for _ in range(count):
+            await middleware({'type': 'http', 'method': 'GET'}, None, send)
+        timings[enabled] = time.perf_counter() - start
+    return (timings[True] - timings[False]) / count * 1e6
+
+
+async def bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    await main.startup()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        credentials = {'email': 'bench@example.com', 'password': 'bench_password'}
+        await client.post('/api/v2/auth/register', json=credentials)
+        tokens = (await client.post('/api/v2/auth/login', json=credentials)).json()
+        headers = {'Authorization': f"Bearer {tokens['access_token']}"}
+        note = (await client.post(
+            '/api/v2/create', headers=headers, json={'note_text': 'bench note', 'note_date': '2025-12-17'},
+        )).json()
+        paths = [f"/api/v2/{note['note_id']}", '/api/v2/notes?limit=20']
+
+        await run(client, paths, headers, args.requests // 10)  # warm up
+        results = {True: [], False: []}
+        for _ in range(args.rounds):
+            for enabled in (False, True):
+                metrics.METRICS_ENABLED = enabled
+                results[enabled].append(await run(client, paths, headers, args.requests))
+
+    await main.shutdown()
+
+    cost = await instrumentation_cost()
+    off = statistics.median(results[False])
+    on = statistics.median(results[True])
+    print(f"metrics off {off:8.1f} req/s")
+    print(f"metrics on  {on:8.1f} req/s")
+    print(f"overhead    {(off - on) / off * 100:8.2f} %")
+    print(f"instrumentation {cost:.2f} us per request, {cost * off / 1e6 * 100:.2f} % of a request")
+
+
+if __name__ == '__main__':
+    asyncio.run(bench())
@@ -0,0 +1,167 @@
+"""Serialization cost of note responses.
+
+    python benchmarks/bench_serialization.py
+    python benchmarks/bench_serialization.py --requests 5000 --page-size 50
+
+Each payload is served by three one-route apps, called directly through ASGI
+without a server or an HTTP client, so the difference between them is what
+the response path costs:
+
+    json      FastAPI(), handler returns a dict, validated with response_model
+    orjson    FastAPI(default_response_class=ORJSONResponse), same handler
+    trusted   handler returns ORJSONResponse itself, response_model is not applied
+
+Payloads are one note and a page of --page-size notes, with small (about 200
+bytes) and large (16 KB, NOTE_CACHE_MAX_BYTES) texts. The last table compares
+encoding one /api/v2/notes/export chunk with json.dumps and orjson.dumps.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import datetime
+
+import orjson
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from schemas import NoteOut, NotePage
+
+WORDS = ('meeting', 'groceries', 'project', 'deadline', 'call', 'idea', 'review', 'travel', 'book', 'budget')
+TEXT_SIZES = {'small': 200, 'large': 16384}
+
+
+def make_text(rng: random.Random, size: int) -> str:
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words)[:size]
+
+
+def make_note(rng: random.Random, note_id: int, size: int) -> dict:
+    return {
+        'note_id': note_id,
+        'note_text': make_text(rng, size),
+        'note_date': datetime.date(2025, 1, 1) + datetime.timedelta(days=note_id % 365),
+    }
+
+
+def make_apps(payload: dict, model) -> dict:
+    plain = FastAPI()
+    orjson_default = FastAPI(default_response_class=ORJSONResponse)
+    trusted = FastAPI(default_response_class=ORJSONResponse)
+
+    @plain.get('/', response_model=model)
+    async def plain_route():
+        return payload
+
+    @orjson_default.get('/', response_model=model)
+    async def orjson_route():
+        return payload
+
+    @trusted.get('/', response_model=model)
+    async def trusted_route():
+        return ORJSONResponse(payload)
+
+    return {'json': plain, 'orjson': orjson_default, 'trusted': trusted}
+
+
+SCOPE = {
+    'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+    'path': '/', 'raw_path': b'/', 'query_string': b'', 'root_path': '', 'headers': [],
+    'server': ('bench', 80), 'client': ('127.0.0.1', 1),
+}
+
+
+async def call(app) -> bytes:
+    body = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.body':
+            body.append(message.get('body', b''))
+
+    await app(dict(SCOPE), receive, send)
+    return b''.join(body)
+
+
+async def measure(app, count: int) -> float:
+    # median of 5 rounds, microseconds per request
+    for _ in range(min(count, 200)):
+        await call(app)
+    rounds = []
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(count):
+            await call(app)
+        rounds.append((time.perf_counter() - start) / count * 1e6)
+    return sorted(rounds)[2]
+
+
+def measure_sync(func, count: int) -> float:
+    rounds = []
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(count):
+            func()
+        rounds.append((time.perf_counter() - start) / count * 1e6)
+    return sorted(rounds)[2]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000, help='requests per round, 5 rounds')
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--export-chunk', type=int, default=1000, help='rows in one export chunk')
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    print(f"{'payload':14} {'bytes':>9} {'json us':>10} {'orjson us':>10} {'trusted us':>11} {'saved us':>9} {'saved %':>8}")
+    for size_name, size in TEXT_SIZES.items():
+        note = make_note(rng, 1, size)
+        page = {'items': [make_note(rng, i, size) for i in range(args.page_size)], 'next_cursor': None}
+        for kind, payload, model, count in (
+            ('note', note, NoteOut, args.requests),
+            ('page', page, NotePage, max(1, args.requests // args.page_size * 4)),
+        ):
+            apps = make_apps(payload, model)
+            bodies = {name: await call(app) for name, app in apps.items()}
+            if len({json.dumps(json.loads(body), sort_keys=True) for body in bodies.values()}) != 1:
+                raise RuntimeError(f"{kind} {size_name}: responses differ")
+            results = {name: await measure(app, count) for name, app in apps.items()}
+            saved = results['json'] - results['trusted']
+            print(
+                f"{kind + ' ' + size_name:14} {len(bodies['trusted']):9} {results['json']:10.1f} {results['orjson']:10.1f}"
+                f" {results['trusted']:11.1f} {saved:9.1f} {saved / results['json'] * 100:7.1f}%"
+            )
+
+    print(f"\n{'export chunk':14} {'rows':>9} {'json us':>10} {'orjson us':>10} {'speedup':>8}")
+    for size_name, size in TEXT_SIZES.items():
+        rows = [make_note(rng, i, size) for i in range(args.export_chunk)]
+
+        def with_json():
+            return ''.join(json.dumps({
+                'note_id': row['note_id'], 'note_text': row['note_text'], 'note_date': str(row['note_date']),
+            }) + '\n' for row in rows).encode()
+
+        def with_orjson():
+            return b''.join(orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE) for row in rows)
+
+        count = max(1, 200000 // (args.export_chunk * (size // 100)))
+        json_us = measure_sync(with_json, count)
+        orjson_us = measure_sync(with_orjson, count)
+        print(f"{size_name:14} {len(rows):9} {json_us:10.1f} {orjson_us:10.1f} {json_us / orjson_us:7.1f}x")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,348 @@
+"""Benchmark suite for API routes, database and security functions.
+
+    python benchmarks/bench_suite.py
+    python benchmarks/bench_suite.py --sizes 100,10000 --requests 300 --save benchmarks/baseline.json
+    python benchmarks/bench_suite.py --compare benchmarks/baseline.json --threshold 15
+
+The app runs in process through httpx ASGITransport on a temporary sqlite
+database for every size (notes per user), with an in-memory redis stand-in
+and the memory token store, like tests/integration/test_api.py, and login
+throttling turned off. Requests are sent one after another, so throughput is
+1 / mean latency of one client.
+
+--compare exits with code 1 if p50 grew or throughput dropped by more than
+--threshold percent for any benchmark present in both runs. Baselines are
+only comparable between runs on the same machine.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import datetime
+import platform
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+os.environ.setdefault('SECRET_KEY', '6749a721572bd937a4e9e4a3ce412517ba28916d7280d2f6b1b150d5503f49fd')
+os.environ.setdefault('ALGORITHM', 'HS256')
+os.environ.setdefault('ACCESS_TOKEN_EXPIRE_MINUTES', '30')
+os.environ.setdefault('REFRESH_TOKEN_EXPIRE_DAYS', '30')
+os.environ.setdefault('REDIS_HOST', 'localhost')
+os.environ.setdefault('REDIS_PORT', '6379')
+os.environ.setdefault('DATABASE_URL', 'sqlite+aiosqlite:///:memory:')
+
+import httpx
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+import database
+import security
+from main import app, get_db, get_redis, get_token_store, get_rate_limiter
+from models import Base
+from rate_limit import RateLimiter
+from token_store import MemoryTokenStore
+from user_cache import user_cache
+
+PRELOAD_CHUNK_SIZE = 10000
+WORDS = ('meeting', 'groceries', 'project', 'deadline', 'call', 'idea', 'review', 'travel', 'book', 'budget')
+
+
+class MemoryRedis:
+    """The subset of redis commands used outside of the token store."""
+
+    def __init__(self):
+        self.storage = {}  # key -> (value, expires_at or None)
+
+    def _get(self, key):
+        item = self.storage.get(key)
+        if item is not None and item[1] is not None and item[1] <= time.monotonic():
+            del self.storage[key]
+            return None
+        return item
+
+    async def get(self, key):
+        item = self._get(key)
+        return item[0] if item else None
+
+    async def set(self, key, value, ex=None, nx=False):
+        if nx and self._get(key) is not None:
+            return None
+        self.storage[key] = (str(value), time.monotonic() + ex if ex else None)
+        return True
+
+    async def exists(self, key):
+        return 1 if self._get(key) is not None else 0
+
+    async def delete(self, *keys):
+        return sum(self.storage.pop(key, None) is not None for key in keys)
+
+
+def stats(samples: list[float], elapsed: float) -> dict:
+    # samples are seconds per operation
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000
+
+    return {
+        'ops': len(ordered),
+        'throughput': len(ordered) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+    }
+
+
+async def measure(operation, count: int) -> dict:
+    samples = []
+    start = time.perf_counter()
+    for i in range(count):
+        t = time.perf_counter()
+        await operation(i)
+        samples.append(time.perf_counter() - t)
+    return stats(samples, time.perf_counter() - start)
+
+
+def check(response, expected: int = 200):
+    if response.status_code != expected:
+        raise RuntimeError(f"{response.request.method} {response.request.url.path}: {response.status_code} {response.text}")
+    return response
+
+
+def make_text(rng: random.Random) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(5, 40)))
+
+
+async def preload(session_factory, user_id: int, size: int, rng: random.Random):
+    left = size
+    while left:
+        chunk = min(PRELOAD_CHUNK_SIZE, left)
+        async with session_factory() as db:
+            await database.new_notes(db, user_id, [
+                (make_text(rng), datetime.date(2025, 1, 1) + datetime.timedelta(days=i % 365)) for i in range(chunk)
+            ])
+        left -= chunk
+
+
+async def bench_size(size: int, args, workdir: str, results: dict):
+    rng = random.Random(size)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{workdir}/suite_{size}.db")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def _get_db():
+        async with session_factory() as db:
+            yield db
+
+    redis = MemoryRedis()
+    token_store = MemoryTokenStore()
+    # login benchmark repeats one email, zero limits turn throttling off
+    rate_limiter = RateLimiter(limits={'login': (0, 0), 'register': (0, 0)})
+
+    async def _get_redis():
+        yield redis
+
+    async def _get_token_store():
+        yield token_store
+
+    async def _get_rate_limiter():
+        yield rate_limiter
+
+    app.dependency_overrides[get_db] = _get_db
+    app.dependency_overrides[get_redis] = _get_redis
+    app.dependency_overrides[get_token_store] = _get_token_store
+    app.dependency_overrides[get_rate_limiter] = _get_rate_limiter
+    user_cache.clear()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        credentials = {'email': f'bench{size}@example.com', 'password': 'bench_password'}
+        user_id = check(await client.post('/api/v2/auth/register', json=credentials), 201).json()['id']
+        await preload(session_factory, user_id, size, rng)
+        note_ids = list(range(1, size + 1))
+
+        async def login(i):
+            check(await client.post('/api/v2/auth/login', json=credentials))
+
+        results[f'api.login@{size}'] = await measure(login, args.login_requests)
+
+        tokens = check(await client.post('/api/v2/auth/login', json=credentials)).json()
+        headers = {'Authorization': f"Bearer {tokens['access_token']}"}
+        refresh_token = tokens['refresh_token']
+
+        async def refresh(i):
+            nonlocal refresh_token
+            refresh_token = check(await client.post(
+                '/api/v2/auth/refresh', json={'refresh_token': refresh_token},
+            )).json()['refresh_token']
+
+        async def create(i):
+            response = check(await client.post('/api/v2/create', headers=headers, json={
+                'note_text': make_text(rng), 'note_date': '2025-12-17',
+            }), 201)
+            note_ids.append(response.json()['note_id'])
+
+        async def read(i):
+            check(await client.get(f'/api/v2/{rng.choice(note_ids)}', headers=headers))
+
+        async def update(i):
+            check(await client.put(f'/api/v2/{rng.choice(note_ids)}', headers=headers, json={
+                'note_text': make_text(rng), 'note_date': '2025-12-17',
+            }))
+
+        async def list_page(i):
+            check(await client.get('/api/v2/notes?limit=50', headers=headers))
+
+        async def search(i):
+            check(await client.get(f'/api/v2/notes/search?q={rng.choice(WORDS)}&limit=20', headers=headers))
+
+        for name, operation in (
+            ('refresh', refresh), ('create', create), ('read', read), ('update', update),
+            ('list', list_page), ('search', search),
+        ):
+            results[f'api.{name}@{size}'] = await measure(operation, args.requests)
+
+        rng.shuffle(note_ids)
+        to_delete = note_ids[:args.requests]
+
+        async def delete(i):
+            check(await client.delete(f'/api/v2/{to_delete[i]}', headers=headers))
+
+        results[f'api.delete@{size}'] = await measure(delete, len(to_delete))
+        note_ids = note_ids[args.requests:]
+
+    app.dependency_overrides.clear()
+
+    async with session_factory() as db:
+        async def get_user_by_id(i):
+            await database.get_user_by_id(db, user_id)
+
+        async def get_note(i):
+            await database.get_note(db, user_id, rng.choice(note_ids))
+
+        async def list_notes(i):
+            await database.list_notes(db, user_id, limit=50)
+
+        async def search_notes(i):
+            await database.search_notes(db, user_id, rng.choice(WORDS), limit=20)
+
+        async def new_note(i):
+            await database.new_note(db, user_id, make_text(rng), datetime.date(2025, 12, 17))
+
+        async def update_note(i):
+            await database.update_note(db, user_id, rng.choice(note_ids), make_text(rng))
+
+        async def new_notes(i):
+            await database.new_notes(db, user_id, [(make_text(rng), datetime.date(2025, 12, 17))] * 100)
+
+        for name, operation in (
+            ('get_user_by_id', get_user_by_id), ('get_note', get_note), ('list_notes', list_notes),
+            ('search_notes', search_notes), ('new_note', new_note), ('update_note', update_note),
+            ('new_notes_100', new_notes),
+        ):
+            results[f'db.{name}@{size}'] = await measure(operation, args.requests)
+
+    await engine.dispose()
+
+
+async def bench_security(args, results: dict):
+    password = 'bench_password'
+    hashed = security.hash_password(password)
+    access_token = security.create_access_token(42)
+
+    async def hash_password(i):
+        security.hash_password(password)
+
+    async def verify_password(i):
+        security.verify_password(password, hashed)
+
+    async def create_access_token(i):
+        security.create_access_token(42)
+
+    async def decode_token(i):
+        security.decode_token(access_token)
+
+    async def decode_token_cached(i):
+        security.decode_token_cached(access_token)
+
+    results['security.hash_password'] = await measure(hash_password, args.login_requests)
+    results['security.verify_password'] = await measure(verify_password, args.login_requests)
+    for name, operation in (
+        ('create_access_token', create_access_token), ('decode_token', decode_token),
+        ('decode_token_cached', decode_token_cached),
+    ):
+        results[f'security.{name}'] = await measure(operation, args.requests * 10)
+
+
+def print_results(results: dict):
+    print(f"{'benchmark':32} {'ops':>6} {'ops/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, r in results.items():
+        print(f"{name:32} {r['ops']:6} {r['throughput']:10.1f} {r['p50_ms']:9.3f} {r['p95_ms']:9.3f} {r['p99_ms']:9.3f}")
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    regressions = []
+    print(f"\n{'benchmark':32} {'p50 base':>9} {'p50 now':>9} {'p50 %':>8} {'ops/s %':>8}")
+    for name, r in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        p50_change = (r['p50_ms'] - base['p50_ms']) / base['p50_ms'] * 100 if base['p50_ms'] else 0.0
+        throughput_change = (r['throughput'] - base['throughput']) / base['throughput'] * 100 if base['throughput'] else 0.0
+        regressed = p50_change > threshold or throughput_change < -threshold
+        if regressed:
+            regressions.append(name)
+        print(
+            f"{name:32} {base['p50_ms']:9.3f} {r['p50_ms']:9.3f} {p50_change:+7.1f}% {throughput_change:+7.1f}%"
+            f"{'  REGRESSION' if regressed else ''}"
+        )
+    return regressions
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='100,10000', help='notes per user, comma separated')
+    parser.add_argument('--requests', type=int, default=300, help='operations per benchmark')
+    parser.add_argument('--login-requests', type=int, default=10, help='operations per bcrypt bound benchmark')
+    parser.add_argument('--save', help='write results to this json file')
+    parser.add_argument('--compare', help='baseline json file to compare with')
+    parser.add_argument('--threshold', type=float, default=15.0, help='regression threshold, percent')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in (int(s) for s in args.sizes.split(',')):
+            await bench_size(size, args, workdir, results)
+    await bench_security(args, results)
+
+    print_results(results)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'meta': {
+                    'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+                    'python': platform.python_version(),
+                    'machine': platform.machine(),
+                    'sizes': args.sizes,
+                    'requests': args.requests,
+                },
+                'results': results,
+            }, f, indent=2)
+        print(f"\nsaved to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) above {args.threshold}%: {', '.join(regressions)}")
+            sys.exit(1)
+        print(f"\nno regressions above {args.threshold}%")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
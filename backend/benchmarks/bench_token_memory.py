@@ -0,0 +1,70 @@
+"""Redis memory per refresh session, whole JWT as key vs jti as key.
+
+    python benchmarks/bench_token_memory.py --redis-url redis://localhost:6379/15 --sessions 100000
+
+The redis database must be empty, it is flushed after every layout.
+"""
+import os
+import sys
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+os.environ.setdefault('SECRET_KEY', '6749a721572bd937a4e9e4a3ce412517ba28916d7280d2f6b1b150d5503f49fd')
+os.environ.setdefault('ALGORITHM', 'HS256')
+os.environ.setdefault('ACCESS_TOKEN_EXPIRE_MINUTES', '30')
+os.environ.setdefault('REFRESH_TOKEN_EXPIRE_DAYS', '30')
+
+import redis.asyncio as redis
+
+from security import create_refresh_token, new_jti
+from token_rotation_logic import save_refresh_token, REFRESH_TOKEN_EXPIRE_DAYS
+
+BATCH_SIZE = 1000
+
+
+async def save_whole_token(client, user_id: int):
+    # layout before sessions were keyed by jti
+    await client.set(f"refresh:{create_refresh_token(user_id)}", user_id, ex=REFRESH_TOKEN_EXPIRE_DAYS*24*60*60)
+
+
+async def save_jti(client, user_id: int):
+    jti = new_jti()
+    create_refresh_token(user_id, jti)
+    await save_refresh_token(client, jti, user_id)
+
+
+async def measure(client, save, sessions: int, users: int) -> tuple[float, int | None]:
+    await client.flushdb()
+    before = (await client.info('memory'))['used_memory']
+    for start in range(0, sessions, BATCH_SIZE):
+        await asyncio.gather(*(
+            save(client, 1 + i % users) for i in range(start, min(start + BATCH_SIZE, sessions))
+        ))
+    after = (await client.info('memory'))['used_memory']
+    sample = await client.randomkey()
+    sample_usage = await client.memory_usage(sample) if sample else None
+    await client.flushdb()
+    return (after - before) / sessions, sample_usage
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--redis-url', default='redis://localhost:6379/15')
+    parser.add_argument('--sessions', type=int, default=100_000)
+    parser.add_argument('--users', type=int, default=10_000)
+    args = parser.parse_args()
+
+    client = redis.from_url(args.redis_url, decode_responses=True)
+    if await client.dbsize():
+        sys.exit(f"{args.redis_url} is not empty")
+
+    for label, save in (('whole token', save_whole_token), ('jti', save_jti)):
+        per_session, sample_usage = await measure(client, save, args.sessions, args.users)
+        print(f"{label:12} {per_session:7.1f} bytes per session  MEMORY USAGE of one key {sample_usage}")
+
+    await client.aclose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,307 @@
+"""Open-loop load generator for a running deployment.
+
+    python benchmarks/loadgen.py --base-url http://127.0.0.1:8000 --users 50 --rate 200 --duration 60
+    python benchmarks/loadgen.py --mix read=70,list=10,search=5,create=5,autosave=8,refresh=2
+
+Registers --users synthetic users (loadgen-{run}-{i}@example.com), logs them in
+and creates --notes-per-user notes for each. All of them come from one IP, so
+raise RATE_LIMIT_REGISTER_IP and RATE_LIMIT_LOGIN_IP of the deployment (or set
+RATE_LIMIT_ENABLED=false) for more than a few users. Then starts operations at --rate
+per second for --duration seconds, whether earlier ones have finished or not.
+Each operation is picked from the weighted --mix:
+
+    read      GET /api/v2/{note_id}
+    list      GET /api/v2/notes
+    search    GET /api/v2/notes/search
+    create    POST /api/v2/create
+    autosave  --autosave-burst PUTs of one note, --autosave-interval ms apart
+    refresh   POST /api/v2/auth/refresh, one at a time per user
+
+Latency is reported twice. "service" is measured from the moment the request
+was sent. "corrected" is measured from the moment the operation was scheduled
+to start, so time spent waiting for a free connection or for the generator
+itself counts too (coordinated omission correction). When they differ a lot,
+the target rate is above what the deployment or the client can sustain.
+"""
+import sys
+import time
+import random
+import asyncio
+import argparse
+import secrets
+import datetime
+from collections import defaultdict
+
+import httpx
+
+OPERATIONS = ('read', 'list', 'search', 'create', 'autosave', 'refresh')
+DEFAULT_MIX = 'read=60,list=10,search=5,create=5,autosave=15,refresh=5'
+WORDS = ('meeting', 'groceries', 'project', 'deadline', 'call', 'idea', 'review', 'travel', 'book', 'budget')
+# upper bounds in ms, roughly logarithmic
+HISTOGRAM_BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, float('inf'))
+
+
+class User:
+    def __init__(self, email: str, password: str):
+        self.email = email
+        self.password = password
+        self.access_token = None
+        self.refresh_token = None
+        self.note_ids = []
+        self.refresh_lock = asyncio.Lock()
+
+    @property
+    def headers(self) -> dict:
+        return {'Authorization': f"Bearer {self.access_token}"}
+
+
+class Recorder:
+    def __init__(self):
+        self.service = defaultdict(list)  # name -> seconds
+        self.corrected = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))  # name -> status -> count
+        self.errors = defaultdict(int)
+
+    def record(self, name: str, status, scheduled: float, sent: float, done: float, ok: bool):
+        self.service[name].append(done - sent)
+        self.corrected[name].append(done - scheduled)
+        self.statuses[name][status] += 1
+        if not ok:
+            self.errors[name] += 1
+
+
+def percentile(ordered: list[float], p: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000
+
+
+def print_report(recorder: Recorder, duration: float, lag: list[float]):
+    names = sorted(recorder.service)
+    total = sum(len(recorder.service[n]) for n in names)
+    errors = sum(recorder.errors.values())
+    print(f"\n{total} requests in {duration:.1f} s, {total / duration:.1f} req/s, "
+          f"errors {errors} ({errors / total * 100 if total else 0:.2f}%)")
+    if lag:
+        lag.sort()
+        print(f"generator start lag p50 {percentile(lag, 0.5):.2f} ms, p99 {percentile(lag, 0.99):.2f} ms, max {lag[-1] * 1000:.2f} ms")
+
+    header = f"{'':10} {'count':>7} {'errors':>7}   " + ' '.join(f"{p:>8}" for p in ('p50', 'p90', 'p99', 'p99.9', 'max'))
+    for kind, samples in (('service', recorder.service), ('corrected', recorder.corrected)):
+        print(f"\n{kind} latency, ms")
+        print(header)
+        for name in names + ['all']:
+            values = sorted(sum((samples[n] for n in names), []) if name == 'all' else samples[name])
+            if not values:
+                continue
+            count = len(values)
+            errors = sum(recorder.errors.values()) if name == 'all' else recorder.errors[name]
+            cells = [percentile(values, p) for p in (0.5, 0.9, 0.99, 0.999)] + [values[-1] * 1000]
+            print(f"{name:10} {count:7} {errors:7}   " + ' '.join(f"{c:8.2f}" for c in cells))
+
+    print("\ncorrected latency histogram, all requests")
+    values = sorted(sum((recorder.corrected[n] for n in names), []))
+    counts = [0] * len(HISTOGRAM_BOUNDS)
+    index = 0
+    for value in values:
+        while value * 1000 > HISTOGRAM_BOUNDS[index]:
+            index += 1
+        counts[index] += 1
+    widest = max(counts) if values else 1
+    lower = 0
+    for bound, count in zip(HISTOGRAM_BOUNDS, counts):
+        label = f"{lower:>5}-{bound:<5} ms" if bound != float('inf') else f"{lower:>5}+      ms"
+        print(f"{label} {count:8} {'#' * int(40 * count / widest)}")
+        lower = bound
+
+    print("\nstatus codes")
+    for name in names:
+        print(f"{name:10} " + ' '.join(f"{status}:{count}" for status, count in sorted(recorder.statuses[name].items(), key=str)))
+
+
+def parse_mix(value: str) -> tuple[list[str], list[float]]:
+    names, weights = [], []
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r}, expected one of {', '.join(OPERATIONS)}")
+        names.append(name)
+        weights.append(float(weight or 1))
+    return names, weights
+
+
+def make_text(rng: random.Random) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(5, 60)))
+
+
+def set_tokens(user: User, tokens: dict):
+    user.access_token = tokens['access_token']
+    user.refresh_token = tokens['refresh_token']
+
+
+class LoadGenerator:
+    def __init__(self, client: httpx.AsyncClient, args, rng: random.Random):
+        self.client = client
+        self.args = args
+        self.rng = rng
+        self.users = []
+        self.recorder = Recorder()
+        self.in_flight = asyncio.Semaphore(args.max_in_flight)
+
+    async def request(self, name: str, scheduled: float, method: str, url: str, ok=(200,), **kwargs):
+        async with self.in_flight:
+            sent = time.perf_counter()
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except httpx.HTTPError as e:
+                self.recorder.record(name, type(e).__name__, scheduled, sent, time.perf_counter(), False)
+                return None
+        done = time.perf_counter()
+        self.recorder.record(name, response.status_code, scheduled, sent, done, response.status_code in ok)
+        return response
+
+    async def setup_user(self, run_id: str, i: int):
+        user = User(f"loadgen-{run_id}-{i}@example.com", secrets.token_urlsafe(12))
+        credentials = {'email': user.email, 'password': user.password}
+        response = await self.client.post('/api/v2/auth/register', json=credentials)
+        response.raise_for_status()
+        await self.login(user)
+
+        left = self.args.notes_per_user
+        while left:
+            size = min(500, left)
+            response = await self.client.post('/api/v2/notes/batch', headers=user.headers, json=[
+                {'note_text': make_text(self.rng), 'note_date': str(datetime.date(2025, 1, 1) + datetime.timedelta(days=j % 365))}
+                for j in range(size)
+            ])
+            response.raise_for_status()
+            user.note_ids.extend(response.json()['note_ids'])
+            left -= size
+        return user
+
+    async def login(self, user: User):
+        response = await self.client.post('/api/v2/auth/login', json={'email': user.email, 'password': user.password})
+        response.raise_for_status()
+        set_tokens(user, response.json())
+
+    async def op_read(self, user: User, scheduled: float):
+        if not user.note_ids:
+            return await self.op_create(user, scheduled)
+        note_id = self.rng.choice(user.note_ids)
+        await self.request('read', scheduled, 'GET', f'/api/v2/{note_id}', headers=user.headers)
+
+    async def op_list(self, user: User, scheduled: float):
+        await self.request('list', scheduled, 'GET', '/api/v2/notes', params={'limit': 50}, headers=user.headers)
+
+    async def op_search(self, user: User, scheduled: float):
+        params = {'q': self.rng.choice(WORDS), 'limit': 20}
+        await self.request('search', scheduled, 'GET', '/api/v2/notes/search', params=params, headers=user.headers)
+
+    async def op_create(self, user: User, scheduled: float):
+        response = await self.request('create', scheduled, 'POST', '/api/v2/create', ok=(201,), headers=user.headers, json={
+            'note_text': make_text(self.rng), 'note_date': str(datetime.date.today()),
+        })
+        if response is not None and response.status_code == 201:
+            user.note_ids.append(response.json()['note_id'])
+
+    async def op_autosave(self, user: User, scheduled: float):
+        # an editor saving the same note while the user types
+        if not user.note_ids:
+            return await self.op_create(user, scheduled)
+        note_id = self.rng.choice(user.note_ids)
+        text = make_text(self.rng)
+        for i in range(self.args.autosave_burst):
+            text += ' ' + self.rng.choice(WORDS)
+            await self.request('autosave', scheduled, 'PUT', f'/api/v2/{note_id}', headers=user.headers, json={
+                'note_text': text, 'note_date': str(datetime.date.today()),
+            })
+            if i + 1 < self.args.autosave_burst:
+                await asyncio.sleep(self.args.autosave_interval / 1000)
+                scheduled = time.perf_counter()
+
+    async def op_refresh(self, user: User, scheduled: float):
+        # refresh tokens are single use, two concurrent refreshes would revoke the session
+        async with user.refresh_lock:
+            response = await self.request(
+                'refresh', scheduled, 'POST', '/api/v2/auth/refresh', json={'refresh_token': user.refresh_token},
+            )
+            if response is not None and response.status_code == 200:
+                set_tokens(user, response.json())
+            elif response is not None and response.status_code == 401:
+                # recorded like any other operation, a failed login is an error, not a lost task
+                response = await self.request(
+                    'login', time.perf_counter(), 'POST', '/api/v2/auth/login',
+                    json={'email': user.email, 'password': user.password},
+                )
+                if response is not None and response.status_code == 200:
+                    set_tokens(user, response.json())
+
+    async def run(self, names: list[str], weights: list[float]) -> tuple[float, list[float]]:
+        operations = {name: getattr(self, f'op_{name}') for name in names}
+        interval = 1 / self.args.rate
+        total = int(self.args.rate * self.args.duration)
+        tasks = set()
+        lag = []
+        start = time.perf_counter()
+        for k in range(total):
+            scheduled = start + k * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            lag.append(time.perf_counter() - scheduled)
+            name = self.rng.choices(names, weights)[0]
+            task = asyncio.create_task(operations[name](self.rng.choice(self.users), scheduled))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+        return time.perf_counter() - start, lag
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--notes-per-user', type=int, default=100)
+    parser.add_argument('--rate', type=float, default=100, help='operations started per second')
+    parser.add_argument('--duration', type=float, default=30, help='seconds')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'weighted operations, default {DEFAULT_MIX}')
+    parser.add_argument('--connections', type=int, default=100, help='HTTP connection pool size')
+    parser.add_argument('--max-in-flight', type=int, default=1000, help='requests waiting or running at once')
+    parser.add_argument('--autosave-burst', type=int, default=5)
+    parser.add_argument('--autosave-interval', type=float, default=300, help='ms between PUTs of one burst')
+    parser.add_argument('--timeout', type=float, default=30, help='seconds per request')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    try:
+        names, weights = parse_mix(args.mix)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+
+    rng = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        generator = LoadGenerator(client, args, rng)
+
+        run_id = secrets.token_hex(4)
+        start = time.perf_counter()
+        # registration and login hash passwords, keep it to a few at a time
+        semaphore = asyncio.Semaphore(8)
+
+        async def setup(i):
+            async with semaphore:
+                return await generator.setup_user(run_id, i)
+
+        try:
+            generator.users = await asyncio.gather(*(setup(i) for i in range(args.users)))
+        except httpx.HTTPError as e:
+            sys.exit(f"setup failed: {e}")
+        print(f"set up {args.users} users with {args.notes_per_user} notes each in {time.perf_counter() - start:.1f} s")
+        print(f"running {args.mix} at {args.rate:g} ops/s for {args.duration:g} s against {args.base_url}")
+
+        duration, lag = await generator.run(names, weights)
+
+    print_report(generator.recorder, duration, lag)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
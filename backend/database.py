@@ -1,15 +1,28 @@
-from sqlalchemy import select, func, delete, update
+import re
+import html
+import datetime
+from collections import namedtuple
+from sqlalchemy import select, func, delete, update, insert, tuple_, text
+from sqlalchemy import Integer, Date, Float, Text
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from models import User, Note
-from security import hash_password
+from security import hash_password_async
+from metrics import timed, db_query_duration_seconds
 
 
+class NoteVersionConflict(Exception):
+    pass
+
+
+@timed(db_query_duration_seconds)
 async def get_user_by_email(db, email: str):
     stmt = select(User).where(User.user_email == email)
     result = await db.execute(stmt)
     return result.scalar_one_or_none()
 
 
+@timed(db_query_duration_seconds)
 async def get_user_by_id(db, user_id: int):
     stmt = select(User).where(User.user_id == user_id)
     result = await db.execute(stmt)
@@ -17,33 +30,54 @@ async def get_user_by_id(db, user_id: int):
 
 
 async def create_user(db, email: str, password: str) -> User:
-    # Check if user exists by email
-    stmt = select(User).where(User.user_email == email)
-    res = await db.execute(stmt)
+    # hashing is not a query, only the insert is timed
+    return await _insert_user(db, email, await hash_password_async(password))
 
-    if res.scalar_one_or_none():
-        raise ValueError("User already exists")
 
+@timed(db_query_duration_seconds, 'create_user')
+async def _insert_user(db, email: str, password_hash: str) -> User:
     user = User(
         user_email=email,
-        user_password=hash_password(password),
+        user_password=password_hash,
     )
 
+    # Unique index on email rejects duplicates, no need to check it beforehand.
+    # Generated user_id and created_at come back with INSERT ... RETURNING
     db.add(user)
-    await db.commit()
-    await db.refresh(user)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise ValueError("User already exists")
 
     return user
 
 
-async def new_note(db, user_id: int, text: str, date: str):
+# not timed, it is a part of new_note and new_notes which are
+async def reserve_note_ids(db, user_id: int, count: int = 1) -> int:
+    # Bumps per-user counter and returns its new value, ids (value-count, value] belong to caller.
+    # Row lock on users row serializes concurrent creates until transaction ends
+    stmt = (
+        update(User)
+        .where(User.user_id == user_id)
+        .values(last_note_id=User.last_note_id + count)
+        .returning(User.last_note_id)
+        .execution_options(synchronize_session=False)
+    )
+    result = await db.execute(stmt)
+    last_id = result.scalar_one_or_none()
+
+    if last_id is None:
+        raise ValueError(f"User {user_id} does not exist")
+
+    return last_id
+
+
+@timed(db_query_duration_seconds)
+async def new_note(db, user_id: int, text: str, date: datetime.date):
     #await ensure_user(db, user_id)
 
-    # max(note_id)
-    stmt = select(func.max(Note.note_id)).where(Note.user_id == user_id)
-    result = await db.execute(stmt)
-    last_id = result.scalar() or 0
-    new_id = last_id + 1
+    new_id = await reserve_note_ids(db, user_id)
 
     note = Note(
         user_id=user_id,
@@ -57,6 +91,41 @@ async def new_note(db, user_id: int, text: str, date: str):
     return new_id
 
 
+NOTE_COPY_COLUMNS = ('user_id', 'note_id', 'note_text', 'note_date')
+
+
+async def _bulk_insert_notes(db, rows: list[tuple]):
+    # rows follow NOTE_COPY_COLUMNS
+    conn = await db.connection()
+    if conn.dialect.driver == 'asyncpg':
+        # COPY runs on the same connection, inside transaction of the session
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            Note.__tablename__,
+            records=rows,
+            columns=NOTE_COPY_COLUMNS,
+        )
+    else:
+        await db.execute(insert(Note), [dict(zip(NOTE_COPY_COLUMNS, row)) for row in rows])
+
+
+@timed(db_query_duration_seconds)
+async def new_notes(db, user_id: int, notes: list[tuple[str, datetime.date]]) -> list[int]:
+    # notes are (text, date) pairs. Ids are allocated as one contiguous range
+    last_id = await reserve_note_ids(db, user_id, len(notes))
+    first_id = last_id - len(notes) + 1
+
+    rows = [
+        (user_id, first_id + i, text, date)
+        for i, (text, date) in enumerate(notes)
+    ]
+    await _bulk_insert_notes(db, rows)
+    await db.commit()
+
+    return list(range(first_id, last_id + 1))
+
+
+@timed(db_query_duration_seconds)
 async def get_note(db, user_id: int, note_id: int):
     #await ensure_user(db, user_id)
 
@@ -72,54 +141,192 @@ async def get_note(db, user_id: int, note_id: int):
     if not note:
         raise ValueError(f"Note {note_id} does not exist for user {user_id}")
 
-    return note.note_date, note.note_text
+    return note.note_date, note.note_text, note.version
 
 
-async def delete_note(db, user_id: int, note_id: int):
-    #await ensure_user(db, user_id)
-
-    stmt_check = (
-        select(Note)
+@timed(db_query_duration_seconds)
+async def get_note_version(db, user_id: int, note_id: int) -> int:
+    # cheap check for conditional requests, note_text is not loaded
+    stmt = (
+        select(Note.version)
         .where(Note.user_id == user_id)
         .where(Note.note_id == note_id)
     )
-    res = await db.execute(stmt_check)
-    note = res.scalar_one_or_none()
+    result = await db.execute(stmt)
+    version = result.scalar_one_or_none()
 
-    if not note:
+    if version is None:
         raise ValueError(f"Note {note_id} does not exist for user {user_id}")
 
-    stmt_delete = (
-        delete(Note)
+    return version
+
+
+@timed(db_query_duration_seconds)
+async def list_notes(
+    db,
+    user_id: int,
+    limit: int,
+    order: str = 'note_id',
+    after: tuple = None,
+    date_from: datetime.date = None,
+    date_to: datetime.date = None,
+):
+    # Keyset pagination: `after` is the sort key of the last row of previous page,
+    # (note_id,) for order by id and (note_date, note_id) for order by date.
+    # Date range is inclusive, with order by date it is a range scan of ix_notes_user_id_note_date
+    stmt = select(Note.note_id, Note.note_date, Note.note_text).where(Note.user_id == user_id)
+
+    if date_from is not None:
+        stmt = stmt.where(Note.note_date >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(Note.note_date <= date_to)
+
+    if order == 'note_date':
+        if after is not None:
+            stmt = stmt.where(tuple_(Note.note_date, Note.note_id) > tuple_(*after))
+        stmt = stmt.order_by(Note.note_date, Note.note_id)
+    else:
+        if after is not None:
+            stmt = stmt.where(Note.note_id > after[0])
+        stmt = stmt.order_by(Note.note_id)
+
+    result = await db.execute(stmt.limit(limit))
+    return result.all()
+
+
+async def stream_notes(db, user_id: int, chunk_size: int = 1000):
+    # Yields lists of (note_id, note_date, note_text) rows. Server side cursor fetches
+    # chunk_size rows at a time and plain rows are not kept in session, so memory stays flat
+    stmt = (
+        select(Note.note_id, Note.note_date, Note.note_text)
         .where(Note.user_id == user_id)
-        .where(Note.note_id == note_id)
+        .order_by(Note.note_id)
+        .execution_options(yield_per=chunk_size)
     )
-    await db.execute(stmt_delete)
-    await db.commit()
+    result = await db.stream(stmt)
+    try:
+        async for rows in result.partitions():
+            yield rows
+    finally:
+        await result.close()
 
-    return True
 
-async def update_note(db, user_id: int, note_id: int, note_text: str):
+# Matched words are marked with control characters, not with html tags, so the
+# rest of the note text can be escaped before the markers become <b> and </b>
+SNIPPET_START, SNIPPET_STOP = '\x02', '\x03'
+
+SEARCH_POSTGRES = text("""
+    SELECT n.note_id, n.note_date, hits.rank,
+        ts_headline('simple', n.note_text, hits.query, :headline_options) AS snippet
+    FROM (
+        SELECT note_id, query, ts_rank(note_tsv, query) AS rank
+        FROM notes, websearch_to_tsquery('simple', :query) AS query
+        WHERE user_id = :user_id AND note_tsv @@ query
+        ORDER BY rank DESC, note_id
+        LIMIT :limit OFFSET :offset
+    ) AS hits
+    JOIN notes n ON n.user_id = :user_id AND n.note_id = hits.note_id
+    ORDER BY hits.rank DESC, n.note_id
+""").columns(note_id=Integer, note_date=Date, rank=Float, snippet=Text)
+
+SEARCH_SQLITE = text("""
+    SELECT n.note_id, n.note_date, hits.rank, hits.snippet
+    FROM (
+        SELECT rowid - :rowid_from AS note_id, -bm25(notes_fts) AS rank,
+            snippet(notes_fts, 0, :start_sel, :stop_sel, '...', 16) AS snippet
+        FROM notes_fts
+        WHERE notes_fts MATCH :query AND rowid BETWEEN :rowid_from AND :rowid_to
+        ORDER BY bm25(notes_fts), rowid
+        LIMIT :limit OFFSET :offset
+    ) AS hits
+    JOIN notes n ON n.user_id = :user_id AND n.note_id = hits.note_id
+    ORDER BY hits.rank DESC, n.note_id
+""").columns(note_id=Integer, note_date=Date, rank=Float, snippet=Text)
+
+SearchHit = namedtuple('SearchHit', ('note_id', 'note_date', 'rank', 'snippet'))
+
+
+def snippet_html(snippet: str) -> str:
+    # note text is user input, only the <b> tags around matched words are markup
+    return html.escape(snippet).replace(SNIPPET_START, '<b>').replace(SNIPPET_STOP, '</b>')
+
+
+@timed(db_query_duration_seconds)
+async def search_notes(db, user_id: int, query: str, limit: int, offset: int = 0):
+    # Returns SearchHit rows, best matches first. Snippets are escaped html
+    conn = await db.connection()
+    params = {'user_id': user_id, 'limit': limit, 'offset': offset}
+
+    if conn.dialect.name == 'postgresql':
+        result = await db.execute(SEARCH_POSTGRES, {
+            **params,
+            'query': query,
+            'headline_options': f'StartSel={SNIPPET_START}, StopSel={SNIPPET_STOP}, MaxFragments=2',
+        })
+    else:
+        # every word is quoted, so user input can not break FTS5 query syntax
+        words = re.findall(r'\w+', query)
+        if not words:
+            return []
+        rowid_from = user_id << 32
+        result = await db.execute(SEARCH_SQLITE, {
+            **params,
+            'query': ' '.join(f'"{word}"' for word in words),
+            'rowid_from': rowid_from,
+            'rowid_to': rowid_from + (1 << 32) - 1,
+            'start_sel': SNIPPET_START,
+            'stop_sel': SNIPPET_STOP,
+        })
+    return [
+        SearchHit(row.note_id, row.note_date, row.rank, snippet_html(row.snippet or ''))
+        for row in result.all()
+    ]
+
+
+@timed(db_query_duration_seconds)
+async def delete_note(db, user_id: int, note_id: int):
     #await ensure_user(db, user_id)
 
-    stmt_check = (
-        select(Note)
+    stmt_delete = (
+        delete(Note)
         .where(Note.user_id == user_id)
         .where(Note.note_id == note_id)
+        .execution_options(synchronize_session=False)
     )
-    res = await db.execute(stmt_check)
-    note = res.scalar_one_or_none()
+    result = await db.execute(stmt_delete)
 
-    if not note:
+    if result.rowcount == 0:
         raise ValueError(f"Note {note_id} does not exist for user {user_id}")
-    
+
+    await db.commit()
+
+    return True
+
+@timed(db_query_duration_seconds)
+async def update_note(db, user_id: int, note_id: int, note_text: str, expected_versions: list[int] = None) -> int:
+    #await ensure_user(db, user_id)
+
+    # optimistic concurrency: with expected_versions the row is updated only if nobody changed it
     stmt_update = (
         update(Note)
         .where(Note.user_id == user_id)
         .where(Note.note_id == note_id)
-        .values(note_text=note_text)
+        .values(note_text=note_text, version=Note.version + 1)
+        .returning(Note.version)
+        .execution_options(synchronize_session=False)
     )
-    await db.execute(stmt_update)
+    if expected_versions is not None:
+        stmt_update = stmt_update.where(Note.version.in_(expected_versions))
+    result = await db.execute(stmt_update)
+    version = result.scalar_one_or_none()
+
+    if version is None:
+        if expected_versions is not None:
+            # second query only on failure, to tell missing note from changed one
+            await get_note_version(db, user_id, note_id)
+            raise NoteVersionConflict(f"Note {note_id} was changed by another request")
+        raise ValueError(f"Note {note_id} does not exist for user {user_id}")
+
     await db.commit()
 
-    return True
+    return version
@@ -0,0 +1,282 @@
+import os
+import io
+import sys
+import asyncio
+import json
+import time
+import hashlib
+import pstats
+import logging
+import cProfile
+import secrets
+import contextvars
+from collections import Counter
+
+import greenlet
+from sqlalchemy import event
+
+# Diagnostics are recorded only when enabled here and the request has DIAGNOSTICS_HEADER
+# equal to DIAGNOSTICS_TOKEN. Without a token diagnostics stay off even if enabled
+DIAGNOSTICS_ENABLED = os.getenv('DIAGNOSTICS_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+DIAGNOSTICS_HEADER = os.getenv('DIAGNOSTICS_HEADER', 'X-Diagnostics').lower().encode()
+DIAGNOSTICS_TOKEN = os.getenv('DIAGNOSTICS_TOKEN', '')
+# 'header' returns only a summary header, 'file' also profiles the request
+# and writes full report to DIAGNOSTICS_DIR
+DIAGNOSTICS_OUTPUT = os.getenv('DIAGNOSTICS_OUTPUT', 'header').lower()
+DIAGNOSTICS_DIR = os.getenv('DIAGNOSTICS_DIR', 'diagnostics')
+DIAGNOSTICS_PROFILE_ROWS = int(os.getenv('DIAGNOSTICS_PROFILE_ROWS', '30'))
+
+SUMMARY_HEADER = b'x-diagnostics-summary'
+REPORT_HEADER = b'x-diagnostics-report'
+
+_BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+logger = logging.getLogger(__name__)
+
+current_report = contextvars.ContextVar('current_report', default=None)
+
+# cProfile can profile only one request of the event loop at a time
+_profiler_busy = False
+
+# Parameters and redis arguments hold password hashes, emails, note text and session
+# keys, so reports keep only their shape. Equal parameters get equal digests, keyed
+# per process so values can not be guessed from the report, to find duplicate statements
+_DIGEST_KEY = secrets.token_bytes(16)
+
+
+def _caller() -> str:
+    # first frame of our own modules, e.g. 'database.get_note', to see who issued a statement.
+    # Async sqlalchemy runs the driver in a child greenlet, the caller is in the parent one
+    frame = sys._getframe(1)
+    current = greenlet.getcurrent()
+    while True:
+        while frame is not None:
+            filename = frame.f_code.co_filename
+            if filename.startswith(_BACKEND_DIR) and filename != __file__:
+                module = os.path.splitext(os.path.basename(filename))[0]
+                return f"{module}.{frame.f_code.co_name}"
+            frame = frame.f_back
+        current = current.parent
+        if current is None:
+            return '?'
+        frame = current.gr_frame
+
+
+def _shape(value) -> str:
+    # type and size of a value, never the value itself
+    if isinstance(value, (list, tuple)):
+        return f"{type(value).__name__}[{len(value)}]"
+    if isinstance(value, dict):
+        return f"dict[{len(value)}]"
+    if isinstance(value, (str, bytes)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+def _params_shape(params) -> str:
+    if isinstance(params, dict):
+        return '{' + ', '.join(f"{name}: {_shape(value)}" for name, value in params.items()) + '}'
+    if isinstance(params, (list, tuple)):
+        if params and isinstance(params[0], (list, tuple, dict)):
+            # executemany, one shape for all rows
+            return f"{len(params)} x {_params_shape(params[0])}"
+        return '(' + ', '.join(_shape(value) for value in params) + ')'
+    return _shape(params)
+
+
+def _params_digest(params) -> str:
+    return hashlib.blake2b(repr(params).encode(), key=_DIGEST_KEY, digest_size=8).hexdigest()
+
+
+def _redis_arg(value) -> str:
+    # key namespace such as 'note:*', other arguments as their shape
+    if isinstance(value, bytes):
+        value = value.decode('latin-1')
+    if isinstance(value, str) and ':' in value and '\n' not in value:
+        return value.split(':', 1)[0] + ':*'
+    return _shape(value)
+
+
+class Report:
+    def __init__(self, method: str, path: str):
+        self.id = secrets.token_hex(6)
+        self.method = method
+        self.path = path
+        self.start = time.perf_counter()
+        self.duration = None
+        self.statements = []  # dicts with sql, params shape, params digest, ms, caller
+        self.redis_calls = []  # dicts with command, redacted args, ms, caller
+        self.profile = None
+
+    def add_statement(self, sql: str, params, seconds: float, caller: str):
+        self.statements.append({
+            'sql': sql,
+            'params': _params_shape(params),
+            'params_digest': _params_digest(params),
+            'ms': seconds * 1000,
+            'caller': caller,
+        })
+
+    def add_redis_call(self, args: tuple, seconds: float, caller: str):
+        self.redis_calls.append({
+            'command': str(args[0]).upper() if args else '?',
+            'args': [_redis_arg(a) for a in args[1:4]],
+            'ms': seconds * 1000,
+            'caller': caller,
+        })
+
+    def duplicates(self) -> list[dict]:
+        # same statement with same parameters more than once, the usual redundant lookup
+        counts = Counter((s['sql'], s['params_digest']) for s in self.statements)
+        found = {}
+        for s in self.statements:
+            key = (s['sql'], s['params_digest'])
+            if counts[key] > 1:
+                item = found.setdefault(key, {'sql': s['sql'], 'params': s['params'], 'count': counts[key], 'callers': []})
+                item['callers'].append(s['caller'])
+        return list(found.values())
+
+    def summary(self) -> str:
+        total = self.duration if self.duration is not None else time.perf_counter() - self.start
+        sql_ms = sum(s['ms'] for s in self.statements)
+        redis_ms = sum(r['ms'] for r in self.redis_calls)
+        kinds = Counter(s['sql'].split(None, 1)[0].upper() for s in self.statements)
+        parts = [
+            f"id={self.id}",
+            f"total_ms={total * 1000:.2f}",
+            f"sql={len(self.statements)}",
+            f"sql_ms={sql_ms:.2f}",
+            f"redis={len(self.redis_calls)}",
+            f"redis_ms={redis_ms:.2f}",
+            f"duplicate_sql={sum(d['count'] - 1 for d in self.duplicates())}",
+        ]
+        if kinds:
+            parts.append('kinds=' + ','.join(f"{kind}:{count}" for kind, count in sorted(kinds.items())))
+        return ' '.join(parts)
+
+    def as_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'method': self.method,
+            'path': self.path,
+            'summary': self.summary(),
+            'statements': self.statements,
+            'duplicates': self.duplicates(),
+            'redis_calls': self.redis_calls,
+            'profile': self.profile,
+        }
+
+
+def write_report(report: Report) -> str:
+    os.makedirs(DIAGNOSTICS_DIR, exist_ok=True)
+    path = os.path.join(DIAGNOSTICS_DIR, f"{report.id}.json")
+    with open(path, 'w') as f:
+        json.dump(report.as_dict(), f, indent=2)
+    return path
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_report.get() is not None:
+        conn.info.setdefault('diagnostics_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    report = current_report.get()
+    if report is None or not conn.info.get('diagnostics_start'):
+        return
+    elapsed = time.perf_counter() - conn.info['diagnostics_start'].pop()
+    report.add_statement(statement, parameters, elapsed, _caller())
+
+
+def instrument_engine(engine):
+    # listeners cost one contextvar lookup per statement when diagnostics are off
+    sync_engine = engine.sync_engine
+    if not event.contains(sync_engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(sync_engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(sync_engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def instrument_redis(redis_client):
+    # every command, pipelines and scripts included, goes through execute_command
+    execute_command = redis_client.execute_command
+
+    async def traced_execute_command(*args, **options):
+        report = current_report.get()
+        if report is None:
+            return await execute_command(*args, **options)
+        start = time.perf_counter()
+        try:
+            return await execute_command(*args, **options)
+        finally:
+            report.add_redis_call(args, time.perf_counter() - start, _caller())
+
+    redis_client.execute_command = traced_execute_command
+    return redis_client
+
+
+def _requested(scope) -> bool:
+    if not DIAGNOSTICS_TOKEN:
+        return False
+    for name, value in scope['headers']:
+        if name == DIAGNOSTICS_HEADER:
+            return secrets.compare_digest(value.decode('latin-1'), DIAGNOSTICS_TOKEN)
+    return False
+
+
+def _profile_text(profiler: cProfile.Profile) -> str:
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(DIAGNOSTICS_PROFILE_ROWS)
+    return out.getvalue()
+
+
+class DiagnosticsMiddleware:
+    """Records SQL statements, redis calls and a cProfile of one request.
+
+    The profile is taken only for file output and covers everything the
+    event loop runs meanwhile, other requests included.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        if DIAGNOSTICS_ENABLED and not DIAGNOSTICS_TOKEN:
+            logger.warning('DIAGNOSTICS_ENABLED is set without DIAGNOSTICS_TOKEN, diagnostics stay off')
+
+    async def __call__(self, scope, receive, send):
+        if not DIAGNOSTICS_ENABLED or scope['type'] != 'http' or not _requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        global _profiler_busy
+        report = Report(scope['method'], scope['path'])
+        token = current_report.set(report)
+        profiler = None
+        if DIAGNOSTICS_OUTPUT == 'file' and not _profiler_busy:
+            _profiler_busy = True
+            profiler = cProfile.Profile()
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                headers = list(message.get('headers', []))
+                headers.append((SUMMARY_HEADER, report.summary().encode()))
+                if DIAGNOSTICS_OUTPUT == 'file':
+                    headers.append((REPORT_HEADER, f"{report.id}.json".encode()))
+                message = {**message, 'headers': headers}
+            await send(message)
+
+        try:
+            if profiler is not None:
+                profiler.enable()
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+                    _profiler_busy = False
+        finally:
+            current_report.reset(token)
+            report.duration = time.perf_counter() - report.start
+            if DIAGNOSTICS_OUTPUT == 'file':
+                if profiler is not None:
+                    report.profile = _profile_text(profiler)
+                # file IO in a thread, the event loop keeps serving other requests
+                await asyncio.to_thread(write_report, report)
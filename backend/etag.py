@@ -0,0 +1,26 @@
+def make_etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def _split(header: str) -> list[str]:
+    return [tag.strip() for tag in header.split(',') if tag.strip()]
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    # If-None-Match uses weak comparison
+    if not if_none_match:
+        return False
+    tags = _split(if_none_match)
+    return '*' in tags or etag in [tag.removeprefix('W/') for tag in tags]
+
+
+def parse_if_match(if_match: str) -> list[int] | None:
+    # Returns accepted versions, None for "*". Weak and foreign tags never match (strong comparison)
+    tags = _split(if_match)
+    if '*' in tags:
+        return None
+    versions = []
+    for tag in tags:
+        if len(tag) > 2 and tag[0] == tag[-1] == '"' and tag[1:-1].isdigit():
+            versions.append(int(tag[1:-1]))
+    return versions
@@ -0,0 +1,51 @@
+import os
+import time
+import asyncio
+
+# load balancer probes get the cached result, so checks run at most once per
+# HEALTH_CACHE_SECONDS in every worker however often they are probed
+HEALTH_CACHE_SECONDS = float(os.getenv('HEALTH_CACHE_SECONDS', '2'))
+HEALTH_CHECK_TIMEOUT = float(os.getenv('HEALTH_CHECK_TIMEOUT', '2'))
+
+
+class HealthChecker:
+    """Readiness checks with a short cache.
+
+    Probes that come while the checks run wait for the same run.
+    """
+
+    def __init__(self, checks: dict, ttl: float = HEALTH_CACHE_SECONDS, timeout: float = HEALTH_CHECK_TIMEOUT):
+        self.checks = checks  # name -> coroutine function, raises if dependency is not available
+        self.ttl = ttl
+        self.timeout = timeout
+        self._result = None
+        self._checked_at = 0.0
+        self._running = None
+
+    async def _check(self, check) -> str:
+        try:
+            await asyncio.wait_for(check(), self.timeout)
+        except Exception as e:
+            return f"error: {type(e).__name__}"
+        return 'ok'
+
+    async def _run(self) -> dict:
+        try:
+            names = list(self.checks)
+            results = await asyncio.gather(*(self._check(self.checks[name]) for name in names))
+            self._result = {
+                'status': 'ok' if all(r == 'ok' for r in results) else 'unavailable',
+                'checks': dict(zip(names, results)),
+            }
+            self._checked_at = time.monotonic()
+            return self._result
+        finally:
+            self._running = None
+
+    async def check(self) -> dict:
+        if self._result is not None and time.monotonic() - self._checked_at < self.ttl:
+            return self._result
+        if self._running is None:
+            self._running = asyncio.ensure_future(self._run())
+        # a cancelled probe must not cancel the run other probes wait for
+        return await asyncio.shield(self._running)
@@ -1,58 +1,106 @@
-from typing import Annotated
+from typing import Annotated, Literal
 import os
-from fastapi import FastAPI, Depends, Form, HTTPException, status
+import asyncio
+import logging
+import zlib
+from datetime import date
+from fastapi import FastAPI, Depends, Form, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jwt.exceptions import InvalidTokenError
+from pydantic import Field
+import orjson
+from redis.exceptions import RedisError
+from sqlalchemy import text
 import database
-from session import engine, SessionLocal
+from session import engine, SessionLocal, pool_stats, db_settings, warm_up_pool
+from user_cache import get_cached_user, user_cache
+from pagination import encode_cursor, decode_cursor
+import note_import
+from note_cache import (
+    get_cached_note,
+    fill_note_cache,
+    invalidate_note_cache,
+    note_cache_stats,
+    NOTE_CACHE_REDIS_HOST,
+    NOTE_CACHE_REDIS_PORT,
+)
+from etag import make_etag, etag_matches, parse_if_match
+from redis_session import create_redis_client, close_redis_client
 from models import Base
-from security import verify_password, create_access_token, create_refresh_token, decode_token
+from security import (
+    verify_password_async, create_access_token, create_refresh_token, new_jti,
+    decode_token_cached, PasswordHashingBusy, hash_stats, warm_up_hashing,
+)
+from diagnostics import DiagnosticsMiddleware, instrument_engine, instrument_redis
+from metrics import registry, MetricsMiddleware, CallbackGauge, CallbackCounter, CONTENT_TYPE as METRICS_CONTENT_TYPE
 
 from schemas import (
     UserRegister, UserOut, NoteCreate, 
-    NoteUpdate, NoteOut, StatusOut, 
+    NoteUpdate, NoteOut, StatusOut, NoteBatchOut, NotePage,
+    NoteImportOut, NoteSearchPage,
     TokenResponse, LoginSchema,
     TokenRotation,
 )
-from token_rotation_logic import (
-    save_refresh_token,
-    is_refresh_token_valid,
-    delete_refresh_token,
-    update_refresh_token,
-)
-
-import redis.asyncio as redis
-
-
-app = FastAPI()
+from token_rotation_logic import ROTATION_VALID
+from token_store import create_token_store
+from rate_limit import RateLimiter, RateLimited
+from health import HealthChecker
+
+NOTE_BATCH_MAX_SIZE = int(os.getenv('NOTE_BATCH_MAX_SIZE', '500'))
+NOTE_PAGE_SIZE = int(os.getenv('NOTE_PAGE_SIZE', '50'))
+NOTE_PAGE_MAX_SIZE = int(os.getenv('NOTE_PAGE_MAX_SIZE', '500'))
+NOTE_SEARCH_MAX_OFFSET = int(os.getenv('NOTE_SEARCH_MAX_OFFSET', '1000'))
+NOTE_EXPORT_CHUNK_SIZE = int(os.getenv('NOTE_EXPORT_CHUNK_SIZE', '1000'))
+NOTE_IMPORT_CHUNK_SIZE = int(os.getenv('NOTE_IMPORT_CHUNK_SIZE', '5000'))
+NOTE_IMPORT_MAX_ERRORS = int(os.getenv('NOTE_IMPORT_MAX_ERRORS', '100'))
+
+# pydantic checks list length before validating items, so oversized batches get 422 cheaply
+NoteBatch = Annotated[list[NoteCreate], Field(min_length=1, max_length=NOTE_BATCH_MAX_SIZE)]
+
+logger = logging.getLogger(__name__)
+
+# Hot routes return ORJSONResponse themselves. Their output is built from
+# database rows in the response_model shape, so FastAPI's validation and
+# serialization of it is skipped; response_model is kept for the docs.
+# requirements.txt pins FastAPI 0.124, which encodes other responses with the
+# default class, so ORJSONResponse stays until the pin moves past its deprecation
+app = FastAPI(default_response_class=ORJSONResponse)
+app.add_middleware(DiagnosticsMiddleware)
+app.add_middleware(MetricsMiddleware)
+instrument_engine(engine)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v2/auth/login")
 
 async def get_db():
     async with SessionLocal() as db:
         yield db
 
-async def get_redis():
-    REDIS_HOST = os.getenv('REDIS_HOST')
-    REDIS_PORT = int(os.getenv('REDIS_PORT'))
-    redis_client = redis.Redis(
-        host=REDIS_HOST,
-        port=REDIS_PORT,
-        decode_responses=True,
-    )
-    try: 
-        yield redis_client
-    finally:
-        await redis_client.close()
+async def get_redis(request: Request):
+    # shared client, connections are returned to the pool after each command
+    yield request.app.state.redis
+
 
+async def get_note_cache_redis(request: Request):
+    # main client unless NOTE_CACHE_REDIS_HOST is set
+    yield request.app.state.note_cache_redis
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db = Depends(get_db)):
+
+async def get_token_store(request: Request):
+    yield request.app.state.token_store
+
+
+async def get_rate_limiter(request: Request):
+    yield request.app.state.rate_limiter
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db = Depends(get_db), redis = Depends(get_redis)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = decode_token(token)
+        payload = decode_token_cached(token)
         user_id = payload.get('sub')
         if payload.get('type') != 'access':
             raise credentials_exception
@@ -60,96 +108,199 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db = Depends(get
             raise credentials_exception
     except InvalidTokenError:
         raise credentials_exception
-    user = await database.get_user_by_id(db, int(user_id))
+    user = await get_cached_user(db, int(user_id), redis)
     if user is None:
         raise credentials_exception
     return user
         
 
+@app.exception_handler(PasswordHashingBusy)
+async def password_hashing_busy_handler(request: Request, exc: PasswordHashingBusy):
+    return ORJSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={'detail': str(exc)},
+        headers={'Retry-After': '1'},
+    )
+
+
+@app.exception_handler(RateLimited)
+async def rate_limited_handler(request: Request, exc: RateLimited):
+    return ORJSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={'detail': str(exc)},
+        headers={'Retry-After': exc.retry_after_header},
+    )
+
+
+async def warm_up_redis(redis):
+    # redis is optional for most routes, /readyz reports it if it stays down
+    try:
+        await redis.ping()
+    except RedisError as e:
+        logger.warning('redis is not available on startup: %s', e)
+
+
 @app.on_event('startup')
 async def startup():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    app.state.redis = instrument_redis(create_redis_client())
+    app.state.note_cache_redis = app.state.redis
+    if NOTE_CACHE_REDIS_HOST:
+        app.state.note_cache_redis = instrument_redis(create_redis_client(NOTE_CACHE_REDIS_HOST, NOTE_CACHE_REDIS_PORT))
+    app.state.token_store = create_token_store(app.state.redis)
+    app.state.rate_limiter = RateLimiter(app.state.redis)
+    if db_settings.create_schema:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    # the first requests should not pay for connecting and loading bcrypt
+    await asyncio.gather(
+        warm_up_pool(engine, db_settings.warm_connections),
+        warm_up_redis(app.state.redis),
+        warm_up_hashing(),
+    )
 
 
-@app.post(
-    'api/v2/auth/logout',
-    status_code=status.HTTP_204_NO_CONTENT,
-)
-async def api_logout(data:TokenRotation, redis=Depends(get_redis)):
+@app.on_event('shutdown')
+async def shutdown():
+    if app.state.note_cache_redis is not app.state.redis:
+        await close_redis_client(app.state.note_cache_redis)
+    await close_redis_client(app.state.redis)
+    await engine.dispose()
+
+
+async def check_database():
+    async with engine.connect() as conn:
+        await conn.execute(text('SELECT 1'))
+
+
+async def check_redis():
+    await app.state.redis.ping()
+
+
+health_checker = HealthChecker({'database': check_database, 'redis': check_redis})
+
+
+@app.get('/healthz', include_in_schema=False)
+async def api_healthz():
+    # liveness, the process answers. Dependencies are checked by /readyz
+    return {'status': 'ok'}
+
+
+@app.get('/readyz', include_in_schema=False)
+async def api_readyz():
+    result = await health_checker.check()
+    status_code = status.HTTP_200_OK if result['status'] == 'ok' else status.HTTP_503_SERVICE_UNAVAILABLE
+    return ORJSONResponse(result, status_code=status_code)
+
+
+# operational endpoints like /metrics and /readyz, hidden from the API schema
+# and meant to be reachable only from the internal network, not through the public proxy
+@app.get('/api/v2/stats/db-pool', include_in_schema=False)
+async def api_db_pool_stats():
+    return pool_stats.as_dict(engine.pool)
+
+
+registry.register(CallbackGauge(
+    'db_pool_checked_out', 'Database connections in use',
+    lambda: pool_stats.as_dict(engine.pool).get('checked_out', 0),
+))
+registry.register(CallbackGauge(
+    'password_hash_in_flight', 'Password hashing jobs running or queued', lambda: hash_stats.pending,
+))
+registry.register(CallbackCounter('user_cache_hits_total', 'Users found in local user cache', lambda: user_cache.hits))
+registry.register(CallbackCounter('user_cache_misses_total', 'Users not found in local user cache', lambda: user_cache.misses))
+registry.register(CallbackGauge('user_cache_size', 'Users in local user cache', lambda: len(user_cache)))
+registry.register(CallbackCounter('note_cache_hits_total', 'Notes read from redis note cache', lambda: note_cache_stats.hits))
+registry.register(CallbackCounter('note_cache_misses_total', 'Notes not found in redis note cache', lambda: note_cache_stats.misses))
+registry.register(CallbackCounter('note_cache_errors_total', 'Failed redis note cache commands', lambda: note_cache_stats.errors))
+registry.register(CallbackGauge('note_cache_hit_ratio', 'Note cache hits to lookups since start', lambda: note_cache_stats.hit_ratio))
+
+
+@app.get('/metrics', include_in_schema=False)
+async def api_metrics():
+    return Response(content=registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+def decode_refresh_token(token: str) -> tuple[int, str]:
+    # returns (user_id, jti), tokens issued before jti was added are rejected
     token_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Invalid refresh token",
     )
     try:
-        payload = decode_token(data.refresh_token)
+        payload = decode_token_cached(token)
         try:
             user_id = int(payload.get("sub"))
         except (TypeError, ValueError):
             raise token_exception
-        if payload.get('type') != 'refresh':
+        if payload.get('type') != 'refresh' or not payload.get('jti'):
             raise token_exception
     except InvalidTokenError:
         raise token_exception
+    return user_id, payload['jti']
+
+
+@app.post(
+    '/api/v2/auth/logout',
+    status_code=status.HTTP_204_NO_CONTENT,
+)
+async def api_logout(data:TokenRotation, token_store=Depends(get_token_store)):
+    _, jti = decode_refresh_token(data.refresh_token)
+    if not await token_store.delete(jti):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
 
-    if not await is_refresh_token_valid(redis, data.refresh_token):
-        raise token_exception
 
-    await delete_refresh_token(redis, data.refresh_token)
+@app.post(
+    '/api/v2/auth/logout-all',
+    status_code=status.HTTP_204_NO_CONTENT,
+)
+async def api_logout_all(user=Depends(get_current_user), token_store=Depends(get_token_store)):
+    # refresh tokens stop working at once, access tokens live until they expire
+    await token_store.revoke_user(user.user_id)
 
 
 @app.post(
     '/api/v2/auth/refresh',
     response_model=TokenResponse
 )
-async def api_refresh(data: TokenRotation, redis=Depends(get_redis)):
-    token_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Invalid refresh token",
-    )
-    try:
-        payload = decode_token(data.refresh_token)
-        try:
-            user_id = int(payload.get("sub"))
-        except (TypeError, ValueError):
-            raise token_exception
-        if payload.get('type') != 'refresh':
-            raise token_exception
-    except InvalidTokenError:
-        raise token_exception
+async def api_refresh(data: TokenRotation, token_store=Depends(get_token_store)):
+    user_id, jti = decode_refresh_token(data.refresh_token)
 
-    if not await is_refresh_token_valid(redis, data.refresh_token):
-        raise token_exception
+    next_jti = new_jti()
+    if await token_store.rotate(user_id, jti, next_jti) != ROTATION_VALID:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
 
     new_access = create_access_token(user_id)
-    new_refresh = create_refresh_token(user_id)
-
-    try:
-        await update_refresh_token(redis, data.refresh_token, new_refresh, user_id)
-    except ValueError:
-        raise token_exception
+    new_refresh = create_refresh_token(user_id, next_jti)
 
-    return {
+    return ORJSONResponse({
         'access_token': new_access,
         'refresh_token': new_refresh,
         'token_type': 'bearer',
-    }
+    })
 
 
 @app.post(
     '/api/v2/auth/login',
     response_model=TokenResponse,
 )
-async def api_login(data: LoginSchema, db=Depends(get_db), redis=Depends(get_redis)):
+async def api_login(
+    data: LoginSchema,
+    request: Request,
+    db=Depends(get_db),
+    token_store=Depends(get_token_store),
+    rate_limiter=Depends(get_rate_limiter),
+):
+    await rate_limiter.check('login', data.email, request.client.host if request.client else None)
     user = await database.get_user_by_email(db, data.email)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Incorrect email or password')
-    if not verify_password(data.password, user.user_password):
+    if not await verify_password_async(data.password, user.user_password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Incorrect email or password')
 
     new_access = create_access_token(user.user_id)
-    new_refresh = create_refresh_token(user.user_id)
-    await save_refresh_token(redis, new_refresh, user.user_id)
+    jti = new_jti()
+    new_refresh = create_refresh_token(user.user_id, jti)
+    await token_store.save(jti, user.user_id)
 
     return {
         'access_token': new_access,
@@ -162,7 +313,13 @@ async def api_login(data: LoginSchema, db=Depends(get_db), redis=Depends(get_red
     response_model=UserOut,
     status_code=status.HTTP_201_CREATED,
     )
-async def api_register(payload: UserRegister,  db=Depends(get_db)):
+async def api_register(
+    payload: UserRegister,
+    request: Request,
+    db=Depends(get_db),
+    rate_limiter=Depends(get_rate_limiter),
+):
+    await rate_limiter.check('register', payload.email, request.client.host if request.client else None)
     try:
         user = await database.create_user(db, payload.email, payload.password)
         return {
@@ -188,7 +345,7 @@ async def api_create_note_v2(payload: NoteCreate, db=Depends(get_db), user=Depen
         db,
         user_id=user_id,
         text=payload.note_text,
-        date=str(payload.note_date),
+        date=payload.note_date,
     )
 
     return {
@@ -198,53 +355,265 @@ async def api_create_note_v2(payload: NoteCreate, db=Depends(get_db), user=Depen
     }
 
 
+@app.post(
+    '/api/v2/notes/batch',
+    response_model=NoteBatchOut,
+    status_code=status.HTTP_201_CREATED,
+)
+async def api_create_notes_batch(payload: NoteBatch, db=Depends(get_db), user=Depends(get_current_user)):
+    note_ids = await database.new_notes(
+        db,
+        user_id=user.user_id,
+        notes=[(item.note_text, item.note_date) for item in payload],
+    )
+
+    return {'note_ids': note_ids}
+
+
+@app.get(
+    '/api/v2/notes',
+    response_model=NotePage,
+)
+async def api_list_notes(
+    limit: int = Query(default=NOTE_PAGE_SIZE, ge=1, le=NOTE_PAGE_MAX_SIZE),
+    order: Literal['note_id', 'note_date'] | None = None,
+    cursor: str | None = None,
+    date_from: date | None = Query(default=None, alias='from'),
+    date_to: date | None = Query(default=None, alias='to'),
+    db=Depends(get_db),
+    user=Depends(get_current_user),
+):
+    # date range is served by (user_id, note_date) index, so it is ordered by date by default
+    if order is None:
+        order = 'note_date' if date_from or date_to else 'note_id'
+
+    after = None
+    if cursor is not None:
+        try:
+            data = decode_cursor(cursor)
+            if data.get('order') != order:
+                raise ValueError('Cursor belongs to another order')
+            if order == 'note_date':
+                after = (date.fromisoformat(data['after'][0]), int(data['after'][1]))
+            else:
+                after = (int(data['after'][0]),)
+        except (ValueError, KeyError, TypeError, IndexError):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid cursor')
+
+    # one extra row tells whether there is a next page
+    rows = await database.list_notes(
+        db,
+        user.user_id,
+        limit + 1,
+        order=order,
+        after=after,
+        date_from=date_from,
+        date_to=date_to,
+    )
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        key = [last.note_date.isoformat(), last.note_id] if order == 'note_date' else [last.note_id]
+        next_cursor = encode_cursor({'order': order, 'after': key})
+
+    return ORJSONResponse({
+        'items': [
+            {
+                'note_id': row.note_id,
+                'note_text': row.note_text,
+                'note_date': row.note_date,
+            }
+            for row in rows
+        ],
+        'next_cursor': next_cursor,
+    })
+
+
+@app.get(
+    '/api/v2/notes/search',
+    response_model=NoteSearchPage,
+)
+async def api_search_notes(
+    q: str = Query(min_length=1, max_length=256),
+    limit: int = Query(default=NOTE_PAGE_SIZE, ge=1, le=NOTE_PAGE_MAX_SIZE),
+    offset: int = Query(default=0, ge=0, le=NOTE_SEARCH_MAX_OFFSET),
+    db=Depends(get_db),
+    user=Depends(get_current_user),
+):
+    rows = await database.search_notes(db, user.user_id, q, limit + 1, offset)
+
+    next_offset = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_offset = offset + limit
+
+    return ORJSONResponse({
+        'items': [
+            {
+                'note_id': row.note_id,
+                'note_date': row.note_date,
+                'snippet': row.snippet,
+                'rank': row.rank,
+            }
+            for row in rows
+        ],
+        'next_offset': next_offset,
+    })
+
+
+@app.post(
+    '/api/v2/notes/import',
+    response_model=NoteImportOut,
+)
+async def api_import_notes(request: Request, db=Depends(get_db), user=Depends(get_current_user)):
+    content_type = request.headers.get('content-type', '').split(';')[0].strip().lower()
+    lines = note_import.iter_lines(request.stream())
+
+    if content_type in note_import.NDJSON_CONTENT_TYPES:
+        rows = note_import.parse_ndjson(lines)
+    elif content_type in note_import.CSV_CONTENT_TYPES:
+        rows = note_import.parse_csv(lines)
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail='Body must be application/x-ndjson or text/csv',
+        )
+
+    # every chunk is committed separately, already imported chunks stay on error
+    try:
+        return await note_import.import_notes(
+            db,
+            user.user_id,
+            rows,
+            chunk_size=NOTE_IMPORT_CHUNK_SIZE,
+            max_errors=NOTE_IMPORT_MAX_ERRORS,
+        )
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Body must be utf-8 encoded')
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=str(e))
+
+
+@app.get(
+    '/api/v2/notes/export',
+    response_class=StreamingResponse,
+)
+async def api_export_notes(request: Request, db=Depends(get_db), user=Depends(get_current_user)):
+    use_gzip = 'gzip' in request.headers.get('accept-encoding', '')
+
+    # Starlette cancels this generator when client disconnects,
+    # stream_notes closes database cursor on the way out
+    async def ndjson_chunks():
+        compressor = zlib.compressobj(wbits=31) if use_gzip else None
+        async for rows in database.stream_notes(db, user.user_id, NOTE_EXPORT_CHUNK_SIZE):
+            chunk = b''.join(
+                orjson.dumps({
+                    'note_id': row.note_id,
+                    'note_text': row.note_text,
+                    'note_date': row.note_date,
+                }, option=orjson.OPT_APPEND_NEWLINE)
+                for row in rows
+            )
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+        if compressor is not None:
+            yield compressor.flush()
+
+    headers = {'Content-Disposition': 'attachment; filename="notes.ndjson"'}
+    if use_gzip:
+        headers['Content-Encoding'] = 'gzip'
+        headers['Vary'] = 'Accept-Encoding'
+
+    return StreamingResponse(ndjson_chunks(), media_type='application/x-ndjson', headers=headers)
+
+
 @app.get(
     '/api/v2/{note_id}',
     response_model=NoteOut,
     status_code=200
 )
-async def api_read_note_v2(note_id: int,  db=Depends(get_db), user=Depends(get_current_user)):
+async def api_read_note_v2(
+    note_id: int,
+    if_none_match: str | None = Header(default=None),
+    db=Depends(get_db),
+    user=Depends(get_current_user),
+    redis=Depends(get_note_cache_redis),
+):
     user_id = user.user_id
 
+    cached = await get_cached_note(redis, user_id, note_id)
     try:
-        note_date, note_text = await database.get_note(db, user_id, note_id)
-        return {
-            "note_id": note_id,
-            "note_text": note_text,
-            "note_date": note_date,
-        }
+        if cached is None and if_none_match:
+            # client probably has this version already, check it without loading the text
+            version = await database.get_note_version(db, user_id, note_id)
+            if etag_matches(if_none_match, make_etag(version)):
+                return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': make_etag(version)})
+
+        if cached is None:
+            cached = await database.get_note(db, user_id, note_id)
+            await fill_note_cache(redis, user_id, note_id, *cached)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
+    note_date, note_text, version = cached
+
+    etag = make_etag(version)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+    return ORJSONResponse({
+        "note_id": note_id,
+        "note_text": note_text,
+        "note_date": note_date,
+    }, headers={'ETag': etag})
+
 
 @app.put(
     '/api/v2/{note_id}',
     response_model=StatusOut,
 )
-async def api_update_note_v2(note_id: int, payload: NoteUpdate, db=Depends(get_db), user=Depends(get_current_user)):
+async def api_update_note_v2(
+    note_id: int,
+    payload: NoteUpdate,
+    if_match: str | None = Header(default=None),
+    db=Depends(get_db),
+    user=Depends(get_current_user),
+    redis=Depends(get_note_cache_redis),
+):
     user_id = user.user_id
+    expected_versions = parse_if_match(if_match) if if_match else None
 
     try:
-        result = await database.update_note(
+        version = await database.update_note(
             db,
             user_id,
             note_id,
             payload.note_text,
+            expected_versions=expected_versions,
         )
-        return {"status": result}
+        await invalidate_note_cache(redis, user_id, note_id)
+    except database.NoteVersionConflict as e:
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
+    return ORJSONResponse({"status": True}, headers={'ETag': make_etag(version)})
+
 
 @app.delete(
     '/api/v2/{note_id}',
     response_model=StatusOut,
 )
-async def api_delete_note_v2(note_id: int, db=Depends(get_db), user=Depends(get_current_user)):
+async def api_delete_note_v2(note_id: int, db=Depends(get_db), user=Depends(get_current_user), redis=Depends(get_note_cache_redis)):
     user_id = user.user_id
 
     try:
         result = await database.delete_note(db, user_id, note_id)
+        await invalidate_note_cache(redis, user_id, note_id)
         return {"status": result}
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
\ No newline at end of file
@@ -0,0 +1,207 @@
+import os
+import time
+import bisect
+import functools
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _labels(names, values, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # label values -> count
+
+    def inc(self, *labelvalues, amount: float = 1):
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def get(self, *labelvalues) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def samples(self):
+        for labelvalues, value in list(self._values.items()):
+            yield f"{self.name}{_labels(self.labelnames, labelvalues)} {_number(value)}"
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def dec(self, *labelvalues, amount: float = 1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, *labelvalues, value: float):
+        self._values[labelvalues] = value
+
+
+class CallbackGauge:
+    # value is read on scrape, for state that is already tracked elsewhere
+    type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, callback):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+
+    def samples(self):
+        yield f"{self.name} {_number(self.callback())}"
+
+
+class CallbackCounter(CallbackGauge):
+    # total counted elsewhere, e.g. cache hits
+    type = 'counter'
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket (last is +Inf), sum]. Buckets are made
+        # cumulative on render, so observe increments one counter only
+        self._values = {}
+
+    def observe(self, value: float, *labelvalues):
+        item = self._values.get(labelvalues)
+        if item is None:
+            item = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+        item[0][bisect.bisect_left(self.buckets, value)] += 1
+        item[1] += value
+
+    def count(self, *labelvalues) -> int:
+        item = self._values.get(labelvalues)
+        return sum(item[0]) if item else 0
+
+    def samples(self):
+        for labelvalues, (counts, total) in list(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labelvalues, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labelvalues)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labelvalues)} {cumulative}"
+
+
+http_requests_total = registry.register(Counter(
+    'http_requests_total', 'HTTP requests by route and status code', ('method', 'route', 'status'),
+))
+http_request_duration_seconds = registry.register(Histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route', ('method', 'route'),
+))
+http_requests_in_flight = registry.register(Gauge(
+    'http_requests_in_flight', 'HTTP requests being processed',
+))
+db_query_duration_seconds = registry.register(Histogram(
+    'db_query_duration_seconds', 'Duration of database module functions', ('function',),
+))
+redis_command_duration_seconds = registry.register(Histogram(
+    'redis_command_duration_seconds', 'Duration of token_rotation_logic redis calls', ('function',),
+))
+password_hash_duration_seconds = registry.register(Histogram(
+    'password_hash_duration_seconds', 'Duration of bcrypt hash and verify in the hash pool', ('operation',),
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0, 5.0),
+))
+throttled_requests_total = registry.register(Counter(
+    'throttled_requests_total', 'Login and register attempts rejected by rate_limit', ('action',),
+))
+
+
+def timed(histogram: Histogram, *labelvalues):
+    # decorator for coroutine functions, label defaults to the function name
+    def decorator(func):
+        labels = labelvalues or (func.__name__,)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if not METRICS_ENABLED:
+                return await func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, *labels)
+        return wrapper
+    return decorator
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, BaseHTTPMiddleware would cost more than the metrics.
+
+    Route is the path template, so note ids don't create new series.
+    Requests which matched no route are counted as 'unmatched'.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        http_requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_requests_in_flight.dec()
+            route = scope.get('route')
+            route = route.path if route is not None else 'unmatched'
+            http_request_duration_seconds.observe(elapsed, scope['method'], route)
+            http_requests_total.inc(scope['method'], route, str(status_code))
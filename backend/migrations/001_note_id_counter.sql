@@ -0,0 +1,35 @@
+-- Per-user note id counter (users.last_note_id), used by database.reserve_note_ids.
+-- Run once on existing databases before deploying the new backend version.
+-- Old backends keep inserting max(note_id)+1 until they are stopped, the trigger moves
+-- the counter past those ids so new backends never reserve one of them.
+-- Run 007_drop_note_id_counter_trigger.sql once no old backend is running.
+BEGIN;
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS last_note_id INTEGER NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION notes_sync_last_note_id() RETURNS trigger AS $$
+BEGIN
+    UPDATE users SET last_note_id = NEW.note_id
+    WHERE user_id = NEW.user_id AND last_note_id < NEW.note_id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS notes_sync_last_note_id ON notes;
+CREATE TRIGGER notes_sync_last_note_id
+    AFTER INSERT ON notes
+    FOR EACH ROW EXECUTE FUNCTION notes_sync_last_note_id();
+
+-- no new notes may appear while counters are filled
+LOCK TABLE notes IN SHARE MODE;
+
+UPDATE users u
+SET last_note_id = GREATEST(u.last_note_id, n.max_note_id)
+FROM (
+    SELECT user_id, max(note_id) AS max_note_id
+    FROM notes
+    GROUP BY user_id
+) n
+WHERE n.user_id = u.user_id;
+
+COMMIT;
@@ -0,0 +1,3 @@
+-- Index for keyset pagination of notes by date (GET /api/v2/notes?order=note_date).
+-- CONCURRENTLY does not block writes, so it must run outside of transaction.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_notes_user_id_note_date ON notes (user_id, note_date, note_id);
@@ -0,0 +1,6 @@
+-- Full text search over notes (GET /api/v2/notes/search), Postgres part of models.py DDL.
+-- Adding a stored generated column rewrites the notes table, run it in a maintenance window.
+ALTER TABLE notes ADD COLUMN IF NOT EXISTS note_tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('simple', coalesce(note_text, ''))) STORED;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_notes_note_tsv ON notes USING GIN (note_tsv);
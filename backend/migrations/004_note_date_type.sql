@@ -0,0 +1,39 @@
+-- notes.note_date: varchar 'YYYY-MM-DD' -> date.
+-- Rows are converted in batches, so the table is never locked for long and old backend
+-- can keep writing. Run with psql in autocommit mode (COMMIT inside DO needs Postgres 11+).
+ALTER TABLE notes ADD COLUMN IF NOT EXISTS note_date_new date;
+
+DO $$
+DECLARE
+    converted integer;
+BEGIN
+    LOOP
+        UPDATE notes
+        SET note_date_new = note_date::date
+        WHERE ctid IN (
+            SELECT ctid FROM notes
+            WHERE note_date_new IS NULL AND note_date IS NOT NULL
+            LIMIT 10000
+        );
+        GET DIAGNOSTICS converted = ROW_COUNT;
+        EXIT WHEN converted = 0;
+        COMMIT;
+    END LOOP;
+END $$;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_notes_user_id_note_date_new ON notes (user_id, note_date_new, note_id);
+
+-- Swap columns. Only rows written during the batches are converted under the lock
+BEGIN;
+
+LOCK TABLE notes IN ACCESS EXCLUSIVE MODE;
+
+UPDATE notes
+SET note_date_new = note_date::date
+WHERE note_date_new IS NULL AND note_date IS NOT NULL;
+
+ALTER TABLE notes DROP COLUMN note_date;
+ALTER TABLE notes RENAME COLUMN note_date_new TO note_date;
+ALTER INDEX ix_notes_user_id_note_date_new RENAME TO ix_notes_user_id_note_date;
+
+COMMIT;
@@ -0,0 +1,2 @@
+-- notes.version for ETags and If-Match updates. Constant default does not rewrite the table (Postgres 11+).
+ALTER TABLE notes ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
@@ -0,0 +1,9 @@
+-- Search GIN index scoped by user (GET /api/v2/notes/search), Postgres part of models.py DDL.
+-- With GIN (note_tsv) a common word matches every user's notes before user_id is filtered,
+-- the composite index only reads the postings of one user. btree_gin provides GIN operator
+-- classes for integer columns, creating the extension needs a role with CREATE on the database.
+CREATE EXTENSION IF NOT EXISTS btree_gin;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_notes_user_id_note_tsv ON notes USING GIN (user_id, note_tsv);
+
+DROP INDEX CONCURRENTLY IF EXISTS ix_notes_note_tsv;
@@ -0,0 +1,20 @@
+-- Second step of 001_note_id_counter.sql, run once every backend reserves note ids
+-- with the counter (no old max(note_id)+1 backend is running).
+-- Counters are reconciled once more in case notes were inserted without the trigger.
+BEGIN;
+
+DROP TRIGGER IF EXISTS notes_sync_last_note_id ON notes;
+DROP FUNCTION IF EXISTS notes_sync_last_note_id();
+
+LOCK TABLE notes IN SHARE MODE;
+
+UPDATE users u
+SET last_note_id = GREATEST(u.last_note_id, n.max_note_id)
+FROM (
+    SELECT user_id, max(note_id) AS max_note_id
+    FROM notes
+    GROUP BY user_id
+) n
+WHERE n.user_id = u.user_id;
+
+COMMIT;
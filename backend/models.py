@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Text, ForeignKey, String, DateTime, func
+from sqlalchemy import Column, Integer, Text, ForeignKey, String, Date, DateTime, Index, DDL, event, func
 from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
@@ -10,6 +10,7 @@ class User(Base):
     user_id = Column(Integer, primary_key=True)
     user_email = Column(String, nullable=False, unique=True, index=True)
     user_password = Column(String, nullable=False) # hashed password
+    last_note_id = Column(Integer, nullable=False, default=0, server_default="0") # note id counter
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 
@@ -18,7 +19,39 @@ class Note(Base):
 
     user_id = Column(Integer, ForeignKey("users.user_id"), primary_key=True)
     note_id = Column(Integer, primary_key=True)
-    note_date = Column(String)
+    note_date = Column(Date)
     note_text = Column(Text)
+    version = Column(Integer, nullable=False, default=1, server_default="1") # grows on every update, used as ETag
 
     user = relationship("User")
+
+    __table_args__ = (
+        # date ranges and keyset pagination by date, (user_id, note_id) is covered by primary key
+        Index("ix_notes_user_id_note_date", "user_id", "note_date", "note_id"),
+    )
+
+
+# Full text search over note_text, see database.search_notes.
+# Postgres: generated tsvector column, always in sync with note_text. The GIN index
+# starts with user_id (btree_gin), so a search reads only the user's postings
+for statement in (
+    "ALTER TABLE notes ADD COLUMN note_tsv tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('simple', coalesce(note_text, ''))) STORED",
+    "CREATE EXTENSION IF NOT EXISTS btree_gin",
+    "CREATE INDEX ix_notes_user_id_note_tsv ON notes USING GIN (user_id, note_tsv)",
+):
+    event.listen(Note.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+
+# SQLite: FTS5 table filled by triggers. Its rowid is (user_id << 32) + note_id,
+# so search is limited to one user by rowid range
+for statement in (
+    "CREATE VIRTUAL TABLE notes_fts USING fts5(note_text)",
+    "CREATE TRIGGER notes_fts_insert AFTER INSERT ON notes BEGIN "
+    "INSERT INTO notes_fts(rowid, note_text) VALUES ((new.user_id << 32) + new.note_id, new.note_text); END",
+    "CREATE TRIGGER notes_fts_delete AFTER DELETE ON notes BEGIN "
+    "DELETE FROM notes_fts WHERE rowid = (old.user_id << 32) + old.note_id; END",
+    "CREATE TRIGGER notes_fts_update AFTER UPDATE OF note_text ON notes BEGIN "
+    "UPDATE notes_fts SET note_text = new.note_text WHERE rowid = (old.user_id << 32) + old.note_id; END",
+):
+    event.listen(Note.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+
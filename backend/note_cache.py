@@ -0,0 +1,117 @@
+import os
+import json
+import asyncio
+import logging
+from datetime import date
+
+from redis.exceptions import RedisError
+
+NOTE_CACHE_ENABLED = os.getenv('NOTE_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+NOTE_CACHE_TTL = int(os.getenv('NOTE_CACHE_TTL', '300'))
+# bigger notes are always read from database
+NOTE_CACHE_MAX_BYTES = int(os.getenv('NOTE_CACHE_MAX_BYTES', '16384'))
+NOTE_CACHE_TOMBSTONE_TTL = int(os.getenv('NOTE_CACHE_TOMBSTONE_TTL', '10'))
+# tombstone writes after a failed one, a note that was not invalidated stays stale up to NOTE_CACHE_TTL
+NOTE_CACHE_INVALIDATE_RETRIES = int(os.getenv('NOTE_CACHE_INVALIDATE_RETRIES', '2'))
+NOTE_CACHE_INVALIDATE_BACKOFF = float(os.getenv('NOTE_CACHE_INVALIDATE_BACKOFF', '0.05'))
+# Separate redis instance with maxmemory and allkeys-lru (see docker-compose.yml), so
+# cached notes never push sessions out. Empty means the main redis, which has no memory cap
+NOTE_CACHE_REDIS_HOST = os.getenv('NOTE_CACHE_REDIS_HOST', '')
+NOTE_CACHE_REDIS_PORT = int(os.getenv('NOTE_CACHE_REDIS_PORT', '6379'))
+
+# Written on update and delete instead of plain DEL. Reads fill cache with SET NX,
+# so a read that fetched the old row before the write can not put it back
+TOMBSTONE = '-'
+
+logger = logging.getLogger(__name__)
+
+
+class NoteCacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            'enabled': NOTE_CACHE_ENABLED,
+            'hits': self.hits,
+            'misses': self.misses,
+            'errors': self.errors,
+            'hit_ratio': self.hit_ratio,
+        }
+
+
+note_cache_stats = NoteCacheStats()
+
+
+def _key(user_id: int, note_id: int) -> str:
+    return f"note:{user_id}:{note_id}"
+
+
+async def get_cached_note(redis, user_id: int, note_id: int):
+    # returns (note_date, note_text, version) or None. Redis failures are treated as a miss
+    if not NOTE_CACHE_ENABLED:
+        return None
+    try:
+        raw = await redis.get(_key(user_id, note_id))
+    except RedisError:
+        note_cache_stats.errors += 1
+        return None
+
+    if raw is None or raw == TOMBSTONE:
+        note_cache_stats.misses += 1
+        return None
+
+    try:
+        data = json.loads(raw)
+        if 'v' not in data:
+            # written before notes had versions
+            note_cache_stats.misses += 1
+            return None
+        note = date.fromisoformat(data['d']), data['t'], data['v']
+    except (ValueError, TypeError, KeyError):
+        # broken value is a miss, the note is read from database
+        note_cache_stats.errors += 1
+        note_cache_stats.misses += 1
+        return None
+
+    note_cache_stats.hits += 1
+    return note
+
+
+async def fill_note_cache(redis, user_id: int, note_id: int, note_date: date, note_text: str, version: int):
+    if not NOTE_CACHE_ENABLED:
+        return
+    raw = json.dumps({'d': note_date.isoformat(), 't': note_text, 'v': version})
+    if len(raw) > NOTE_CACHE_MAX_BYTES:
+        return
+    try:
+        await redis.set(_key(user_id, note_id), raw, ex=NOTE_CACHE_TTL, nx=True)
+    except RedisError:
+        note_cache_stats.errors += 1
+
+
+async def invalidate_note_cache(redis, user_id: int, note_id: int):
+    # must be called after note is changed or deleted in database. The change is
+    # already committed, so a failed write is retried instead of failing the request
+    if not NOTE_CACHE_ENABLED:
+        return
+    for attempt in range(NOTE_CACHE_INVALIDATE_RETRIES + 1):
+        try:
+            await redis.set(_key(user_id, note_id), TOMBSTONE, ex=NOTE_CACHE_TOMBSTONE_TTL)
+            return
+        except RedisError as e:
+            note_cache_stats.errors += 1
+            error = e
+        if attempt < NOTE_CACHE_INVALIDATE_RETRIES:
+            await asyncio.sleep(NOTE_CACHE_INVALIDATE_BACKOFF * 2 ** attempt)
+    logger.error(
+        'note cache was not invalidated, note %s of user %s may be stale for up to %s seconds: %s',
+        note_id, user_id, NOTE_CACHE_TTL, error,
+    )
@@ -0,0 +1,151 @@
+import os
+import csv
+import codecs
+import json
+
+from pydantic import ValidationError
+
+import database
+from schemas import NoteCreate
+
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/jsonl', 'application/json-lines')
+CSV_CONTENT_TYPES = ('text/csv',)
+# characters, longer lines and csv records are reported as row errors and skipped,
+# so memory per import does not depend on the body
+NOTE_IMPORT_MAX_LINE_LENGTH = int(os.getenv('NOTE_IMPORT_MAX_LINE_LENGTH', '262144'))
+
+# yielded instead of a line or row which is longer than the limit
+TOO_LONG = object()
+
+
+async def iter_lines(byte_chunks, max_length: int = NOTE_IMPORT_MAX_LINE_LENGTH):
+    # Splits request body to lines as it arrives, yields (line_number, line).
+    # A line longer than max_length is yielded as TOO_LONG once and its rest is skipped
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    tail = ''
+    skipping = False
+    line_number = 0
+
+    async for chunk in byte_chunks:
+        text = decoder.decode(chunk)
+        if skipping:
+            end = text.find('\n')
+            if end < 0:
+                continue
+            text = text[end + 1:]
+            skipping = False
+            line_number += 1
+
+        # only the new text is split, a long line is not rescanned for every chunk
+        parts = text.split('\n')
+        if len(parts) == 1:
+            tail += text
+        else:
+            lines = [tail + parts[0], *parts[1:-1]]
+            tail = parts[-1]
+            for line in lines:
+                line_number += 1
+                yield line_number, TOO_LONG if len(line) > max_length else line.rstrip('\r')
+
+        if len(tail) > max_length:
+            yield line_number + 1, TOO_LONG
+            tail = ''
+            skipping = True
+
+    tail += decoder.decode(b'', final=True)
+    if tail and not skipping:
+        yield line_number + 1, TOO_LONG if len(tail) > max_length else tail.rstrip('\r')
+
+
+async def parse_ndjson(lines):
+    async for line_number, line in lines:
+        if line is TOO_LONG:
+            yield line_number, TOO_LONG
+            continue
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError:
+            yield line_number, None
+
+
+async def parse_csv(lines, max_length: int = NOTE_IMPORT_MAX_LINE_LENGTH):
+    # First record is a header. Quoted fields may contain newlines,
+    # so a record is complete only when its quotes are balanced.
+    # A record longer than max_length is yielded as TOO_LONG, parsing resumes at the next line
+    header = None
+    record, record_start = [], None
+    length = 0
+    quotes = 0
+    async for line_number, line in lines:
+        if line is TOO_LONG or (record_start is not None and length + 1 + len(line) > max_length):
+            if header is None:
+                raise ValueError('CSV header is too long')
+            yield record_start or line_number, TOO_LONG
+            record, record_start, length, quotes = [], None, 0, 0
+            continue
+
+        if record_start is None:
+            if not line.strip():
+                continue
+            record_start = line_number
+        else:
+            length += 1
+        record.append(line)
+        length += len(line)
+        # running parity, the record is not rescanned for every line
+        quotes += line.count('"')
+        if quotes % 2:
+            continue
+
+        fields = next(csv.reader(['\n'.join(record)]))
+        if header is None:
+            header = fields
+            if not {'note_text', 'note_date'} <= set(header):
+                raise ValueError('CSV header must contain note_text and note_date columns')
+        elif len(fields) != len(header):
+            yield record_start, None
+        else:
+            yield record_start, dict(zip(header, fields))
+        record, record_start, length, quotes = [], None, 0, 0
+
+    if record_start is not None:
+        yield record_start, None
+
+
+async def import_notes(db, user_id: int, rows, chunk_size: int, max_errors: int) -> dict:
+    imported = 0
+    failed = 0
+    errors = []
+    chunk = []
+
+    async for line_number, data in rows:
+        try:
+            if data is TOO_LONG:
+                raise ValueError(f'Row is longer than {NOTE_IMPORT_MAX_LINE_LENGTH} characters')
+            if data is None:
+                raise ValueError('Malformed row')
+            note = NoteCreate.model_validate(data)
+        except (ValidationError, ValueError) as e:
+            failed += 1
+            if len(errors) < max_errors:
+                if isinstance(e, ValidationError):
+                    details = e.errors(include_url=False, include_context=False, include_input=False)
+                    message = '; '.join(f"{'.'.join(map(str, d['loc']))}: {d['msg']}" for d in details)
+                else:
+                    message = str(e)
+                errors.append({'line': line_number, 'error': message})
+            continue
+
+        chunk.append((note.note_text, note.note_date))
+        if len(chunk) >= chunk_size:
+            await database.new_notes(db, user_id, chunk)
+            imported += len(chunk)
+            chunk = []
+
+    if chunk:
+        await database.new_notes(db, user_id, chunk)
+        imported += len(chunk)
+
+    return {'imported': imported, 'failed': failed, 'errors': errors}
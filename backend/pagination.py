@@ -0,0 +1,18 @@
+import base64
+import json
+
+
+def encode_cursor(data: dict) -> str:
+    raw = json.dumps(data, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        data = json.loads(raw)
+    except ValueError:
+        raise ValueError('Invalid cursor')
+    if not isinstance(data, dict):
+        raise ValueError('Invalid cursor')
+    return data
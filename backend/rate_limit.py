@@ -0,0 +1,144 @@
+import os
+import math
+import time
+import secrets
+from collections import OrderedDict, deque
+
+from redis.exceptions import RedisError
+
+import metrics
+
+# Sliding window of attempts per action, counted separately by email and by client IP.
+# Rejected attempts are not counted, so a key never holds more than its limit
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+RATE_LIMIT_WINDOW_SECONDS = float(os.getenv('RATE_LIMIT_WINDOW_SECONDS', '60'))
+RATE_LIMIT_LOGIN_EMAIL = int(os.getenv('RATE_LIMIT_LOGIN_EMAIL', '10'))
+RATE_LIMIT_LOGIN_IP = int(os.getenv('RATE_LIMIT_LOGIN_IP', '100'))
+RATE_LIMIT_REGISTER_EMAIL = int(os.getenv('RATE_LIMIT_REGISTER_EMAIL', '5'))
+RATE_LIMIT_REGISTER_IP = int(os.getenv('RATE_LIMIT_REGISTER_IP', '20'))
+# keys kept by the in-process fallback, least recently used are dropped first
+RATE_LIMIT_MEMORY_KEYS = int(os.getenv('RATE_LIMIT_MEMORY_KEYS', '100000'))
+
+# action -> (attempts per email, attempts per IP)
+LIMITS = {
+    'login': (RATE_LIMIT_LOGIN_EMAIL, RATE_LIMIT_LOGIN_IP),
+    'register': (RATE_LIMIT_REGISTER_EMAIL, RATE_LIMIT_REGISTER_IP),
+}
+
+# KEYS: sorted sets of attempt timestamps. ARGV: now ms, window ms, member, limit per key.
+# Returns 0 and records the attempt in every key, or ms until the attempt would be allowed
+SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local retry = 0
+for i, key in ipairs(KEYS) do
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+    if redis.call('ZCARD', key) >= tonumber(ARGV[3 + i]) then
+        local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+        retry = math.max(retry, tonumber(oldest[2]) + window - now)
+    end
+end
+if retry > 0 then
+    return retry
+end
+for i, key in ipairs(KEYS) do
+    redis.call('ZADD', key, now, ARGV[3])
+    redis.call('PEXPIRE', key, window)
+end
+return 0
+"""
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__('Too many attempts, try again later')
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class MemoryWindow:
+    def __init__(self, maxkeys: int = RATE_LIMIT_MEMORY_KEYS):
+        self.maxkeys = maxkeys
+        self._attempts = OrderedDict()  # key -> deque of monotonic timestamps
+
+    def hit(self, keys: list[str], limits: list[int], window: float) -> float:
+        # same contract as SLIDING_WINDOW_SCRIPT, in seconds
+        now = time.monotonic()
+        retry = 0.0
+        for key, limit in zip(keys, limits):
+            attempts = self._attempts.get(key)
+            if attempts is None:
+                continue
+            while attempts and attempts[0] <= now - window:
+                attempts.popleft()
+            if len(attempts) >= limit:
+                retry = max(retry, attempts[0] + window - now)
+        if retry > 0:
+            return retry
+
+        for key in keys:
+            attempts = self._attempts.get(key)
+            if attempts is None:
+                attempts = self._attempts[key] = deque()
+            attempts.append(now)
+            self._attempts.move_to_end(key)
+        while len(self._attempts) > self.maxkeys:
+            self._attempts.popitem(last=False)
+        return 0.0
+
+    def clear(self):
+        self._attempts.clear()
+
+    def __len__(self):
+        return len(self._attempts)
+
+
+class RateLimiter:
+    """Counts attempts in redis, falls back to process memory when redis fails.
+
+    The fallback is per worker, so while redis is down every worker allows
+    the full limit on its own.
+    """
+
+    def __init__(self, redis=None, window: float = RATE_LIMIT_WINDOW_SECONDS, limits: dict | None = None):
+        self.redis = redis
+        self.window = window
+        self.limits = LIMITS if limits is None else limits
+        self.memory = MemoryWindow()
+        self.errors = 0
+
+    async def check(self, action: str, email: str, ip: str | None):
+        # raises RateLimited, must be called before the password is hashed or verified
+        if not RATE_LIMIT_ENABLED:
+            return
+        email_limit, ip_limit = self.limits[action]
+        # limit 0 turns the key off
+        pairs = [
+            (f"ratelimit:{action}:email:{email.strip().lower()[:320]}", email_limit),
+            (f"ratelimit:{action}:ip:{ip or 'unknown'}", ip_limit),
+        ]
+        keys = [key for key, limit in pairs if limit > 0]
+        limits = [limit for key, limit in pairs if limit > 0]
+        if not keys:
+            return
+
+        retry_after = None
+        if self.redis is not None:
+            try:
+                retry_ms = await self.redis.eval(
+                    SLIDING_WINDOW_SCRIPT, len(keys), *keys,
+                    int(time.time() * 1000), int(self.window * 1000), secrets.token_hex(8), *limits,
+                )
+                retry_after = int(retry_ms) / 1000
+            except RedisError:
+                self.errors += 1
+        if retry_after is None:
+            retry_after = self.memory.hit(keys, limits, self.window)
+
+        if retry_after > 0:
+            if metrics.METRICS_ENABLED:
+                metrics.throttled_requests_total.inc(action)
+            raise RateLimited(retry_after)
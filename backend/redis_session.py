@@ -0,0 +1,25 @@
+import os
+import redis.asyncio as redis
+
+
+def create_redis_client(host: str | None = None, port: int | None = None) -> redis.Redis:
+    # One pool for the whole application lifetime, created on startup.
+    # When all connections are busy a command waits up to REDIS_POOL_TIMEOUT
+    # seconds for a free one instead of failing with 'Too many connections'
+    pool = redis.BlockingConnectionPool(
+        host=host or os.getenv('REDIS_HOST'),
+        port=port or int(os.getenv('REDIS_PORT')),
+        decode_responses=True,
+        max_connections=int(os.getenv('REDIS_MAX_CONNECTIONS', '50')),
+        timeout=float(os.getenv('REDIS_POOL_TIMEOUT', '5')),
+        health_check_interval=int(os.getenv('REDIS_HEALTH_CHECK_INTERVAL', '30')),
+        socket_timeout=float(os.getenv('REDIS_SOCKET_TIMEOUT', '5')),
+        socket_connect_timeout=float(os.getenv('REDIS_SOCKET_CONNECT_TIMEOUT', '5')),
+        socket_keepalive=True,
+    )
+    return redis.Redis(connection_pool=pool)
+
+
+async def close_redis_client(redis_client: redis.Redis):
+    await redis_client.aclose()
+    await redis_client.connection_pool.disconnect()
@@ -32,6 +32,38 @@ class NoteOut(BaseModel):
     note_date: date
 
 
+class NotePage(BaseModel):
+    items: list[NoteOut]
+    next_cursor: str | None
+
+
+class NoteSearchHit(BaseModel):
+    note_id: int
+    note_date: date
+    snippet: str
+    rank: float
+
+
+class NoteSearchPage(BaseModel):
+    items: list[NoteSearchHit]
+    next_offset: int | None
+
+
+class NoteBatchOut(BaseModel):
+    note_ids: list[int]
+
+
+class NoteImportError(BaseModel):
+    line: int
+    error: str
+
+
+class NoteImportOut(BaseModel):
+    imported: int
+    failed: int
+    errors: list[NoteImportError]
+
+
 class StatusOut(BaseModel):
     status: bool
 
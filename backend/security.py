@@ -1,7 +1,15 @@
 import os
+import asyncio
+import hashlib
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 import jwt
 from passlib.context import CryptContext
+from cache import TTLCache
+import metrics
+from metrics import password_hash_duration_seconds
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 SECRET_KEY = os.getenv("SECRET_KEY")
@@ -9,6 +17,52 @@ ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
 REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS"))
 
+# bcrypt releases the GIL, so a small thread pool is enough to keep it off the event loop
+HASH_POOL_SIZE = int(os.getenv("HASH_POOL_SIZE", "4"))
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", "64"))
+
+# verified payloads, keyed by sha256 of the token, every entry lives until token's exp
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+token_cache = TTLCache(
+    maxsize=TOKEN_CACHE_SIZE,
+    ttl=max(ACCESS_TOKEN_EXPIRE_MINUTES * 60, REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60 * 60),
+)
+
+_hash_executor = ThreadPoolExecutor(max_workers=HASH_POOL_SIZE, thread_name_prefix="bcrypt")
+
+
+class PasswordHashingBusy(Exception):
+    pass
+
+
+class HashPoolStats:
+    def __init__(self):
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self.pending - HASH_POOL_SIZE)
+
+    def as_dict(self) -> dict:
+        return {
+            'pool_size': HASH_POOL_SIZE,
+            'queue_limit': HASH_QUEUE_LIMIT,
+            'in_flight': self.pending,
+            'queue_depth': self.queue_depth,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'total_seconds': self.total_seconds,
+            'max_seconds': self.max_seconds,
+        }
+
+
+hash_stats = HashPoolStats()
+
+
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
 
@@ -17,6 +71,47 @@ def verify_password(password: str, hashed: str) -> bool:
     return pwd_context.verify(password, hashed)
 
 
+def _timed_call(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+async def _run_in_hash_pool(func, *args):
+    if hash_stats.pending >= HASH_POOL_SIZE + HASH_QUEUE_LIMIT:
+        hash_stats.rejected += 1
+        raise PasswordHashingBusy("Too many password hashing requests, try again later")
+
+    hash_stats.pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        result, elapsed = await loop.run_in_executor(_hash_executor, _timed_call, func, *args)
+    finally:
+        hash_stats.pending -= 1
+
+    hash_stats.completed += 1
+    hash_stats.total_seconds += elapsed
+    hash_stats.max_seconds = max(hash_stats.max_seconds, elapsed)
+    if metrics.METRICS_ENABLED:
+        password_hash_duration_seconds.observe(elapsed, 'verify' if func is verify_password else 'hash')
+    return result
+
+
+async def warm_up_hashing():
+    # first call loads bcrypt backend and runs passlib self tests, about 40 ms on top of the hash.
+    # Not counted in hash_stats and metrics
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(_hash_executor, hash_password, secrets.token_hex(8))
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run_in_hash_pool(hash_password, password)
+
+
+async def verify_password_async(password: str, hashed: str) -> bool:
+    return await _run_in_hash_pool(verify_password, password, hashed)
+
+
 def create_access_token(user_id: int) -> str:
     payload = {
         'sub': str(user_id),
@@ -26,14 +121,33 @@ def create_access_token(user_id: int) -> str:
     return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
 
 
-def create_refresh_token(user_id: int) -> str:
+def new_jti() -> str:
+    # 96 random bits, 16 characters
+    return secrets.token_urlsafe(12)
+
+
+def create_refresh_token(user_id: int, jti: str | None = None) -> str:
     payload = {
         'sub': str(user_id),
         'exp': datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
         'type': 'refresh',
+        'jti': jti or new_jti(),
     }
     return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
 
 
 def decode_token(token: str) -> dict:
     return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+
+def decode_token_cached(token: str) -> dict:
+    key = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(key)
+    if payload is not None:
+        return payload
+
+    payload = decode_token(token)
+    exp = payload.get('exp')
+    if exp is not None:
+        token_cache.set(key, payload, ttl=exp - time.time())
+    return payload
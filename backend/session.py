@@ -1,8 +1,90 @@
-import os
+import time
+import asyncio
+
+from sqlalchemy import exc, text
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from settings import DatabaseSettings
+
+
+class PoolStats:
+    def __init__(self):
+        self.acquired = 0
+        self.timeouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def record(self, seconds: float, timed_out: bool = False):
+        if timed_out:
+            self.timeouts += 1
+        else:
+            self.acquired += 1
+        self.total_wait_seconds += seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def as_dict(self, pool) -> dict:
+        data = {
+            'pool': type(pool).__name__,
+            'acquired': self.acquired,
+            'timeouts': self.timeouts,
+            'total_wait_seconds': self.total_wait_seconds,
+            'max_wait_seconds': self.max_wait_seconds,
+        }
+        if isinstance(pool, AsyncAdaptedQueuePool):
+            data.update(
+                size=pool.size(),
+                checked_in=pool.checkedin(),
+                checked_out=pool.checkedout(),
+                overflow=max(0, pool.overflow()),
+                max_overflow=pool._max_overflow,
+            )
+        return data
+
+
+pool_stats = PoolStats()
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    # measures how long checkout waits for a free connection, including opening a new one
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_stats.record(time.perf_counter() - start, timed_out=True)
+            raise
+        pool_stats.record(time.perf_counter() - start)
+        return connection
+
+
+async def warm_up_pool(engine, connections: int) -> int:
+    # opens connections at the same time, so they are different ones, and returns them to the pool.
+    # Returns how many were opened
+    pool = engine.pool
+    connections = min(connections, pool.size()) if isinstance(pool, AsyncAdaptedQueuePool) else min(connections, 1)
+    if connections <= 0:
+        return 0
+    opened = await asyncio.gather(*(engine.connect().start() for _ in range(connections)), return_exceptions=True)
+    try:
+        for conn in opened:
+            if isinstance(conn, BaseException):
+                raise conn
+        await asyncio.gather(*(conn.execute(text('SELECT 1')) for conn in opened))
+    finally:
+        await asyncio.gather(*(conn.close() for conn in opened if not isinstance(conn, BaseException)))
+    return connections
+
+
+def create_engine(settings: DatabaseSettings):
+    kwargs = settings.engine_kwargs()
+    if 'pool_size' in kwargs:
+        kwargs['poolclass'] = TimedQueuePool
+    return create_async_engine(settings.url, **kwargs)
+
 
-DATABASE_URL = os.getenv("DATABASE_URL")
+db_settings = DatabaseSettings()
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+engine = create_engine(db_settings)
 
 SessionLocal = async_sessionmaker(engine, expire_on_commit=False)
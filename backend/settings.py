@@ -0,0 +1,53 @@
+from pydantic import Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class DatabaseSettings(BaseSettings):
+    """Engine and connection pool options, read from DB_* env variables."""
+
+    model_config = SettingsConfigDict(env_prefix='DB_', extra='ignore')
+
+    url: str = Field(validation_alias='DATABASE_URL')
+    # logs every statement synchronously, only for debugging
+    echo: bool = False
+    pool_size: int = Field(5, ge=1)
+    max_overflow: int = Field(10, ge=0)
+    # seconds to wait for a free connection before TimeoutError
+    pool_timeout: float = Field(30, gt=0)
+    # seconds, connections older than this are reopened. -1 disables
+    pool_recycle: int = 1800
+    pool_pre_ping: bool = True
+    # prepared statements cached per asyncpg connection. 0 for pgbouncer in transaction mode
+    statement_cache_size: int = Field(100, ge=0)
+    # connections opened on startup, at most pool_size
+    warm_connections: int = Field(5, ge=0)
+    # run Base.metadata.create_all on startup. Changes of existing tables are in migrations/
+    create_schema: bool = False
+
+    @property
+    def is_sqlite(self) -> bool:
+        return self.url.startswith('sqlite')
+
+    @property
+    def is_asyncpg(self) -> bool:
+        return self.url.startswith('postgresql+asyncpg')
+
+    def engine_kwargs(self) -> dict:
+        kwargs = {'echo': self.echo}
+        if self.is_asyncpg:
+            # sqlalchemy keeps its own cache on top of asyncpg's one
+            kwargs['connect_args'] = {
+                'prepared_statement_cache_size': self.statement_cache_size,
+                'statement_cache_size': self.statement_cache_size,
+            }
+        if self.is_sqlite and ':memory:' in self.url:
+            # in-memory sqlite uses one static connection, there is no pool to size
+            return kwargs
+        kwargs.update(
+            pool_size=self.pool_size,
+            max_overflow=self.max_overflow,
+            pool_timeout=self.pool_timeout,
+            pool_recycle=self.pool_recycle,
+            pool_pre_ping=self.pool_pre_ping,
+        )
+        return kwargs
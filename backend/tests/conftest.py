@@ -1,7 +1,124 @@
 import sys
 import os
+import time
+
+import pytest
+from redis.exceptions import ConnectionError
 
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
 
 if PROJECT_ROOT not in sys.path:
-    sys.path.insert(0, PROJECT_ROOT)
\ No newline at end of file
+    sys.path.insert(0, PROJECT_ROOT)
+
+from token_rotation_logic import (
+    SAVE_REFRESH_TOKEN_SCRIPT,
+    ROTATE_REFRESH_TOKEN_SCRIPT,
+    ROTATION_VALID,
+    ROTATION_INVALID,
+    ROTATION_REUSED,
+)
+
+
+class FakeRedis:
+    """Redis client double shared by unit and integration tests.
+
+    Keys never expire, TTLs are only recorded (in milliseconds) so tests can check them.
+    eval emulates the token_rotation_logic scripts without awaits, so it is atomic as well.
+    """
+
+    def __init__(self):
+        self.storage = {}
+        self.ttls = {}
+
+    async def get(self, key):
+        return self.storage.get(key)
+
+    async def set(self, key, value, ex=None, px=None, nx=False):
+        if nx and key in self.storage:
+            return None
+        self.storage[key] = value
+        self.ttls.pop(key, None)
+        if ex is not None:
+            self.ttls[key] = ex * 1000
+        if px is not None:
+            self.ttls[key] = px
+        return True
+
+    async def delete(self, *keys):
+        deleted = 0
+        for key in keys:
+            if self.storage.pop(key, None) is not None:
+                deleted += 1
+            self.ttls.pop(key, None)
+        return deleted
+
+    async def incr(self, key):
+        self.storage[key] = str(int(self.storage.get(key, 0)) + 1)
+        return int(self.storage[key])
+
+    async def eval(self, script, numkeys, *keys_and_args):
+        keys, args = keys_and_args[:numkeys], keys_and_args[numkeys:]
+        if script == SAVE_REFRESH_TOKEN_SCRIPT:
+            session, generation = keys
+            self.storage[session] = self.storage.get(generation, '0')
+            self.ttls[session] = int(args[0]) * 1000
+            return None
+
+        assert script == ROTATE_REFRESH_TOKEN_SCRIPT
+        old, new, marker, generation = keys
+        window = int(args[0])
+        if old in self.storage:
+            ttl = self.ttls.pop(old, None)
+            session_generation = self.storage.pop(old)
+            if session_generation != self.storage.get(generation, '0'):
+                return ROTATION_INVALID
+            self.storage[new] = session_generation
+            self.storage[marker] = session_generation
+            self.ttls[new] = ttl
+            self.ttls[marker] = min(ttl, window)
+            return ROTATION_VALID
+        if marker in self.storage:
+            del self.storage[marker]
+            self.ttls.pop(marker, None)
+            self.storage[generation] = str(int(self.storage.get(generation, 0)) + 1)
+            return ROTATION_REUSED
+        return ROTATION_INVALID
+
+
+class BrokenRedis:
+    """Every command fails like a lost connection."""
+
+    async def get(self, key):
+        raise ConnectionError()
+
+    async def set(self, key, value, ex=None, px=None, nx=False):
+        raise ConnectionError()
+
+    async def delete(self, *keys):
+        raise ConnectionError()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def fake_redis():
+    return FakeRedis()
+
+
+@pytest.fixture
+def broken_redis():
+    return BrokenRedis()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # modules call time.monotonic() through the time module, so one patch covers all of them
+    fake_clock = FakeClock()
+    monkeypatch.setattr(time, 'monotonic', fake_clock)
+    return fake_clock
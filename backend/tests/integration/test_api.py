@@ -1,4 +1,7 @@
+import os
 import pytest
+import json
+import jwt
 from fastapi.testclient import TestClient
 from sqlalchemy.ext.asyncio import (
     create_async_engine,
@@ -6,51 +9,60 @@ from sqlalchemy.ext.asyncio import (
     AsyncSession,
 )
 
-from main import app, get_db, get_redis
+import main
+import diagnostics
+from main import app, get_db, get_redis, get_note_cache_redis, get_token_store, get_rate_limiter
 from models import Base
+from user_cache import user_cache
+from note_cache import note_cache_stats
+from security import create_refresh_token, decode_token
+from token_store import MemoryTokenStore
+from schemas import NoteOut, NotePage, NoteSearchPage, StatusOut
+from rate_limit import RateLimiter
+from health import HealthChecker
 
 
-class FakeRedis:
-    def __init__(self):
-        self.storage = {}
-        self.ttls = {}
-
-    async def set(self, key, value, ex=None):
-        self.storage[key] = value
-        if ex is not None:
-            self.ttls[key] = ex
-
-    async def exists(self, key):
-        return 1 if key in self.storage else 0
-
-    async def delete(self, key):
-        self.storage.pop(key, None)
-        self.ttls.pop(key, None)
-    
-    async def ttl(self, key):
-        if key not in self.storage:
-            return -2
-        return self.ttls.get(key, -1)
+DATABASE_URL = "sqlite+aiosqlite:///:memory:"
 
 
-DATABASE_URL = "sqlite+aiosqlite:///:memory:"
+@pytest.fixture
+def token_store():
+    return MemoryTokenStore()
 
 
 @pytest.fixture
-def fake_redis():
-    return FakeRedis()
+def rate_limiter():
+    # in-process counters, fresh for every test
+    return RateLimiter()
 
 
 @pytest.fixture(autouse=True)
-def override_redis(fake_redis):
+def override_redis(fake_redis, token_store, rate_limiter):
     async def _get_redis():
         yield fake_redis
 
+    async def _get_token_store():
+        yield token_store
+
+    async def _get_rate_limiter():
+        yield rate_limiter
+
     app.dependency_overrides[get_redis] = _get_redis
+    app.dependency_overrides[get_note_cache_redis] = _get_redis
+    app.dependency_overrides[get_token_store] = _get_token_store
+    app.dependency_overrides[get_rate_limiter] = _get_rate_limiter
     yield
     app.dependency_overrides.clear()
 
 
+@pytest.fixture(autouse=True)
+def clear_user_cache():
+    # every test rolls back its users, so cached ids must not leak between tests
+    user_cache.clear()
+    yield
+    user_cache.clear()
+
+
 @pytest.fixture(scope="module")
 async def async_engine():
     engine = create_async_engine(DATABASE_URL)
@@ -71,8 +83,10 @@ async def db_session_rollback(async_engine):
             )
             async with async_session() as session:
                 yield session
-                
-            await transaction.rollback()
+
+            # tested code may already have rolled it back
+            if transaction.is_active:
+                await transaction.rollback()
 
 @pytest.fixture
 async def override_get_db(db_session_rollback):
@@ -201,6 +215,35 @@ def test_login_invalid_email(client):
     assert response.status_code == 401
 
 
+def test_login_throttled_by_email(client, registered_user, rate_limiter, monkeypatch):
+    rate_limiter.limits = {'login': (2, 100)}
+    credentials = {'email': registered_user['email'], 'password': 'another_password'}
+    for _ in range(2):
+        assert client.post('/api/v2/auth/login', json=credentials).status_code == 401
+
+    async def fail_verify(*args):
+        raise AssertionError('password verified for a throttled attempt')
+
+    monkeypatch.setattr(main, 'verify_password_async', fail_verify)
+    # right password is rejected too, and the email is matched case insensitively
+    response = client.post('/api/v2/auth/login', json={
+        'email': registered_user['email'].upper(), 'password': registered_user['password'],
+    })
+    assert response.status_code == 429
+    assert 1 <= int(response.headers['Retry-After']) <= 60
+
+
+def test_register_throttled_by_ip(client, rate_limiter):
+    rate_limiter.limits = {'register': (5, 2)}
+    for i in range(2):
+        response = client.post('/api/v2/auth/register', json={'email': f'user{i}@sample.com', 'password': 'sample_password'})
+        assert response.status_code == 201
+
+    response = client.post('/api/v2/auth/register', json={'email': 'user2@sample.com', 'password': 'sample_password'})
+    assert response.status_code == 429
+    assert 'Retry-After' in response.headers
+
+
 def test_create_note_success(client, logged_in_user_data):
     response = client.post(
         '/api/v2/create',
@@ -226,6 +269,271 @@ def test_create_note_unauthorized(client):
     assert response.status_code == 401
 
 
+def test_create_notes_batch(client, note_fixture):
+    response = client.post(
+        '/api/v2/notes/batch',
+        headers=note_fixture['auth_header'],
+        json=[
+            {'note_text': 'second', 'note_date': '2025-12-18'},
+            {'note_text': 'third', 'note_date': '2025-12-19'},
+        ]
+    )
+    assert response.status_code == 201
+    note_ids = response.json()['note_ids']
+    assert note_ids == [note_fixture['note_id'] + 1, note_fixture['note_id'] + 2]
+
+    response = client.get(f'/api/v2/{note_ids[1]}', headers=note_fixture['auth_header'])
+    assert response.json()['note_text'] == 'third'
+
+def test_create_notes_batch_item_errors(client, logged_in_user_data):
+    response = client.post(
+        '/api/v2/notes/batch',
+        headers=logged_in_user_data['auth_header'],
+        json=[
+            {'note_text': 'ok', 'note_date': '2025-12-18'},
+            {'note_text': 'bad date', 'note_date': 'yesterday'},
+        ]
+    )
+    assert response.status_code == 422
+    locations = [error['loc'] for error in response.json()['detail']]
+    assert locations == [['body', 1, 'note_date']]
+
+def test_create_notes_batch_too_large(client, logged_in_user_data):
+    response = client.post(
+        '/api/v2/notes/batch',
+        headers=logged_in_user_data['auth_header'],
+        json=[{'note_text': 'note', 'note_date': '2025-12-18'}] * (main.NOTE_BATCH_MAX_SIZE + 1)
+    )
+    assert response.status_code == 422
+    assert response.json()['detail'][0]['type'] == 'too_long'
+
+def test_create_notes_batch_empty(client, logged_in_user_data):
+    response = client.post(
+        '/api/v2/notes/batch',
+        headers=logged_in_user_data['auth_header'],
+        json=[]
+    )
+    assert response.status_code == 422
+
+
+def test_list_notes_pages(client, logged_in_user_data):
+    client.post(
+        '/api/v2/notes/batch',
+        headers=logged_in_user_data['auth_header'],
+        json=[{'note_text': f'note {i}', 'note_date': '2025-12-18'} for i in range(5)]
+    )
+
+    seen = []
+    cursor = None
+    while True:
+        params = {'limit': 2}
+        if cursor:
+            params['cursor'] = cursor
+        response = client.get('/api/v2/notes', headers=logged_in_user_data['auth_header'], params=params)
+        assert response.status_code == 200
+        page = response.json()
+        seen.extend(note['note_id'] for note in page['items'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+
+    assert seen == [1, 2, 3, 4, 5]
+
+def test_list_notes_by_date(client, logged_in_user_data):
+    client.post(
+        '/api/v2/notes/batch',
+        headers=logged_in_user_data['auth_header'],
+        json=[
+            {'note_text': 'late', 'note_date': '2025-12-20'},
+            {'note_text': 'early', 'note_date': '2025-12-01'},
+        ]
+    )
+    response = client.get(
+        '/api/v2/notes',
+        headers=logged_in_user_data['auth_header'],
+        params={'order': 'note_date'},
+    )
+    assert [note['note_text'] for note in response.json()['items']] == ['early', 'late']
+    assert response.json()['next_cursor'] is None
+
+def test_list_notes_date_range(client, logged_in_user_data):
+    client.post(
+        '/api/v2/notes/batch',
+        headers=logged_in_user_data['auth_header'],
+        json=[{'note_text': f'day {day}', 'note_date': f'2025-12-{day:02d}'} for day in (25, 3, 12, 18, 9)]
+    )
+
+    seen = []
+    params = {'from': '2025-12-05', 'to': '2025-12-20', 'limit': 2}
+    while True:
+        response = client.get('/api/v2/notes', headers=logged_in_user_data['auth_header'], params=params)
+        assert response.status_code == 200
+        page = response.json()
+        seen.extend(note['note_date'] for note in page['items'])
+        if page['next_cursor'] is None:
+            break
+        params['cursor'] = page['next_cursor']
+
+    assert seen == ['2025-12-09', '2025-12-12', '2025-12-18']
+
+def test_list_notes_invalid_date(client, logged_in_user_data):
+    response = client.get(
+        '/api/v2/notes',
+        headers=logged_in_user_data['auth_header'],
+        params={'from': 'last week'},
+    )
+    assert response.status_code == 422
+
+def test_list_notes_invalid_cursor(client, logged_in_user_data):
+    response = client.get(
+        '/api/v2/notes',
+        headers=logged_in_user_data['auth_header'],
+        params={'cursor': 'garbage'},
+    )
+    assert response.status_code == 400
+
+def test_list_notes_unauthorized(client):
+    response = client.get('/api/v2/notes')
+    assert response.status_code == 401
+
+
+def test_export_notes(client, note_fixture):
+    client.post(
+        '/api/v2/notes/batch',
+        headers=note_fixture['auth_header'],
+        json=[{'note_text': 'second', 'note_date': '2025-12-18'}]
+    )
+    response = client.get(
+        '/api/v2/notes/export',
+        headers={**note_fixture['auth_header'], 'Accept-Encoding': 'identity'},
+    )
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    assert 'content-encoding' not in response.headers
+
+    notes = [json.loads(line) for line in response.text.splitlines()]
+    assert notes == [
+        {'note_id': 1, 'note_text': 'First Note', 'note_date': '2025-12-17'},
+        {'note_id': 2, 'note_text': 'second', 'note_date': '2025-12-18'},
+    ]
+
+def test_export_notes_gzip(client, note_fixture):
+    response = client.get(
+        '/api/v2/notes/export',
+        headers={**note_fixture['auth_header'], 'Accept-Encoding': 'gzip'},
+    )
+    assert response.status_code == 200
+    assert response.headers['content-encoding'] == 'gzip'
+    # httpx decompresses body
+    assert json.loads(response.text)['note_text'] == note_fixture['note_text']
+
+def test_trusted_responses_match_response_models(client, note_fixture):
+    # hot routes skip response_model validation, their output must still follow it
+    headers = note_fixture['auth_header']
+    note_id = note_fixture['note_id']
+    for path, params, model in (
+        (f'/api/v2/{note_id}', None, NoteOut),
+        ('/api/v2/notes', {'limit': 1}, NotePage),
+        ('/api/v2/notes/search', {'q': 'first'}, NoteSearchPage),
+    ):
+        response = client.get(path, headers=headers, params=params)
+        assert response.status_code == 200
+        assert response.headers['content-type'] == 'application/json'
+        assert model.model_validate_json(response.content).model_dump(mode='json') == response.json()
+
+    response = client.put(f'/api/v2/{note_id}', headers=headers, json={'note_text': 'edited'})
+    assert StatusOut.model_validate_json(response.content).status is True
+    assert response.headers['ETag']
+
+
+def test_export_notes_unauthorized(client):
+    response = client.get('/api/v2/notes/export')
+    assert response.status_code == 401
+
+
+def test_search_notes(client, logged_in_user_data):
+    client.post(
+        '/api/v2/notes/batch',
+        headers=logged_in_user_data['auth_header'],
+        json=[
+            {'note_text': 'meeting with the team', 'note_date': '2025-12-16'},
+            {'note_text': 'dentist', 'note_date': '2025-12-17'},
+            {'note_text': 'team lunch', 'note_date': '2025-12-18'},
+        ]
+    )
+    response = client.get(
+        '/api/v2/notes/search',
+        headers=logged_in_user_data['auth_header'],
+        params={'q': 'team', 'limit': 1},
+    )
+    assert response.status_code == 200
+    page = response.json()
+    assert len(page['items']) == 1
+    assert '<b>team</b>' in page['items'][0]['snippet']
+    assert page['next_offset'] == 1
+
+    response = client.get(
+        '/api/v2/notes/search',
+        headers=logged_in_user_data['auth_header'],
+        params={'q': 'team', 'limit': 1, 'offset': 1},
+    )
+    assert response.json()['next_offset'] is None
+
+def test_search_notes_empty_query(client, logged_in_user_data):
+    response = client.get(
+        '/api/v2/notes/search',
+        headers=logged_in_user_data['auth_header'],
+        params={'q': ''},
+    )
+    assert response.status_code == 422
+
+
+def test_import_notes_ndjson(client, logged_in_user_data):
+    body = '\n'.join([
+        json.dumps({'note_text': 'one', 'note_date': '2025-12-16'}),
+        json.dumps({'note_text': 'two', 'note_date': 'not a date'}),
+        json.dumps({'note_text': 'three', 'note_date': '2025-12-18'}),
+    ])
+    response = client.post(
+        '/api/v2/notes/import',
+        headers={**logged_in_user_data['auth_header'], 'Content-Type': 'application/x-ndjson'},
+        content=body,
+    )
+    assert response.status_code == 200
+    result = response.json()
+    assert result['imported'] == 2
+    assert result['failed'] == 1
+    assert result['errors'][0]['line'] == 2
+
+    response = client.get('/api/v2/notes', headers=logged_in_user_data['auth_header'])
+    assert [note['note_text'] for note in response.json()['items']] == ['one', 'three']
+
+def test_import_notes_csv(client, logged_in_user_data):
+    response = client.post(
+        '/api/v2/notes/import',
+        headers={**logged_in_user_data['auth_header'], 'Content-Type': 'text/csv'},
+        content='note_text,note_date\nfrom csv,2025-12-16\n',
+    )
+    assert response.status_code == 200
+    assert response.json() == {'imported': 1, 'failed': 0, 'errors': []}
+
+def test_import_notes_unsupported_type(client, logged_in_user_data):
+    response = client.post(
+        '/api/v2/notes/import',
+        headers={**logged_in_user_data['auth_header'], 'Content-Type': 'application/xml'},
+        content='<notes/>',
+    )
+    assert response.status_code == 415
+
+def test_import_notes_bad_csv_header(client, logged_in_user_data):
+    response = client.post(
+        '/api/v2/notes/import',
+        headers={**logged_in_user_data['auth_header'], 'Content-Type': 'text/csv'},
+        content='a,b\n1,2\n',
+    )
+    assert response.status_code == 422
+
+
 def test_get_note(client, note_fixture):
     response = client.get(
         f'/api/v2/{note_fixture["note_id"]}',
@@ -248,6 +556,87 @@ def test_get_note_unauthorized(client, note_fixture):
     assert response.status_code == 401
 
 
+def test_get_note_from_cache(client, fake_redis, note_fixture):
+    hits = note_cache_stats.hits
+    for _ in range(2):
+        response = client.get(f'/api/v2/{note_fixture["note_id"]}', headers=note_fixture['auth_header'])
+        assert response.status_code == 200
+        assert response.json()['note_date'] == note_fixture['note_date']
+
+    assert f'note:{note_fixture["user_id"]}:{note_fixture["note_id"]}' in fake_redis.storage
+    assert note_cache_stats.hits == hits + 1
+
+def test_update_note_invalidates_cache(client, note_fixture):
+    url = f'/api/v2/{note_fixture["note_id"]}'
+    client.get(url, headers=note_fixture['auth_header'])
+    client.put(url, headers=note_fixture['auth_header'], json={'note_text': 'new note text'})
+
+    for _ in range(2):
+        response = client.get(url, headers=note_fixture['auth_header'])
+        assert response.json()['note_text'] == 'new note text'
+
+def test_delete_note_invalidates_cache(client, note_fixture):
+    url = f'/api/v2/{note_fixture["note_id"]}'
+    client.get(url, headers=note_fixture['auth_header'])
+    client.delete(url, headers=note_fixture['auth_header'])
+
+    response = client.get(url, headers=note_fixture['auth_header'])
+    assert response.status_code == 404
+
+
+def test_get_note_etag(client, note_fixture):
+    url = f'/api/v2/{note_fixture["note_id"]}'
+    response = client.get(url, headers=note_fixture['auth_header'])
+    etag = response.headers['etag']
+    assert etag == '"1"'
+
+    response = client.get(url, headers={**note_fixture['auth_header'], 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.content == b''
+
+    client.put(url, headers=note_fixture['auth_header'], json={'note_text': 'changed'})
+    response = client.get(url, headers={**note_fixture['auth_header'], 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['etag'] == '"2"'
+    assert response.json()['note_text'] == 'changed'
+
+def test_get_note_not_modified_without_cache(client, fake_redis, note_fixture):
+    url = f'/api/v2/{note_fixture["note_id"]}'
+    response = client.get(url, headers={**note_fixture['auth_header'], 'If-None-Match': '"1"'})
+    assert response.status_code == 304
+    assert response.headers['etag'] == '"1"'
+    # version check does not fill cache
+    assert not any(key.startswith('note:') for key in fake_redis.storage)
+
+def test_update_note_if_match(client, note_fixture):
+    url = f'/api/v2/{note_fixture["note_id"]}'
+    response = client.put(
+        url,
+        headers={**note_fixture['auth_header'], 'If-Match': '"1"'},
+        json={'note_text': 'first editor'},
+    )
+    assert response.status_code == 200
+    assert response.headers['etag'] == '"2"'
+
+    response = client.put(
+        url,
+        headers={**note_fixture['auth_header'], 'If-Match': '"1"'},
+        json={'note_text': 'second editor'},
+    )
+    assert response.status_code == 412
+
+    response = client.get(url, headers=note_fixture['auth_header'])
+    assert response.json()['note_text'] == 'first editor'
+
+def test_update_missing_note_if_match(client, note_fixture):
+    response = client.put(
+        '/api/v2/999',
+        headers={**note_fixture['auth_header'], 'If-Match': '"1"'},
+        json={'note_text': 'text'},
+    )
+    assert response.status_code == 404
+
+
 def test_update_note(client, note_fixture):
     response = client.put(
         f'/api/v2/{note_fixture["note_id"]}',
@@ -295,7 +684,7 @@ def test_delete_note_unauthorized(client, note_fixture):
     assert response.status_code == 401
 
 
-def test_refresh_token_success(client, fake_redis, logged_in_user_data):
+def test_refresh_token_success(client, token_store, logged_in_user_data):
     response = client.post(
         '/api/v2/auth/refresh',
         json={'refresh_token': logged_in_user_data['refresh_token']},
@@ -305,4 +694,186 @@ def test_refresh_token_success(client, fake_redis, logged_in_user_data):
     assert "access_token" in data
     assert "refresh_token" in data
     assert data["token_type"] == "bearer"
-    assert f"{logged_in_user_data['refresh_token']}" not in fake_redis.storage
+    assert decode_token(data['refresh_token'])['jti'] in token_store._sessions
+    assert decode_token(logged_in_user_data['refresh_token'])['jti'] not in token_store._sessions
+
+
+def test_refresh_token_reuse_revokes_chain(client, logged_in_user_data):
+    old = logged_in_user_data['refresh_token']
+    response = client.post('/api/v2/auth/refresh', json={'refresh_token': old})
+    assert response.status_code == 200
+    new = response.json()['refresh_token']
+    assert new != old
+    response = client.post('/api/v2/auth/refresh', json={'refresh_token': new})
+    assert response.status_code == 200
+    newer = response.json()['refresh_token']
+
+    response = client.post('/api/v2/auth/refresh', json={'refresh_token': old})
+    assert response.status_code == 401
+
+    response = client.post('/api/v2/auth/refresh', json={'refresh_token': newer})
+    assert response.status_code == 401
+
+
+def test_refresh_token_without_jti(client, logged_in_user_data):
+    payload = decode_token(logged_in_user_data['refresh_token'])
+    del payload['jti']
+    token = jwt.encode(payload, os.getenv('SECRET_KEY'), algorithm=os.getenv('ALGORITHM'))
+
+    response = client.post('/api/v2/auth/refresh', json={'refresh_token': token})
+    assert response.status_code == 401
+
+
+def test_logout_all(client, logged_in_user_data):
+    data = logged_in_user_data
+    credentials = {'email': data['email'], 'password': 'test_password'}
+    second = client.post('/api/v2/auth/login', json=credentials).json()
+
+    response = client.post('/api/v2/auth/logout-all', headers=data['auth_header'])
+    assert response.status_code == 204
+
+    for token in (data['refresh_token'], second['refresh_token']):
+        response = client.post('/api/v2/auth/refresh', json={'refresh_token': token})
+        assert response.status_code == 401
+
+    # sessions started after logout-all are not affected
+    third = client.post('/api/v2/auth/login', json=credentials).json()
+    response = client.post('/api/v2/auth/refresh', json={'refresh_token': third['refresh_token']})
+    assert response.status_code == 200
+
+
+def test_logout_all_requires_access_token(client):
+    response = client.post('/api/v2/auth/logout-all')
+    assert response.status_code == 401
+
+
+def test_refresh_token_invalid(client):
+    response = client.post(
+        '/api/v2/auth/refresh',
+        json={'refresh_token': create_refresh_token(123456)},
+    )
+    assert response.status_code == 401
+
+
+def test_logout(client, token_store, logged_in_user_data):
+    token = logged_in_user_data['refresh_token']
+    response = client.post('/api/v2/auth/logout', json={'refresh_token': token})
+    assert response.status_code == 204
+    assert decode_token(token)['jti'] not in token_store._sessions
+
+    response = client.post('/api/v2/auth/logout', json={'refresh_token': token})
+    assert response.status_code == 401
+
+    response = client.post('/api/v2/auth/refresh', json={'refresh_token': token})
+    assert response.status_code == 401
+
+
+def test_healthz(client):
+    response = client.get('/healthz')
+    assert response.status_code == 200
+    assert response.json() == {'status': 'ok'}
+
+
+def test_readyz(client, monkeypatch):
+    async def ok():
+        pass
+
+    async def down():
+        raise ConnectionError()
+
+    monkeypatch.setattr(main, 'health_checker', HealthChecker({'database': ok}))
+    response = client.get('/readyz')
+    assert response.status_code == 200
+    assert response.json() == {'status': 'ok', 'checks': {'database': 'ok'}}
+
+    monkeypatch.setattr(main, 'health_checker', HealthChecker({'database': ok, 'redis': down}))
+    response = client.get('/readyz')
+    assert response.status_code == 503
+    assert response.json()['checks']['redis'] == 'error: ConnectionError'
+
+
+def test_db_pool_stats(client):
+    response = client.get('/api/v2/stats/db-pool')
+    assert response.status_code == 200
+    data = response.json()
+    assert data['pool'] == 'StaticPool'
+    assert {'acquired', 'timeouts', 'total_wait_seconds', 'max_wait_seconds'} <= set(data)
+
+    paths = client.get('/openapi.json').json()['paths']
+    assert '/api/v2/stats/db-pool' not in paths
+    assert '/metrics' not in paths
+
+
+def test_metrics(client, note_fixture):
+    client.get(f'/api/v2/{note_fixture["note_id"]}', headers=note_fixture['auth_header'])
+    client.get('/no/such/route')
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain; version=0.0.4')
+    body = response.text
+    assert 'http_requests_total{method="GET",route="/api/v2/{note_id}",status="200"}' in body
+    assert 'http_requests_total{method="GET",route="unmatched",status="404"}' in body
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/api/v2/{note_id}",le="+Inf"}' in body
+    assert 'db_query_duration_seconds_count{function="get_note"}' in body
+    assert 'password_hash_duration_seconds_count{operation="verify"}' in body
+    assert 'http_requests_in_flight 1' in body
+    assert '# TYPE user_cache_hits_total counter' in body
+    assert 'user_cache_misses_total ' in body
+    assert '# TYPE note_cache_hits_total counter' in body
+    assert 'note_cache_hit_ratio ' in body
+
+
+@pytest.fixture
+def diagnostics_enabled(monkeypatch, async_engine):
+    monkeypatch.setattr(diagnostics, 'DIAGNOSTICS_ENABLED', True)
+    monkeypatch.setattr(diagnostics, 'DIAGNOSTICS_TOKEN', 'diagnostics-token')
+    diagnostics.instrument_engine(async_engine)
+
+
+def test_diagnostics_off_without_header(client, diagnostics_enabled, note_fixture):
+    response = client.get(f'/api/v2/{note_fixture["note_id"]}', headers=note_fixture['auth_header'])
+    assert 'x-diagnostics-summary' not in response.headers
+
+
+def test_diagnostics_off_without_token(client, diagnostics_enabled, note_fixture, monkeypatch):
+    monkeypatch.setattr(diagnostics, 'DIAGNOSTICS_TOKEN', '')
+    response = client.get(
+        f'/api/v2/{note_fixture["note_id"]}',
+        headers={**note_fixture['auth_header'], 'X-Diagnostics': ''},
+    )
+    assert 'x-diagnostics-summary' not in response.headers
+
+
+def test_diagnostics_summary_header(client, diagnostics_enabled, note_fixture):
+    user_cache.clear()
+    response = client.put(
+        f'/api/v2/{note_fixture["note_id"]}',
+        headers={**note_fixture['auth_header'], 'X-Diagnostics': 'diagnostics-token'},
+        json={'note_text': 'changed', 'note_date': '2025-12-17'},
+    )
+    assert response.status_code == 200
+    summary = response.headers['x-diagnostics-summary']
+    # user lookup and the versioned UPDATE
+    assert 'sql=2 ' in summary
+    assert 'kinds=SELECT:1,UPDATE:1' in summary
+    assert 'redis=' in summary
+    assert 'x-diagnostics-report' not in response.headers
+
+
+def test_diagnostics_report_file(client, diagnostics_enabled, note_fixture, monkeypatch, tmp_path):
+    monkeypatch.setattr(diagnostics, 'DIAGNOSTICS_OUTPUT', 'file')
+    monkeypatch.setattr(diagnostics, 'DIAGNOSTICS_DIR', str(tmp_path))
+    user_cache.clear()
+
+    response = client.get(
+        f'/api/v2/{note_fixture["note_id"]}',
+        headers={**note_fixture['auth_header'], 'X-Diagnostics': 'diagnostics-token'},
+    )
+    assert response.status_code == 200
+
+    report = json.loads((tmp_path / response.headers['x-diagnostics-report']).read_text())
+    assert report['path'] == f'/api/v2/{note_fixture["note_id"]}'
+    assert [s['caller'] for s in report['statements']] == ['database.get_user_by_id', 'database.get_note']
+    assert report['duplicates'] == []
+    assert 'cumulative' in report['profile']
@@ -0,0 +1,143 @@
+import pytest
+
+import user_cache
+from cache import TTLCache
+
+from user_cache import CachedUser, get_cached_user, invalidate_user
+
+
+class TestTTLCache:
+    def test_get_and_set(self, clock):
+        c = TTLCache(maxsize=10, ttl=60)
+        c.set('a', 1)
+        assert c.get('a') == 1
+        assert c.get('b') is None
+        assert c.hits == 1
+        assert c.misses == 1
+
+    def test_expired_entry_is_miss(self, clock):
+        c = TTLCache(maxsize=10, ttl=60)
+        c.set('a', 1)
+        clock.now += 61
+        assert c.get('a') is None
+        assert len(c) == 0
+
+    def test_entry_ttl_cannot_exceed_cache_ttl(self, clock):
+        c = TTLCache(maxsize=10, ttl=60)
+        c.set('a', 1, ttl=600)
+        clock.now += 61
+        assert c.get('a') is None
+
+    def test_lru_eviction(self, clock):
+        c = TTLCache(maxsize=2, ttl=60)
+        c.set('a', 1)
+        c.set('b', 2)
+        c.get('a')
+        c.set('c', 3)
+        assert c.get('a') == 1
+        assert c.get('b') is None
+        assert c.get('c') == 3
+
+    def test_invalidate(self, clock):
+        c = TTLCache(maxsize=10, ttl=60)
+        c.set('a', 1)
+        c.invalidate('a')
+        assert c.get('a') is None
+
+    def test_disabled_cache(self, clock):
+        c = TTLCache(maxsize=0, ttl=60)
+        c.set('a', 1)
+        assert c.get('a') is None
+
+
+class DbUser:
+    user_id = 5
+    user_email = 'cached@user.com'
+
+
+@pytest.fixture
+def db_calls(monkeypatch):
+    calls = []
+
+    async def fake_get_user_by_id(db, user_id):
+        calls.append(user_id)
+        return DbUser() if user_id == DbUser.user_id else None
+
+    monkeypatch.setattr(user_cache.database, 'get_user_by_id', fake_get_user_by_id)
+    user_cache.user_cache.clear()
+    yield calls
+    user_cache.user_cache.clear()
+
+
+class TestUserCache:
+    @pytest.mark.asyncio
+    async def test_second_lookup_is_cached(self, db_calls):
+        first = await get_cached_user(None, 5)
+        second = await get_cached_user(None, 5)
+        assert first == second == CachedUser(user_id=5, user_email='cached@user.com')
+        assert db_calls == [5]
+        assert user_cache.user_cache.hits == 1
+
+    @pytest.mark.asyncio
+    async def test_missing_user_not_cached(self, db_calls):
+        assert await get_cached_user(None, 6) is None
+        assert await get_cached_user(None, 6) is None
+        assert db_calls == [6, 6]
+
+    @pytest.mark.asyncio
+    async def test_invalidate_user(self, db_calls, monkeypatch, fake_redis):
+        monkeypatch.setattr(user_cache, 'USER_CACHE_REDIS', True)
+        await get_cached_user(None, 5, fake_redis)
+
+        await invalidate_user(5, fake_redis)
+        assert 'user:5' not in fake_redis.storage
+
+        await get_cached_user(None, 5, fake_redis)
+        assert db_calls == [5, 5]
+
+    @pytest.mark.asyncio
+    async def test_invalidate_user_ignores_redis_errors(self, db_calls, monkeypatch, broken_redis):
+        monkeypatch.setattr(user_cache, 'USER_CACHE_REDIS', True)
+        await get_cached_user(None, 5)
+
+        await invalidate_user(5, broken_redis)
+        await get_cached_user(None, 5)
+        assert db_calls == [5, 5]
+
+    @pytest.mark.asyncio
+    async def test_shared_through_redis(self, db_calls, monkeypatch, fake_redis):
+        monkeypatch.setattr(user_cache, 'USER_CACHE_REDIS', True)
+
+        await get_cached_user(None, 5, fake_redis)
+        assert 'user:5' in fake_redis.storage
+
+        # another worker has empty local cache
+        user_cache.user_cache.clear()
+        user = await get_cached_user(None, 5, fake_redis)
+        assert user.user_email == 'cached@user.com'
+        assert db_calls == [5]
+
+    @pytest.mark.asyncio
+    async def test_short_ttl_in_redis(self, db_calls, monkeypatch, fake_redis):
+        monkeypatch.setattr(user_cache, 'USER_CACHE_REDIS', True)
+        monkeypatch.setattr(user_cache, 'USER_CACHE_TTL', 0.5)
+
+        await get_cached_user(None, 5, fake_redis)
+        assert fake_redis.ttls['user:5'] == 500
+
+    @pytest.mark.asyncio
+    async def test_redis_errors_fall_back_to_database(self, db_calls, monkeypatch, broken_redis):
+        monkeypatch.setattr(user_cache, 'USER_CACHE_REDIS', True)
+
+        user = await get_cached_user(None, 5, broken_redis)
+        assert user.user_email == 'cached@user.com'
+        assert db_calls == [5]
+
+    @pytest.mark.asyncio
+    async def test_unreadable_redis_value_is_a_miss(self, db_calls, monkeypatch, fake_redis):
+        monkeypatch.setattr(user_cache, 'USER_CACHE_REDIS', True)
+        fake_redis.storage['user:5'] = 'not json'
+
+        user = await get_cached_user(None, 5, fake_redis)
+        assert user.user_email == 'cached@user.com'
+        assert db_calls == [5]
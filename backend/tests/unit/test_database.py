@@ -1,4 +1,8 @@
 import pytest
+import asyncio
+import tracemalloc
+from datetime import date
+from sqlalchemy import event, text
 from sqlalchemy.ext.asyncio import (
     create_async_engine,
     async_sessionmaker,
@@ -7,9 +11,12 @@ from sqlalchemy.ext.asyncio import (
 
 from database import (
     get_user_by_email, create_user, new_note, get_note,
-    delete_note, update_note, get_user_by_id
+    delete_note, update_note, get_user_by_id, new_notes, list_notes,
+    stream_notes, search_notes, get_note_version, NoteVersionConflict,
 )
+from metrics import db_query_duration_seconds
 from models import Base
+import database
 
 DATABASE_URL = "sqlite+aiosqlite:///:memory:"
 
@@ -33,8 +40,22 @@ async def db_session_rollback(async_engine):
             )
             async with async_session() as session:
                 yield session
-                
-            await transaction.rollback()
+
+            # tested code may already have rolled it back
+            if transaction.is_active:
+                await transaction.rollback()
+
+@pytest.fixture
+def statements(async_engine):
+    """Collects SQL statements sent to database during the test"""
+    issued = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        issued.append(statement)
+
+    event.listen(async_engine.sync_engine, 'before_cursor_execute', before_cursor_execute)
+    yield issued
+    event.remove(async_engine.sync_engine, 'before_cursor_execute', before_cursor_execute)
 
 @pytest.fixture
 async def sample_user(db_session_rollback: AsyncSession):
@@ -51,7 +72,7 @@ async def sample_note_data(db_session_rollback: AsyncSession, sample_user):
         db=db_session_rollback,
         user_id=sample_user.user_id,
         text='Sample Note Text',
-        date='2025-12-16',
+        date=date(2025, 12, 16),
     )
     return note_id, sample_user.user_id
 
@@ -74,7 +95,7 @@ class TestDatabase:
             db=db_session_rollback,
             user_id=sample_user.user_id,
             text='hello world',
-            date='2025-12-16',
+            date=date(2025, 12, 16),
         )
         assert note_id is not None
 
@@ -82,13 +103,13 @@ class TestDatabase:
     async def test_get_note(self, db_session_rollback: AsyncSession, sample_note_data):
         note_id, user_id = sample_note_data
         
-        date, text = await get_note(
+        note_date, text, version = await get_note(
             db=db_session_rollback,
             user_id=user_id,
             note_id=note_id,
         )
         assert text == 'Sample Note Text'
-        assert date == '2025-12-16'
+        assert note_date == date(2025, 12, 16)
 
     @pytest.mark.asyncio
     async def test_update_note(self, db_session_rollback: AsyncSession, sample_note_data):
@@ -103,9 +124,34 @@ class TestDatabase:
 
         assert result
 
-        date, text = await get_note(db_session_rollback, user_id, note_id)
+        note_date, text, version = await get_note(db_session_rollback, user_id, note_id)
         assert text == 'updated text'
 
+    @pytest.mark.asyncio
+    async def test_update_note_bumps_version(self, db_session_rollback: AsyncSession, sample_note_data):
+        note_id, user_id = sample_note_data
+        assert await get_note_version(db_session_rollback, user_id, note_id) == 1
+
+        version = await update_note(db_session_rollback, user_id, note_id, 'v2')
+        assert version == 2
+        assert await get_note_version(db_session_rollback, user_id, note_id) == 2
+
+    @pytest.mark.asyncio
+    async def test_update_note_expected_version(self, db_session_rollback: AsyncSession, sample_note_data):
+        note_id, user_id = sample_note_data
+        assert await update_note(db_session_rollback, user_id, note_id, 'v2', expected_versions=[1]) == 2
+
+        with pytest.raises(NoteVersionConflict):
+            await update_note(db_session_rollback, user_id, note_id, 'lost update', expected_versions=[1])
+
+        note_date, text, version = await get_note(db_session_rollback, user_id, note_id)
+        assert (text, version) == ('v2', 2)
+
+    @pytest.mark.asyncio
+    async def test_update_missing_note_with_expected_version(self, db_session_rollback: AsyncSession, sample_user):
+        with pytest.raises(ValueError):
+            await update_note(db_session_rollback, sample_user.user_id, 999, 'text', expected_versions=[1])
+
     @pytest.mark.asyncio
     async def test_delete_note(self, db_session_rollback: AsyncSession, sample_note_data):
         note_id, user_id = sample_note_data
@@ -165,4 +211,275 @@ class TestDatabase:
             user_id=sample_user.user_id,
         )
         assert user is not None
-        assert user.user_id == sample_user.user_id
\ No newline at end of file
+        assert user.user_id == sample_user.user_id
+
+    @pytest.mark.asyncio
+    async def test_note_ids_increase(self, db_session_rollback: AsyncSession, sample_user):
+        ids = [
+            await new_note(db_session_rollback, sample_user.user_id, f'note {i}', date(2025, 12, 16))
+            for i in range(3)
+        ]
+        assert ids == [1, 2, 3]
+
+    @pytest.mark.asyncio
+    async def test_note_id_not_reused_after_delete(self, db_session_rollback: AsyncSession, sample_note_data):
+        note_id, user_id = sample_note_data
+        await delete_note(db_session_rollback, user_id, note_id)
+
+        new_id = await new_note(db_session_rollback, user_id, 'another', date(2025, 12, 16))
+        assert new_id == note_id + 1
+
+    @pytest.mark.asyncio
+    async def test_new_notes_contiguous_ids(self, db_session_rollback: AsyncSession, sample_note_data):
+        note_id, user_id = sample_note_data
+        ids = await new_notes(
+            db_session_rollback,
+            user_id,
+            [('first', date(2025, 12, 16)), ('second', date(2025, 12, 17))],
+        )
+        assert ids == [note_id + 1, note_id + 2]
+
+        note_date, text, version = await get_note(db_session_rollback, user_id, ids[1])
+        assert text == 'second'
+        assert note_date == date(2025, 12, 17)
+
+    @pytest.mark.asyncio
+    async def test_list_notes_by_id(self, db_session_rollback: AsyncSession, sample_user):
+        await new_notes(db_session_rollback, sample_user.user_id, [(f'note {i}', date(2025, 12, 16)) for i in range(5)])
+
+        first_page = await list_notes(db_session_rollback, sample_user.user_id, limit=2)
+        assert [row.note_id for row in first_page] == [1, 2]
+
+        next_page = await list_notes(db_session_rollback, sample_user.user_id, limit=2, after=(2,))
+        assert [row.note_id for row in next_page] == [3, 4]
+
+    @pytest.mark.asyncio
+    async def test_list_notes_by_date(self, db_session_rollback: AsyncSession, sample_user):
+        dates = [date(2025, 12, 18), date(2025, 12, 16), date(2025, 12, 17), date(2025, 12, 16)]
+        await new_notes(db_session_rollback, sample_user.user_id, [('note', d) for d in dates])
+
+        first_page = await list_notes(db_session_rollback, sample_user.user_id, limit=2, order='note_date')
+        assert [(row.note_date, row.note_id) for row in first_page] == [(date(2025, 12, 16), 2), (date(2025, 12, 16), 4)]
+
+        next_page = await list_notes(
+            db_session_rollback, sample_user.user_id, limit=2, order='note_date', after=(date(2025, 12, 16), 4)
+        )
+        assert [row.note_id for row in next_page] == [3, 1]
+
+    @pytest.mark.asyncio
+    async def test_list_notes_date_range(self, db_session_rollback: AsyncSession, sample_user):
+        dates = [date(2025, 12, day) for day in (20, 1, 10, 15, 31)]
+        await new_notes(db_session_rollback, sample_user.user_id, [('note', d) for d in dates])
+
+        rows = await list_notes(
+            db_session_rollback, sample_user.user_id, limit=10, order='note_date',
+            date_from=date(2025, 12, 10), date_to=date(2025, 12, 20),
+        )
+        assert [row.note_date.day for row in rows] == [10, 15, 20]
+
+    @pytest.mark.asyncio
+    async def test_list_notes_date_range_uses_index(self, db_session_rollback: AsyncSession):
+        plan = await db_session_rollback.execute(text(
+            "EXPLAIN QUERY PLAN SELECT note_id FROM notes WHERE user_id = 1 "
+            "AND note_date >= '2025-12-10' AND note_date <= '2025-12-20' ORDER BY note_date, note_id LIMIT 10"
+        ))
+        details = ' '.join(row[-1] for row in plan)
+        assert 'ix_notes_user_id_note_date' in details
+        assert 'note_date>? AND note_date<?' in details.replace('=', '')
+        assert 'TEMP B-TREE' not in details
+
+    @pytest.mark.asyncio
+    async def test_list_notes_by_date_uses_index(self, db_session_rollback: AsyncSession):
+        # deep pages must be an index range scan, not a sort of all user's notes
+        plan = await db_session_rollback.execute(text(
+            "EXPLAIN QUERY PLAN SELECT note_id FROM notes WHERE user_id = 1 "
+            "AND (note_date, note_id) > ('2025-12-16', 4) ORDER BY note_date, note_id LIMIT 10"
+        ))
+        details = ' '.join(row[-1] for row in plan)
+        assert 'ix_notes_user_id_note_date' in details
+        assert 'TEMP B-TREE' not in details
+
+    @pytest.mark.asyncio
+    async def test_stream_notes(self, db_session_rollback: AsyncSession, sample_user):
+        await new_notes(db_session_rollback, sample_user.user_id, [(f'note {i}', date(2025, 12, 16)) for i in range(5)])
+
+        chunks = [rows async for rows in stream_notes(db_session_rollback, sample_user.user_id, chunk_size=2)]
+
+        assert [len(rows) for rows in chunks] == [2, 2, 1]
+        assert [row.note_id for rows in chunks for row in rows] == [1, 2, 3, 4, 5]
+
+    @pytest.mark.asyncio
+    async def test_search_notes(self, db_session_rollback: AsyncSession, sample_user):
+        other = await create_user(db_session_rollback, 'other@user.com', 'test_pass')
+        await new_notes(db_session_rollback, other.user_id, [('buy milk', date(2025, 12, 16))])
+        await new_notes(db_session_rollback, sample_user.user_id, [
+            ('buy milk and bread', date(2025, 12, 16)),
+            ('call mom', date(2025, 12, 17)),
+            ('milk milk milk', date(2025, 12, 18)),
+        ])
+
+        rows = await search_notes(db_session_rollback, sample_user.user_id, 'milk', limit=10)
+
+        assert [row.note_id for row in rows] == [3, 1]
+        assert '<b>milk</b>' in rows[1].snippet
+        assert rows[1].note_date == date(2025, 12, 16)
+
+    @pytest.mark.asyncio
+    async def test_search_snippet_is_escaped(self, db_session_rollback: AsyncSession, sample_user):
+        await new_notes(db_session_rollback, sample_user.user_id, [
+            ('milk <script>alert(1)</script> & <b>bread</b>', date(2025, 12, 16)),
+        ])
+
+        rows = await search_notes(db_session_rollback, sample_user.user_id, 'milk', limit=10)
+
+        assert rows[0].snippet.startswith('<b>milk</b> &lt;script&gt;')
+        assert '&amp; &lt;b&gt;bread&lt;/b&gt;' in rows[0].snippet
+
+    @pytest.mark.asyncio
+    async def test_search_follows_updates_and_deletes(self, db_session_rollback: AsyncSession, sample_note_data):
+        note_id, user_id = sample_note_data
+        await update_note(db_session_rollback, user_id, note_id, 'groceries list')
+        assert await search_notes(db_session_rollback, user_id, 'sample', limit=10) == []
+        assert len(await search_notes(db_session_rollback, user_id, 'groceries', limit=10)) == 1
+
+        await delete_note(db_session_rollback, user_id, note_id)
+        assert await search_notes(db_session_rollback, user_id, 'groceries', limit=10) == []
+
+    @pytest.mark.asyncio
+    async def test_search_query_syntax_is_escaped(self, db_session_rollback: AsyncSession, sample_note_data):
+        note_id, user_id = sample_note_data
+        rows = await search_notes(db_session_rollback, user_id, '(note* "text', limit=10)
+        assert [row.note_id for row in rows] == [note_id]
+        assert await search_notes(db_session_rollback, user_id, '"*"', limit=10) == []
+
+    @pytest.mark.asyncio
+    async def test_new_note_unknown_user_raises(self, db_session_rollback: AsyncSession):
+        with pytest.raises(ValueError):
+            await new_note(db_session_rollback, 999, 'text', date(2025, 12, 16))
+
+
+class TestQueryTiming:
+
+    @pytest.mark.asyncio
+    async def test_create_user_hashing_not_timed(self, db_session_rollback: AsyncSession, monkeypatch):
+        before = db_query_duration_seconds.count('create_user')
+        counts_while_hashing = []
+
+        async def fake_hash(password):
+            counts_while_hashing.append(db_query_duration_seconds.count('create_user'))
+            return 'hashed'
+
+        monkeypatch.setattr(database, 'hash_password_async', fake_hash)
+        await create_user(db_session_rollback, 'timed@user.com', 'test_pass')
+        assert counts_while_hashing == [before]
+        assert db_query_duration_seconds.count('create_user') == before + 1
+
+    @pytest.mark.asyncio
+    async def test_new_note_observed_once(self, db_session_rollback: AsyncSession, sample_user):
+        before = db_query_duration_seconds.count('new_note')
+        await new_note(db_session_rollback, sample_user.user_id, 'text', date(2025, 12, 16))
+        assert db_query_duration_seconds.count('new_note') == before + 1
+        assert db_query_duration_seconds.count('reserve_note_ids') == 0
+
+
+class TestStatementCount:
+
+    @pytest.mark.asyncio
+    async def test_create_user_single_statement(self, db_session_rollback: AsyncSession, statements):
+        user = await create_user(db_session_rollback, 'single@user.com', 'test_pass')
+        assert user.user_id is not None
+        assert user.created_at is not None
+        assert len(statements) == 1
+        assert statements[0].startswith('INSERT')
+
+    @pytest.mark.asyncio
+    async def test_new_note_statements(self, db_session_rollback: AsyncSession, sample_user, statements):
+        await new_note(db_session_rollback, sample_user.user_id, 'text', date(2025, 12, 16))
+        assert [s.split()[0] for s in statements] == ['UPDATE', 'INSERT']
+
+    @pytest.mark.asyncio
+    async def test_new_notes_bulk_statements(self, db_session_rollback: AsyncSession, sample_user, statements):
+        await new_notes(
+            db_session_rollback,
+            sample_user.user_id,
+            [(f'note {i}', date(2025, 12, 16)) for i in range(20)],
+        )
+        assert [s.split()[0] for s in statements] == ['UPDATE', 'INSERT']
+
+    @pytest.mark.asyncio
+    async def test_update_note_single_statement(self, db_session_rollback: AsyncSession, sample_note_data, statements):
+        note_id, user_id = sample_note_data
+        await update_note(db_session_rollback, user_id, note_id, 'updated text')
+        assert len(statements) == 1
+        assert statements[0].startswith('UPDATE')
+
+    @pytest.mark.asyncio
+    async def test_update_missing_note_single_statement(self, db_session_rollback: AsyncSession, sample_user, statements):
+        with pytest.raises(ValueError):
+            await update_note(db_session_rollback, sample_user.user_id, 999, 'text')
+        assert len(statements) == 1
+
+    @pytest.mark.asyncio
+    async def test_delete_note_single_statement(self, db_session_rollback: AsyncSession, sample_note_data, statements):
+        note_id, user_id = sample_note_data
+        await delete_note(db_session_rollback, user_id, note_id)
+        assert len(statements) == 1
+        assert statements[0].startswith('DELETE')
+
+    @pytest.mark.asyncio
+    async def test_delete_missing_note_raises(self, db_session_rollback: AsyncSession, sample_user, statements):
+        with pytest.raises(ValueError) as exc:
+            await delete_note(db_session_rollback, sample_user.user_id, 999)
+        assert 'does not exist' in str(exc.value)
+        assert len(statements) == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_new_note_ids_are_unique(tmp_path):
+    # every task uses its own connection, as concurrent requests do
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'notes.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    async with session_factory() as db:
+        user = await create_user(db, 'stress@user.com', 'test_pass')
+
+    async def create(i):
+        async with session_factory() as db:
+            return await new_note(db, user.user_id, f'note {i}', date(2025, 12, 16))
+
+    ids = await asyncio.gather(*(create(i) for i in range(50)))
+    await engine.dispose()
+
+    assert sorted(ids) == list(range(1, 51))
+
+
+async def _stream_peak_memory(db, user_id: int) -> tuple[int, int]:
+    tracemalloc.start()
+    try:
+        count = 0
+        async for rows in stream_notes(db, user_id, chunk_size=500):
+            count += len(rows)
+        return tracemalloc.get_traced_memory()[1], count
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.mark.asyncio
+async def test_stream_notes_memory_is_flat(db_session_rollback: AsyncSession, sample_user):
+    text = 'x' * 500
+    notes = [(text, date(2025, 12, 16))] * 5000
+
+    await new_notes(db_session_rollback, sample_user.user_id, notes)
+    small_peak, small_count = await _stream_peak_memory(db_session_rollback, sample_user.user_id)
+
+    for _ in range(9):
+        await new_notes(db_session_rollback, sample_user.user_id, notes)
+    large_peak, large_count = await _stream_peak_memory(db_session_rollback, sample_user.user_id)
+
+    assert (small_count, large_count) == (5000, 50000)
+    # 50000 notes of 500 bytes are ~25 MB, stream holds only one chunk of them
+    assert large_peak < 2 * small_peak
+    assert large_peak < 5 * 1024 * 1024
+
@@ -0,0 +1,103 @@
+import json
+import threading
+
+import pytest
+
+import diagnostics
+from diagnostics import Report, current_report, instrument_redis
+
+
+class FakeRedisClient:
+    async def execute_command(self, *args, **options):
+        return 'OK'
+
+    async def get(self, key):
+        return await self.execute_command('GET', key)
+
+
+def test_duplicates_and_summary():
+    report = Report('GET', '/api/v2/1')
+    report.add_statement('SELECT * FROM users WHERE user_id = ?', (1,), 0.001, 'database.get_user_by_id')
+    report.add_statement('SELECT * FROM notes WHERE note_id = ?', (1,), 0.002, 'database.get_note')
+    report.add_statement('SELECT * FROM users WHERE user_id = ?', (1,), 0.001, 'database.get_user_by_id')
+    report.add_statement('SELECT * FROM users WHERE user_id = ?', (2,), 0.001, 'database.get_user_by_id')
+    report.add_statement('UPDATE notes SET version = ?', (2,), 0.003, 'database.update_note')
+
+    duplicates = report.duplicates()
+    assert len(duplicates) == 1
+    assert duplicates[0]['count'] == 2
+    assert duplicates[0]['params'] == '(int)'
+    assert duplicates[0]['callers'] == ['database.get_user_by_id'] * 2
+
+    summary = report.summary()
+    assert 'sql=5 sql_ms=8.00' in summary
+    assert 'duplicate_sql=1' in summary
+    assert 'kinds=SELECT:4,UPDATE:1' in summary
+
+
+async def test_instrument_redis():
+    client = instrument_redis(FakeRedisClient())
+
+    assert await client.get('refresh:3f2a9c') == 'OK'
+
+    report = Report('GET', '/')
+    token = current_report.set(report)
+    try:
+        assert await client.get('refresh:3f2a9c') == 'OK'
+    finally:
+        current_report.reset(token)
+
+    assert len(report.redis_calls) == 1
+    assert report.redis_calls[0]['command'] == 'GET'
+    # session key is not in the report, only its namespace
+    assert report.redis_calls[0]['args'] == ['refresh:*']
+    assert report.redis_calls[0]['caller'] == 'test_diagnostics.get'
+
+
+def test_params_are_redacted():
+    report = Report('POST', '/api/v2/auth/register')
+    report.add_statement(
+        'INSERT INTO users (user_email, user_password) VALUES (?, ?)',
+        ('user@example.com', '$2b$12$secrethash'), 0.001, 'database.create_user',
+    )
+    report.add_statement('INSERT INTO notes VALUES (?, ?)', [(1, 'private note'), (2, 'other')], 0.001, 'database.new_notes')
+    report.add_statement('SELECT 1 WHERE a = :a', {'a': 'secret'}, 0.001, 'database.get_note')
+
+    text = json.dumps(report.as_dict())
+    for value in ('user@example.com', 'secrethash', 'private note', 'secret'):
+        assert value not in text
+    assert [s['params'] for s in report.statements] == ['(str[16], str[17])', '2 x (int, str[12])', '{a: str[6]}']
+
+
+@pytest.mark.parametrize('token, value, expected', [
+    ('', b'1', False),
+    ('', b'', False),
+    ('secret', b'secret', True),
+    ('secret', b'wrong', False),
+])
+def test_requested(monkeypatch, token, value, expected):
+    monkeypatch.setattr(diagnostics, 'DIAGNOSTICS_TOKEN', token)
+
+    assert diagnostics._requested({'headers': [(b'x-diagnostics', value)]}) is expected
+    assert diagnostics._requested({'headers': []}) is False
+
+
+async def test_report_is_written_in_a_thread(monkeypatch):
+    monkeypatch.setattr(diagnostics, 'DIAGNOSTICS_ENABLED', True)
+    monkeypatch.setattr(diagnostics, 'DIAGNOSTICS_TOKEN', 'secret')
+    monkeypatch.setattr(diagnostics, 'DIAGNOSTICS_OUTPUT', 'file')
+    threads = []
+    monkeypatch.setattr(diagnostics, 'write_report', lambda report: threads.append(threading.current_thread()))
+
+    async def app(scope, receive, send):
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def send(message):
+        pass
+
+    scope = {'type': 'http', 'method': 'GET', 'path': '/', 'headers': [(b'x-diagnostics', b'secret')]}
+    await diagnostics.DiagnosticsMiddleware(app)(scope, None, send)
+
+    assert len(threads) == 1
+    assert threads[0] is not threading.main_thread()
@@ -0,0 +1,21 @@
+from etag import make_etag, etag_matches, parse_if_match
+
+
+def test_make_etag():
+    assert make_etag(3) == '"3"'
+
+
+def test_etag_matches():
+    assert etag_matches('"3"', '"3"')
+    assert etag_matches('"1", W/"3"', '"3"')
+    assert etag_matches('*', '"3"')
+    assert not etag_matches('"2"', '"3"')
+    assert not etag_matches(None, '"3"')
+
+
+def test_parse_if_match():
+    assert parse_if_match('"3"') == [3]
+    assert parse_if_match('"3", "4"') == [3, 4]
+    assert parse_if_match('*') is None
+    assert parse_if_match('W/"3"') == []
+    assert parse_if_match('"abc"') == []
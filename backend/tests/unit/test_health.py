@@ -0,0 +1,53 @@
+import asyncio
+
+from health import HealthChecker
+
+
+class CountingCheck:
+    def __init__(self, error=None, delay=0):
+        self.calls = 0
+        self.error = error
+        self.delay = delay
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+
+
+async def test_cached(clock):
+    database = CountingCheck()
+    checker = HealthChecker({'database': database}, ttl=2)
+
+    assert await checker.check() == {'status': 'ok', 'checks': {'database': 'ok'}}
+    clock.now += 1
+    await checker.check()
+    assert database.calls == 1
+
+    clock.now += 2
+    await checker.check()
+    assert database.calls == 2
+
+
+async def test_concurrent_probes_share_one_run():
+    database = CountingCheck(delay=0.01)
+    checker = HealthChecker({'database': database}, ttl=2)
+
+    results = await asyncio.gather(*(checker.check() for _ in range(10)))
+
+    assert database.calls == 1
+    assert all(r['status'] == 'ok' for r in results)
+
+
+async def test_failed_and_slow_checks():
+    checker = HealthChecker({
+        'database': CountingCheck(),
+        'redis': CountingCheck(error=ConnectionError()),
+        'slow': CountingCheck(delay=1),
+    }, timeout=0.01)
+
+    assert await checker.check() == {
+        'status': 'unavailable',
+        'checks': {'database': 'ok', 'redis': 'error: ConnectionError', 'slow': 'error: TimeoutError'},
+    }
@@ -0,0 +1,75 @@
+import pytest
+
+import metrics
+from metrics import Counter, Gauge, Histogram, CallbackGauge, CallbackCounter, Registry, timed
+
+
+def test_counter_and_gauge_render():
+    registry = Registry()
+    requests = registry.register(Counter('requests_total', 'Requests', ('route',)))
+    in_flight = registry.register(Gauge('in_flight', 'In flight'))
+    registry.register(CallbackGauge('queue_depth', 'Queue', lambda: 3))
+    registry.register(CallbackCounter('hits_total', 'Hits', lambda: 5))
+
+    requests.inc('/a')
+    requests.inc('/a')
+    requests.inc('/b"')
+    in_flight.inc()
+    in_flight.inc()
+    in_flight.dec()
+
+    assert registry.render().splitlines() == [
+        '# HELP requests_total Requests',
+        '# TYPE requests_total counter',
+        'requests_total{route="/a"} 2',
+        'requests_total{route="/b\\""} 1',
+        '# HELP in_flight In flight',
+        '# TYPE in_flight gauge',
+        'in_flight 1',
+        '# HELP queue_depth Queue',
+        '# TYPE queue_depth gauge',
+        'queue_depth 3',
+        '# HELP hits_total Hits',
+        '# TYPE hits_total counter',
+        'hits_total 5',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('latency_seconds', 'Latency', ('route',), buckets=(0.1, 1.0))
+    histogram.observe(0.05, '/a')
+    histogram.observe(0.1, '/a')
+    histogram.observe(0.5, '/a')
+    histogram.observe(7, '/a')
+
+    assert list(histogram.samples()) == [
+        'latency_seconds_bucket{route="/a",le="0.1"} 2',
+        'latency_seconds_bucket{route="/a",le="1.0"} 3',
+        'latency_seconds_bucket{route="/a",le="+Inf"} 4',
+        'latency_seconds_sum{route="/a"} 7.65',
+        'latency_seconds_count{route="/a"} 4',
+    ]
+    assert histogram.count('/a') == 4
+    assert histogram.count('/b') == 0
+
+
+async def test_timed(monkeypatch):
+    histogram = Histogram('calls_seconds', 'Calls', ('function',))
+
+    @timed(histogram)
+    async def get_thing(value):
+        return value
+
+    @timed(histogram)
+    async def broken():
+        raise ValueError
+
+    assert await get_thing(5) == 5
+    with pytest.raises(ValueError):
+        await broken()
+    assert histogram.count('get_thing') == 1
+    assert histogram.count('broken') == 1
+
+    monkeypatch.setattr(metrics, 'METRICS_ENABLED', False)
+    await get_thing(5)
+    assert histogram.count('get_thing') == 1
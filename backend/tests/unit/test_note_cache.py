@@ -0,0 +1,98 @@
+import pytest
+from datetime import date
+from redis.exceptions import ConnectionError
+
+import note_cache
+from note_cache import (
+    get_cached_note,
+    fill_note_cache,
+    invalidate_note_cache,
+    note_cache_stats,
+    TOMBSTONE,
+)
+
+
+@pytest.mark.asyncio
+async def test_fill_and_get(fake_redis):
+    await fill_note_cache(fake_redis, 1, 2, date(2025, 12, 16), 'text', 1)
+
+    assert await get_cached_note(fake_redis, 1, 2) == (date(2025, 12, 16), 'text', 1)
+    assert fake_redis.ttls['note:1:2'] == note_cache.NOTE_CACHE_TTL * 1000
+
+
+@pytest.mark.asyncio
+async def test_miss_counted(fake_redis):
+    misses = note_cache_stats.misses
+    assert await get_cached_note(fake_redis, 1, 2) is None
+    assert note_cache_stats.misses == misses + 1
+
+
+@pytest.mark.asyncio
+async def test_stale_fill_after_invalidate_is_ignored(fake_redis):
+    # reader fetched old row, writer updated it and invalidated cache, then reader fills cache
+    await invalidate_note_cache(fake_redis, 1, 2)
+    await fill_note_cache(fake_redis, 1, 2, date(2025, 12, 16), 'old text', 1)
+
+    assert fake_redis.storage['note:1:2'] == TOMBSTONE
+    assert await get_cached_note(fake_redis, 1, 2) is None
+
+
+@pytest.mark.asyncio
+async def test_large_note_not_cached(fake_redis, monkeypatch):
+    monkeypatch.setattr(note_cache, 'NOTE_CACHE_MAX_BYTES', 64)
+    await fill_note_cache(fake_redis, 1, 2, date(2025, 12, 16), 'x' * 100, 1)
+    assert fake_redis.storage == {}
+
+
+@pytest.mark.asyncio
+async def test_disabled(fake_redis, monkeypatch):
+    monkeypatch.setattr(note_cache, 'NOTE_CACHE_ENABLED', False)
+    await fill_note_cache(fake_redis, 1, 2, date(2025, 12, 16), 'text', 1)
+    assert fake_redis.storage == {}
+    assert await get_cached_note(fake_redis, 1, 2) is None
+
+
+@pytest.mark.asyncio
+async def test_redis_errors_are_misses(monkeypatch, broken_redis):
+    monkeypatch.setattr(note_cache, 'NOTE_CACHE_INVALIDATE_RETRIES', 0)
+    errors = note_cache_stats.errors
+
+    assert await get_cached_note(broken_redis, 1, 2) is None
+    await fill_note_cache(broken_redis, 1, 2, date(2025, 12, 16), 'text', 1)
+    await invalidate_note_cache(broken_redis, 1, 2)
+
+    assert note_cache_stats.errors == errors + 3
+
+
+@pytest.mark.asyncio
+async def test_invalidate_retries_then_logs(fake_redis, broken_redis, monkeypatch, caplog):
+    monkeypatch.setattr(note_cache, 'NOTE_CACHE_INVALIDATE_BACKOFF', 0)
+    failures = []
+    set_tombstone = fake_redis.set
+
+    async def flaky_set(*args, **kwargs):
+        if len(failures) < note_cache.NOTE_CACHE_INVALIDATE_RETRIES:
+            failures.append(1)
+            raise ConnectionError()
+        return await set_tombstone(*args, **kwargs)
+
+    fake_redis.set = flaky_set
+    await invalidate_note_cache(fake_redis, 1, 2)
+    assert fake_redis.storage['note:1:2'] == TOMBSTONE
+    assert not caplog.records
+
+    await invalidate_note_cache(broken_redis, 1, 3)
+    assert 'not invalidated' in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_broken_entry_is_miss(fake_redis):
+    for raw in ('{not json', '[1, 2]', '{"d": "yesterday", "t": "text", "v": 1}'):
+        fake_redis.storage['note:1:2'] = raw
+        assert await get_cached_note(fake_redis, 1, 2) is None
+
+
+@pytest.mark.asyncio
+async def test_entry_without_version_is_miss(fake_redis):
+    fake_redis.storage['note:1:2'] = '{"d": "2025-12-16", "t": "text"}'
+    assert await get_cached_note(fake_redis, 1, 2) is None
@@ -0,0 +1,88 @@
+import pytest
+
+import note_import
+from note_import import iter_lines, parse_ndjson, parse_csv, import_notes
+
+
+async def body(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+async def collect(rows):
+    return [row async for row in rows]
+
+
+@pytest.mark.asyncio
+async def test_iter_lines_across_chunks():
+    # euro sign is split between chunks
+    lines = await collect(iter_lines(body(b'first\r\nsec', b'ond \xe2\x82', b'\xac\nlast')))
+    assert lines == [(1, 'first'), (2, 'second €'), (3, 'last')]
+
+
+@pytest.mark.asyncio
+async def test_parse_ndjson():
+    rows = await collect(parse_ndjson(iter_lines(body(b'{"a": 1}\n\n{broken\n'))))
+    assert rows == [(1, {'a': 1}), (3, None)]
+
+
+@pytest.mark.asyncio
+async def test_parse_csv_quoted_newlines():
+    data = b'note_date,note_text\n2025-12-16,plain\n2025-12-17,"multi\nline, ""quoted"""\n2025-12-18\n'
+    rows = await collect(parse_csv(iter_lines(body(data))))
+    assert rows == [
+        (2, {'note_date': '2025-12-16', 'note_text': 'plain'}),
+        (3, {'note_date': '2025-12-17', 'note_text': 'multi\nline, "quoted"'}),
+        (5, None),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_parse_csv_requires_header():
+    with pytest.raises(ValueError):
+        await collect(parse_csv(iter_lines(body(b'text,date\nhello,2025-12-16\n'))))
+
+
+@pytest.mark.asyncio
+async def test_import_notes_chunks_and_errors(monkeypatch):
+    inserted = []
+
+    async def fake_new_notes(db, user_id, notes):
+        inserted.append(list(notes))
+        return list(range(len(notes)))
+
+    monkeypatch.setattr(note_import.database, 'new_notes', fake_new_notes)
+
+    async def rows():
+        for i in range(5):
+            yield i + 1, {'note_text': f'note {i}', 'note_date': '2025-12-16'}
+        yield 6, {'note_text': 'no date'}
+        yield 7, None
+
+    result = await import_notes(None, 1, rows(), chunk_size=2, max_errors=1)
+
+    assert [len(chunk) for chunk in inserted] == [2, 2, 1]
+    assert result['imported'] == 5
+    assert result['failed'] == 2
+    assert len(result['errors']) == 1
+    assert result['errors'][0]['line'] == 6
+    assert 'note_date' in result['errors'][0]['error']
+
+
+@pytest.mark.asyncio
+async def test_iter_lines_skips_too_long_line():
+    # the long line never ends in one chunk, it is dropped up to the newline
+    chunks = [b'short\n', b'x' * 6, b'x' * 6, b'x\nafter\n', b'y' * 20]
+    lines = await collect(iter_lines(body(*chunks), max_length=10))
+    assert lines == [(1, 'short'), (2, note_import.TOO_LONG), (3, 'after'), (4, note_import.TOO_LONG)]
+
+
+@pytest.mark.asyncio
+async def test_parse_csv_unbalanced_quote_resyncs():
+    data = b'note_date,note_text\n2025-12-16,"open\nmore\nand more\n2025-12-17,ok\n'
+    rows = await collect(parse_csv(iter_lines(body(data), max_length=20), max_length=20))
+    assert rows == [
+        (2, note_import.TOO_LONG),
+        (4, None),
+        (5, {'note_date': '2025-12-17', 'note_text': 'ok'}),
+    ]
@@ -0,0 +1,16 @@
+import pytest
+
+from pagination import encode_cursor, decode_cursor
+
+
+def test_cursor_roundtrip():
+    data = {'order': 'note_date', 'after': ['2025-12-16', 7]}
+    cursor = encode_cursor(data)
+    assert '=' not in cursor
+    assert decode_cursor(cursor) == data
+
+
+@pytest.mark.parametrize('cursor', ['not a cursor', encode_cursor([1, 2])[:-1], 'W10'])
+def test_invalid_cursor_raises(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
@@ -0,0 +1,94 @@
+import pytest
+from redis.exceptions import ConnectionError
+
+import rate_limit
+from rate_limit import MemoryWindow, RateLimiter, RateLimited
+
+
+class ScriptRedis:
+    def __init__(self, result=0, error=None):
+        self.result = result
+        self.error = error
+        self.calls = []
+
+    async def eval(self, script, numkeys, *args):
+        self.calls.append(args)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class TestMemoryWindow:
+    def test_sliding_window(self, clock):
+        window = MemoryWindow()
+        for _ in range(3):
+            assert window.hit(['a'], [3], 60) == 0
+            clock.now += 10
+
+        # first attempt was 30 seconds ago
+        assert window.hit(['a'], [3], 60) == pytest.approx(30)
+        clock.now += 30
+        assert window.hit(['a'], [3], 60) == 0
+
+    def test_rejected_attempt_counts_nowhere(self, clock):
+        window = MemoryWindow()
+        window.hit(['email', 'ip'], [1, 10], 60)
+
+        assert window.hit(['email', 'ip'], [1, 10], 60) > 0
+        assert len(window._attempts['ip']) == 1
+
+    def test_bounded(self, clock):
+        window = MemoryWindow(maxkeys=2)
+        for key in ('a', 'b', 'c'):
+            window.hit([key], [1], 60)
+
+        assert len(window) == 2
+        assert window.hit(['a'], [1], 60) == 0
+
+
+class TestRateLimiter:
+    async def test_memory(self, clock):
+        limiter = RateLimiter(limits={'login': (2, 100)})
+        await limiter.check('login', 'user@sample.com', '10.0.0.1')
+        await limiter.check('login', 'USER@sample.com ', '10.0.0.2')
+
+        with pytest.raises(RateLimited) as e:
+            await limiter.check('login', 'user@sample.com', '10.0.0.3')
+        assert e.value.retry_after_header == '60'
+        await limiter.check('login', 'other@sample.com', '10.0.0.1')
+
+    async def test_zero_limit_turns_key_off(self, clock):
+        limiter = RateLimiter(limits={'register': (0, 1)})
+        await limiter.check('register', 'a@sample.com', '10.0.0.1')
+
+        with pytest.raises(RateLimited):
+            await limiter.check('register', 'b@sample.com', '10.0.0.1')
+        assert list(limiter.memory._attempts) == ['ratelimit:register:ip:10.0.0.1']
+
+    async def test_redis(self):
+        redis = ScriptRedis(result=1500)
+        limiter = RateLimiter(redis, window=60, limits={'login': (10, 100)})
+
+        with pytest.raises(RateLimited) as e:
+            await limiter.check('login', 'user@sample.com', '10.0.0.1')
+        assert e.value.retry_after == 1.5
+        assert e.value.retry_after_header == '2'
+        keys_and_args = redis.calls[0]
+        assert keys_and_args[:2] == ('ratelimit:login:email:user@sample.com', 'ratelimit:login:ip:10.0.0.1')
+        assert keys_and_args[3] == 60000
+        assert keys_and_args[5:] == (10, 100)
+
+    async def test_falls_back_to_memory(self, clock):
+        redis = ScriptRedis(error=ConnectionError())
+        limiter = RateLimiter(redis, limits={'login': (1, 100)})
+        await limiter.check('login', 'user@sample.com', '10.0.0.1')
+
+        with pytest.raises(RateLimited):
+            await limiter.check('login', 'user@sample.com', '10.0.0.1')
+        assert limiter.errors == 2
+
+    async def test_disabled(self, monkeypatch):
+        monkeypatch.setattr(rate_limit, 'RATE_LIMIT_ENABLED', False)
+        redis = ScriptRedis(result=1000)
+        await RateLimiter(redis).check('login', 'user@sample.com', '10.0.0.1')
+        assert not redis.calls
@@ -1,61 +1,125 @@
 import pytest
+from redis.asyncio import BlockingConnectionPool
 
 from token_rotation_logic import (
     save_refresh_token,
-    is_refresh_token_valid,
     delete_refresh_token,
+    rotate_refresh_token,
+    revoke_user_refresh_tokens,
+    REFRESH_TOKEN_EXPIRE_DAYS,
+    REFRESH_REUSE_WINDOW_SECONDS,
+    ROTATION_VALID,
+    ROTATION_INVALID,
+    ROTATION_REUSED,
 )
+from redis_session import create_redis_client, close_redis_client
 
-class FakeRedis:
-    def __init__(self):
-        self.storage = {}
 
-    async def set(self, key, value, ex=None):
-        self.storage[key] = value
+@pytest.mark.asyncio
+async def test_save_refresh_token(fake_redis):
+    token = 'refresh123'
+    user_id = 42
 
-    async def exists(self, key):
-        return 1 if key in self.storage else 0
+    await save_refresh_token(fake_redis, token, user_id)
 
-    async def delete(self, key):
-        self.storage.pop(key, None)
+    # session stores user's generation, not the token
+    assert fake_redis.storage[f'refresh:{token}'] == '0'
 
 
 @pytest.mark.asyncio
-async def test_save_refresh_token():
-    redis = FakeRedis()
+async def test_delete_refresh_token(fake_redis):
     token = 'refresh123'
-    user_id = 42
 
-    await save_refresh_token(redis, token, user_id)
+    fake_redis.storage[f'refresh:{token}'] = 42
 
-    assert redis.storage[f'refresh:{token}'] == user_id
+    assert await delete_refresh_token(fake_redis, token) is True
+
+    assert f'refresh:{token}' not in fake_redis.storage
 
 
 @pytest.mark.asyncio
-async def test_is_refresh_token_valid_true():
-    redis = FakeRedis()
-    token = 'refresh123'
+async def test_delete_refresh_token_missing(fake_redis):
+    assert await delete_refresh_token(fake_redis, 'refresh123') is False
+
 
-    redis.storage[f'refresh:{token}'] = 42
+@pytest.mark.asyncio
+async def test_rotate_refresh_token_keeps_ttl(fake_redis):
+    await save_refresh_token(fake_redis, 'old', 42)
+    fake_redis.ttls['refresh:old'] = 5000
+
+    assert await rotate_refresh_token(fake_redis, 42, 'old', 'new') == ROTATION_VALID
 
-    assert await is_refresh_token_valid(redis, token) is True
+    assert 'refresh:old' not in fake_redis.storage
+    assert fake_redis.storage['refresh:new'] == '0'
+    assert fake_redis.ttls['refresh:new'] == 5000
+    assert fake_redis.ttls['refresh_rotated:old'] == 5000
 
 
 @pytest.mark.asyncio
-async def test_is_refresh_token_valid_false():
-    redis = FakeRedis()
-    token = 'refresh123'
+async def test_rotation_marker_is_capped_by_reuse_window(fake_redis):
+    await save_refresh_token(fake_redis, 'old', 42)
+
+    assert await rotate_refresh_token(fake_redis, 42, 'old', 'new') == ROTATION_VALID
 
-    assert await is_refresh_token_valid(redis, token) is False
+    assert fake_redis.ttls['refresh:new'] == REFRESH_TOKEN_EXPIRE_DAYS*24*60*60*1000
+    assert fake_redis.ttls['refresh_rotated:old'] == REFRESH_REUSE_WINDOW_SECONDS*1000
 
 
 @pytest.mark.asyncio
-async def test_delete_refresh_token():
-    redis = FakeRedis()
-    token = 'refresh123'
+async def test_rotate_unknown_refresh_token(fake_redis):
+
+    assert await rotate_refresh_token(fake_redis, 42, 'old', 'new') == ROTATION_INVALID
+    assert 'refresh:new' not in fake_redis.storage
+
+
+@pytest.mark.asyncio
+async def test_rotate_reused_refresh_token_revokes_chain(fake_redis):
+    await save_refresh_token(fake_redis, 'old', 42)
+    await save_refresh_token(fake_redis, 'other_device', 42)
+    await save_refresh_token(fake_redis, 'other_user', 43)
+
+    assert await rotate_refresh_token(fake_redis, 42, 'old', 'new') == ROTATION_VALID
+    assert await rotate_refresh_token(fake_redis, 42, 'new', 'newer') == ROTATION_VALID
+    assert await rotate_refresh_token(fake_redis, 42, 'old', 'stolen') == ROTATION_REUSED
+
+    assert 'refresh:stolen' not in fake_redis.storage
+    assert fake_redis.storage['refresh_gen:42'] == '1'
+    # not only the direct successor, the whole chain is revoked
+    assert await rotate_refresh_token(fake_redis, 42, 'newer', 'next') == ROTATION_INVALID
+    assert await rotate_refresh_token(fake_redis, 42, 'other_device', 'next') == ROTATION_INVALID
+    assert await rotate_refresh_token(fake_redis, 43, 'other_user', 'next') == ROTATION_VALID
+    # reuse is reported once, afterwards the old token is just invalid
+    assert await rotate_refresh_token(fake_redis, 42, 'old', 'stolen') == ROTATION_INVALID
+
+
+@pytest.mark.asyncio
+async def test_revoke_user_refresh_tokens(fake_redis):
+    await save_refresh_token(fake_redis, 'first', 42)
+    await save_refresh_token(fake_redis, 'second', 42)
+    await save_refresh_token(fake_redis, 'other_user', 43)
+
+    await revoke_user_refresh_tokens(fake_redis, 42)
+
+    assert await rotate_refresh_token(fake_redis, 42, 'first', 'new') == ROTATION_INVALID
+    assert await rotate_refresh_token(fake_redis, 43, 'other_user', 'new') == ROTATION_VALID
+
+    await save_refresh_token(fake_redis, 'third', 42)
+    assert await rotate_refresh_token(fake_redis, 42, 'third', 'newer') == ROTATION_VALID
+
+
+@pytest.mark.asyncio
+async def test_redis_client_uses_shared_pool(monkeypatch):
+    monkeypatch.setenv('REDIS_MAX_CONNECTIONS', '7')
+    monkeypatch.setenv('REDIS_SOCKET_TIMEOUT', '1.5')
+    monkeypatch.setenv('REDIS_POOL_TIMEOUT', '0.5')
 
-    redis.storage[f'refresh:{token}'] = 42
+    redis_client = create_redis_client()
+    pool = redis_client.connection_pool
 
-    await delete_refresh_token(redis, token)
+    assert isinstance(pool, BlockingConnectionPool)
+    assert pool.max_connections == 7
+    assert pool.timeout == 0.5
+    assert pool.connection_kwargs['socket_timeout'] == 1.5
+    assert pool.connection_kwargs['health_check_interval'] == 30
 
-    assert f'refresh:{token}' not in redis.storage
+    await close_redis_client(redis_client)
@@ -1,14 +1,24 @@
 import pytest
+import asyncio
+import time
 from datetime import datetime, timedelta, timezone
 import jwt
 import os
 
+import cache
+import security
 from security import (
     hash_password,
     verify_password,
+    hash_password_async,
+    verify_password_async,
+    hash_stats,
+    PasswordHashingBusy,
     create_access_token,
     create_refresh_token,
     decode_token,
+    decode_token_cached,
+    token_cache,
 )
 
 SECRET_KEY = os.getenv('SECRET_KEY')
@@ -56,6 +66,12 @@ class TestSecurity:
     def test_create_refresh_token(self, common_data):
         assert isinstance(common_data['refresh_token'], str)
 
+    def test_refresh_token_jti(self, common_data):
+        assert decode_token(common_data['refresh_token'])['jti']
+        assert decode_token(create_refresh_token(900, 'abc'))['jti'] == 'abc'
+        # tokens issued in the same second differ
+        assert create_refresh_token(900) != create_refresh_token(900)
+
     def test_decode_token_id(self, common_data):
         decoded_id = decode_token(common_data['access_token']).get('sub')
         assert decoded_id == str(common_data['user_id'])
@@ -82,3 +98,62 @@ class TestSecurity:
         invalid_token = "invalid.format"
         with pytest.raises(jwt.exceptions.InvalidTokenError):
             decode_token(invalid_token)
+
+
+class TestHashPool:
+    @pytest.mark.asyncio
+    async def test_hash_and_verify_async(self):
+        hashed = await hash_password_async('some_password')
+        assert await verify_password_async('some_password', hashed)
+        assert not await verify_password_async('another_password', hashed)
+
+    @pytest.mark.asyncio
+    async def test_hash_stats_updated(self):
+        completed = hash_stats.completed
+        await hash_password_async('some_password')
+        assert hash_stats.completed == completed + 1
+        assert hash_stats.max_seconds > 0
+        assert hash_stats.pending == 0
+
+    @pytest.mark.asyncio
+    async def test_full_pool_rejects(self, monkeypatch):
+        monkeypatch.setattr(security, 'HASH_POOL_SIZE', 1)
+        monkeypatch.setattr(security, 'HASH_QUEUE_LIMIT', 1)
+        hashed = hash_password('some_password')
+
+        results = await asyncio.gather(
+            *(verify_password_async('some_password', hashed) for _ in range(4)),
+            return_exceptions=True,
+        )
+
+        assert results.count(True) == 2
+        assert sum(isinstance(r, PasswordHashingBusy) for r in results) == 2
+
+
+class TestTokenCache:
+    def setup_method(self):
+        token_cache.clear()
+
+    def test_cached_payload_equals_decoded(self, common_data):
+        token = common_data['access_token']
+        assert decode_token_cached(token) == decode_token(token)
+        assert decode_token_cached(token) == decode_token(token)
+        assert token_cache.hits == 1
+        assert len(token_cache) == 1
+
+    def test_invalid_token_not_cached(self):
+        with pytest.raises(jwt.exceptions.InvalidTokenError):
+            decode_token_cached("invalid.format")
+        assert len(token_cache) == 0
+
+    def test_entry_expires_with_token(self, monkeypatch):
+        expire = datetime.now(timezone.utc) + timedelta(seconds=30)
+        token = jwt.encode({"sub": "1", "exp": expire.timestamp()}, SECRET_KEY, algorithm=ALGORITHM)
+        decode_token_cached(token)
+
+        now = time.monotonic()
+        monkeypatch.setattr(cache.time, 'monotonic', lambda: now + 31)
+        decode_token_cached(token)
+
+        assert token_cache.hits == 0
+        assert token_cache.misses == 2
@@ -0,0 +1,79 @@
+import pytest
+from sqlalchemy import exc, text
+
+import session
+from settings import DatabaseSettings
+from session import PoolStats, TimedQueuePool, create_engine, warm_up_pool
+
+
+@pytest.fixture
+def stats(monkeypatch):
+    fresh = PoolStats()
+    monkeypatch.setattr(session, 'pool_stats', fresh)
+    return fresh
+
+
+def test_settings_from_env(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'postgresql+asyncpg://u:p@db/notes')
+    monkeypatch.setenv('DB_POOL_SIZE', '20')
+    monkeypatch.setenv('DB_STATEMENT_CACHE_SIZE', '0')
+
+    kwargs = DatabaseSettings().engine_kwargs()
+
+    assert kwargs['echo'] is False
+    assert kwargs['pool_size'] == 20
+    assert kwargs['max_overflow'] == 10
+    assert kwargs['pool_pre_ping'] is True
+    assert kwargs['connect_args'] == {'prepared_statement_cache_size': 0, 'statement_cache_size': 0}
+
+
+def test_settings_in_memory_sqlite(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite+aiosqlite:///:memory:')
+    monkeypatch.setenv('DB_ECHO', 'true')
+
+    assert DatabaseSettings().engine_kwargs() == {'echo': True}
+
+
+async def test_pool_stats(monkeypatch, tmp_path, stats):
+    monkeypatch.setenv('DATABASE_URL', f'sqlite+aiosqlite:///{tmp_path}/pool.db')
+    monkeypatch.setenv('DB_POOL_SIZE', '1')
+    monkeypatch.setenv('DB_MAX_OVERFLOW', '0')
+    monkeypatch.setenv('DB_POOL_TIMEOUT', '0.05')
+    engine = create_engine(DatabaseSettings())
+    assert isinstance(engine.pool, TimedQueuePool)
+
+    async with engine.connect() as conn:
+        await conn.execute(text('SELECT 1'))
+        data = stats.as_dict(engine.pool)
+        assert data['checked_out'] == 1
+        assert data['size'] == 1
+
+        with pytest.raises(exc.TimeoutError):
+            async with engine.connect():
+                pass
+
+    data = stats.as_dict(engine.pool)
+    assert data['acquired'] == 1
+    assert data['timeouts'] == 1
+    assert data['checked_out'] == 0
+    assert data['max_wait_seconds'] >= 0.05
+    await engine.dispose()
+
+
+async def test_warm_up_pool(monkeypatch, tmp_path, stats):
+    monkeypatch.setenv('DATABASE_URL', f'sqlite+aiosqlite:///{tmp_path}/pool.db')
+    monkeypatch.setenv('DB_POOL_SIZE', '3')
+    engine = create_engine(DatabaseSettings())
+
+    # capped at pool size, opened connections stay in the pool
+    assert await warm_up_pool(engine, 10) == 3
+    data = stats.as_dict(engine.pool)
+    assert data['checked_in'] == 3
+    assert data['checked_out'] == 0
+    await engine.dispose()
+
+    monkeypatch.setenv('DATABASE_URL', 'sqlite+aiosqlite:///:memory:')
+    memory_engine = create_engine(DatabaseSettings())
+    assert await warm_up_pool(memory_engine, 10) == 1
+    assert await warm_up_pool(memory_engine, 0) == 0
+    await memory_engine.dispose()
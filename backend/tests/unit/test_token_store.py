@@ -0,0 +1,119 @@
+import pytest
+
+import token_store
+from token_store import TokenStore, MemoryTokenStore, RedisTokenStore, create_token_store
+from token_rotation_logic import ROTATION_VALID, ROTATION_INVALID, ROTATION_REUSED
+
+
+@pytest.fixture
+def store(clock):
+    return MemoryTokenStore(maxsize=100, ttl=60, reuse_window=10)
+
+
+class TestMemoryTokenStore:
+    async def test_rotate(self, store):
+        await store.save('old', 42)
+
+        assert await store.rotate(42, 'old', 'new') == ROTATION_VALID
+        assert await store.rotate(42, 'new', 'newer') == ROTATION_VALID
+        assert await store.rotate(42, 'unknown', 'other') == ROTATION_INVALID
+        assert len(store) == 1
+
+    async def test_rotate_other_user(self, store):
+        await store.save('old', 42)
+
+        assert await store.rotate(43, 'old', 'new') == ROTATION_INVALID
+        assert len(store) == 0
+
+    async def test_reuse_revokes_chain(self, store):
+        await store.save('old', 42)
+        await store.save('other_device', 42)
+        await store.save('other_user', 43)
+        await store.rotate(42, 'old', 'new')
+        await store.rotate(42, 'new', 'newer')
+
+        assert await store.rotate(42, 'old', 'stolen') == ROTATION_REUSED
+        assert await store.rotate(42, 'newer', 'next') == ROTATION_INVALID
+        assert await store.rotate(42, 'other_device', 'next') == ROTATION_INVALID
+        assert await store.rotate(43, 'other_user', 'next') == ROTATION_VALID
+        assert await store.rotate(42, 'old', 'stolen') == ROTATION_INVALID
+
+    async def test_session_expires(self, store, clock):
+        await store.save('old', 42)
+        clock.now += 30
+        await store.rotate(42, 'old', 'new')
+
+        # rotated session keeps the remaining lifetime
+        clock.now += 31
+        assert await store.rotate(42, 'new', 'newer') == ROTATION_INVALID
+        assert len(store) == 0
+        assert not store._expiry
+
+    async def test_reuse_window(self, store, clock):
+        await store.save('old', 42)
+        await store.rotate(42, 'old', 'new')
+
+        clock.now += 11
+        assert await store.rotate(42, 'old', 'other') == ROTATION_INVALID
+        assert await store.rotate(42, 'new', 'newer') == ROTATION_VALID
+
+    async def test_delete(self, store):
+        await store.save('jti', 42)
+
+        assert await store.delete('jti') is True
+        assert await store.delete('jti') is False
+        assert await store.rotate(42, 'jti', 'new') == ROTATION_INVALID
+
+    async def test_revoke_user(self, store):
+        await store.save('first', 42)
+        await store.save('second', 42)
+        await store.save('other_user', 43)
+
+        await store.revoke_user(42)
+
+        assert await store.rotate(42, 'first', 'new') == ROTATION_INVALID
+        assert await store.rotate(42, 'second', 'new') == ROTATION_INVALID
+        assert await store.rotate(43, 'other_user', 'new') == ROTATION_VALID
+        assert 42 not in store._user_sessions
+
+    async def test_bounded(self, clock):
+        store = MemoryTokenStore(maxsize=3, ttl=60, reuse_window=10)
+        for i in range(5):
+            clock.now += 1
+            await store.save(f'jti{i}', 42)
+
+        assert len(store) == 3
+        # the ones closest to expiry are dropped first
+        assert await store.delete('jti0') is False
+        assert await store.delete('jti4') is True
+
+    async def test_removed_entries_do_not_pile_up(self, store):
+        for i in range(1000):
+            await store.save(f'jti{i}', 42)
+            await store.delete(f'jti{i}')
+
+        assert len(store._expiry) < 100
+
+
+def test_create_token_store(monkeypatch):
+    redis = object()
+    monkeypatch.setattr(token_store, 'TOKEN_STORE_BACKEND', 'redis')
+    store = create_token_store(redis)
+    assert isinstance(store, RedisTokenStore)
+    assert store.redis is redis
+
+    monkeypatch.setattr(token_store, 'TOKEN_STORE_BACKEND', 'memory')
+    assert isinstance(create_token_store(redis), MemoryTokenStore)
+
+    monkeypatch.setattr(token_store, 'TOKEN_STORE_BACKEND', 'memcached')
+    with pytest.raises(ValueError):
+        create_token_store(redis)
+
+
+def test_token_store_is_abstract():
+    class Incomplete(TokenStore):
+        async def save(self, jti, user_id):
+            pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
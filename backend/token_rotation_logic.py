@@ -1,30 +1,98 @@
 import os
 
+from metrics import timed, redis_command_duration_seconds
+
 REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv('REFRESH_TOKEN_EXPIRE_DAYS'))
+# every rotation leaves a marker, so they are kept shorter than sessions.
+# Older rotated tokens are still rejected, they just don't revoke the user's sessions
+REFRESH_REUSE_WINDOW_SECONDS = int(os.getenv('REFRESH_REUSE_WINDOW_SECONDS', '86400'))
+
+ROTATION_VALID = 'valid'
+ROTATION_INVALID = 'invalid'
+ROTATION_REUSED = 'reused'
+
+# Sessions are stored as refresh:{jti} -> generation of user's sessions at login time.
+# Incrementing refresh_gen:{user_id} invalidates every session of the user at once
+
+# KEYS[1] - session, KEYS[2] - user's generation. ARGV[1] - ttl in seconds
+SAVE_REFRESH_TOKEN_SCRIPT = """
+local generation = redis.call('GET', KEYS[2]) or '0'
+redis.call('SET', KEYS[1], generation, 'EX', ARGV[1])
+"""
+
+# KEYS[1] - old session, KEYS[2] - new session, KEYS[3] - rotation marker of old session,
+# KEYS[4] - user's generation. ARGV[1] - reuse window in milliseconds.
+# Runs atomically on redis server, so of two concurrent refreshes with the same
+# token only one gets 'valid'. Presenting the old token again within the reuse window
+# means it was stolen, so the user's generation is incremented and every session
+# of the user is revoked, whatever number of rotations happened since
+ROTATE_REFRESH_TOKEN_SCRIPT = """
+local ttl = redis.call('PTTL', KEYS[1])
+if ttl > 0 then
+    local generation = redis.call('GET', KEYS[1])
+    redis.call('DEL', KEYS[1])
+    if generation ~= (redis.call('GET', KEYS[4]) or '0') then
+        return 'invalid'
+    end
+    redis.call('SET', KEYS[2], generation, 'PX', ttl)
+    redis.call('SET', KEYS[3], generation, 'PX', math.min(ttl, tonumber(ARGV[1])))
+    return 'valid'
+end
+if redis.call('DEL', KEYS[3]) == 1 then
+    redis.call('INCR', KEYS[4])
+    return 'reused'
+end
+return 'invalid'
+"""
+
+
+def _key(jti: str) -> str:
+    return f"refresh:{jti}"
+
+
+def _rotated_key(jti: str) -> str:
+    return f"refresh_rotated:{jti}"
+
+
+def _generation_key(user_id: int) -> str:
+    return f"refresh_gen:{user_id}"
+
 
-async def save_refresh_token(redis, refresh_token: str, user_id: int):
-    await redis.set(
-        f"refresh:{refresh_token}",
-        user_id,
-        ex=REFRESH_TOKEN_EXPIRE_DAYS*24*60*60,
+@timed(redis_command_duration_seconds)
+async def save_refresh_token(redis, jti: str, user_id: int):
+    await redis.eval(
+        SAVE_REFRESH_TOKEN_SCRIPT,
+        2,
+        _key(jti),
+        _generation_key(user_id),
+        REFRESH_TOKEN_EXPIRE_DAYS*24*60*60,
     )
 
 
-async def update_refresh_token(redis, refresh_token_old: str, refresh_token_new: str, user_id: int):
-    ttl = await redis.ttl(f"refresh:{refresh_token_old}")
-    if ttl is None or ttl <= 0:
-        raise ValueError
-    await redis.delete(f"refresh:{refresh_token_old}")
-    await redis.set(
-        f"refresh:{refresh_token_new}",
-        user_id,    
-        ex=ttl,
+@timed(redis_command_duration_seconds)
+async def rotate_refresh_token(redis, user_id: int, jti_old: str, jti_new: str) -> str:
+    # one round trip, returns ROTATION_VALID, ROTATION_INVALID or ROTATION_REUSED
+    result = await redis.eval(
+        ROTATE_REFRESH_TOKEN_SCRIPT,
+        4,
+        _key(jti_old),
+        _key(jti_new),
+        _rotated_key(jti_old),
+        _generation_key(user_id),
+        REFRESH_REUSE_WINDOW_SECONDS*1000,
     )
+    if isinstance(result, bytes):
+        result = result.decode()
+    return result
 
 
-async def is_refresh_token_valid(redis, refresh_token: str) -> bool:
-    return await redis.exists(f"refresh:{refresh_token}") == 1
+@timed(redis_command_duration_seconds)
+async def delete_refresh_token(redis, jti: str) -> bool:
+    # False if session was not stored, so callers don't need a separate EXISTS
+    return await redis.delete(_key(jti)) == 1
 
 
-async def delete_refresh_token(redis, refresh_token: str):
-    await redis.delete(f"refresh:{refresh_token}")
\ No newline at end of file
+@timed(redis_command_duration_seconds)
+async def revoke_user_refresh_tokens(redis, user_id: int):
+    # O(1), sessions of older generations are rejected on refresh and expire by their TTL
+    await redis.incr(_generation_key(user_id))
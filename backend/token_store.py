@@ -0,0 +1,163 @@
+import os
+import abc
+import time
+import heapq
+
+import token_rotation_logic
+from token_rotation_logic import (
+    REFRESH_TOKEN_EXPIRE_DAYS,
+    REFRESH_REUSE_WINDOW_SECONDS,
+    ROTATION_VALID,
+    ROTATION_INVALID,
+    ROTATION_REUSED,
+)
+
+# 'redis' or 'memory'. Memory store is per process, use it with one worker only
+TOKEN_STORE_BACKEND = os.getenv('TOKEN_STORE_BACKEND', 'redis').lower()
+TOKEN_STORE_MAX_SESSIONS = int(os.getenv('TOKEN_STORE_MAX_SESSIONS', '100000'))
+
+
+class TokenStore(abc.ABC):
+    """Refresh token sessions keyed by jti."""
+
+    @abc.abstractmethod
+    async def save(self, jti: str, user_id: int):
+        ...
+
+    @abc.abstractmethod
+    async def rotate(self, user_id: int, jti_old: str, jti_new: str) -> str:
+        # returns ROTATION_VALID, ROTATION_INVALID or ROTATION_REUSED, atomically
+        ...
+
+    @abc.abstractmethod
+    async def delete(self, jti: str) -> bool:
+        ...
+
+    @abc.abstractmethod
+    async def revoke_user(self, user_id: int):
+        ...
+
+
+class RedisTokenStore(TokenStore):
+    def __init__(self, redis):
+        self.redis = redis
+
+    async def save(self, jti: str, user_id: int):
+        await token_rotation_logic.save_refresh_token(self.redis, jti, user_id)
+
+    async def rotate(self, user_id: int, jti_old: str, jti_new: str) -> str:
+        return await token_rotation_logic.rotate_refresh_token(self.redis, user_id, jti_old, jti_new)
+
+    async def delete(self, jti: str) -> bool:
+        return await token_rotation_logic.delete_refresh_token(self.redis, jti)
+
+    async def revoke_user(self, user_id: int):
+        await token_rotation_logic.revoke_user_refresh_tokens(self.redis, user_id)
+
+
+class MemoryTokenStore(TokenStore):
+    """In-process store with the same semantics as RedisTokenStore.
+
+    Expired entries are swept from a heap ordered by expiry time on every call.
+    When maxsize entries (sessions and rotation markers) are stored, the one
+    closest to expiry is dropped, which is usually a marker.
+    Methods never await, so each of them is atomic within the event loop.
+    """
+
+    def __init__(self, maxsize: int = TOKEN_STORE_MAX_SESSIONS,
+                 ttl: float = REFRESH_TOKEN_EXPIRE_DAYS*24*60*60,
+                 reuse_window: float = REFRESH_REUSE_WINDOW_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.reuse_window = reuse_window
+        self._sessions = {}  # jti -> (user_id, expires_at)
+        self._markers = {}  # old jti -> (user_id, expires_at)
+        self._user_sessions = {}  # user_id -> set of jti
+        self._expiry = []  # heap of (expires_at, kind, jti), may contain removed entries
+
+    def _sweep(self, now: float):
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, kind, jti = heapq.heappop(self._expiry)
+            self._remove(kind, jti, expires_at)
+        # entries removed before their expiry stay in the heap, rebuild it when they dominate
+        if len(self._expiry) > 2 * (len(self._sessions) + len(self._markers)) + 64:
+            self._expiry = [(e, 's', j) for j, (_, e) in self._sessions.items()]
+            self._expiry += [(e, 'm', j) for j, (_, e) in self._markers.items()]
+            heapq.heapify(self._expiry)
+
+    def _remove(self, kind: str, jti: str, expires_at: float = None):
+        # expires_at guards against removing an entry stored again under the same jti
+        entries = self._sessions if kind == 's' else self._markers
+        item = entries.get(jti)
+        if item is None or (expires_at is not None and item[1] != expires_at):
+            return
+        del entries[jti]
+        if kind == 's':
+            user_sessions = self._user_sessions[item[0]]
+            user_sessions.discard(jti)
+            if not user_sessions:
+                del self._user_sessions[item[0]]
+
+    def _evict(self):
+        while len(self._sessions) + len(self._markers) >= self.maxsize and self._expiry:
+            expires_at, kind, jti = heapq.heappop(self._expiry)
+            self._remove(kind, jti, expires_at)
+
+    def _add_session(self, jti: str, user_id: int, expires_at: float):
+        self._evict()
+        self._sessions[jti] = (user_id, expires_at)
+        self._user_sessions.setdefault(user_id, set()).add(jti)
+        heapq.heappush(self._expiry, (expires_at, 's', jti))
+
+    async def save(self, jti: str, user_id: int):
+        now = time.monotonic()
+        self._sweep(now)
+        self._add_session(jti, user_id, now + self.ttl)
+
+    async def rotate(self, user_id: int, jti_old: str, jti_new: str) -> str:
+        now = time.monotonic()
+        self._sweep(now)
+        session = self._sessions.get(jti_old)
+        if session is not None:
+            self._remove('s', jti_old)
+            if session[0] != user_id:
+                return ROTATION_INVALID
+            expires_at = session[1]
+            marker_expires_at = min(expires_at, now + self.reuse_window)
+            self._evict()
+            self._markers[jti_old] = (user_id, marker_expires_at)
+            heapq.heappush(self._expiry, (marker_expires_at, 'm', jti_old))
+            self._add_session(jti_new, user_id, expires_at)
+            return ROTATION_VALID
+
+        marker = self._markers.get(jti_old)
+        if marker is not None:
+            # stolen token, the whole chain and every other session of the user is revoked
+            self._remove('m', jti_old)
+            for jti in list(self._user_sessions.get(marker[0], ())):
+                self._remove('s', jti)
+            return ROTATION_REUSED
+        return ROTATION_INVALID
+
+    async def delete(self, jti: str) -> bool:
+        self._sweep(time.monotonic())
+        if jti not in self._sessions:
+            return False
+        self._remove('s', jti)
+        return True
+
+    async def revoke_user(self, user_id: int):
+        self._sweep(time.monotonic())
+        for jti in list(self._user_sessions.get(user_id, ())):
+            self._remove('s', jti)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+def create_token_store(redis) -> TokenStore:
+    if TOKEN_STORE_BACKEND == 'memory':
+        return MemoryTokenStore()
+    if TOKEN_STORE_BACKEND == 'redis':
+        return RedisTokenStore(redis)
+    raise ValueError(f"Unknown TOKEN_STORE_BACKEND: {TOKEN_STORE_BACKEND}")
@@ -0,0 +1,74 @@
+import os
+import json
+from dataclasses import dataclass, asdict
+
+from redis.exceptions import RedisError
+
+import database
+from cache import TTLCache
+
+# Code that changes or deletes a user must call invalidate_user afterwards.
+# A user changed directly in the database stays cached for up to USER_CACHE_TTL seconds
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '60'))
+# share cached users between workers through redis
+USER_CACHE_REDIS = os.getenv('USER_CACHE_REDIS', 'false').lower() in ('1', 'true', 'yes')
+
+
+@dataclass(frozen=True)
+class CachedUser:
+    user_id: int
+    user_email: str
+
+
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+
+def _redis_key(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+async def get_cached_user(db, user_id: int, redis=None) -> CachedUser | None:
+    # redis failures and unreadable redis values fall back to the database
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+
+    use_redis = USER_CACHE_REDIS and redis is not None
+    if use_redis:
+        try:
+            raw = await redis.get(_redis_key(user_id))
+        except RedisError:
+            raw = None
+        if raw is not None:
+            try:
+                user = CachedUser(**json.loads(raw))
+            except (ValueError, TypeError):
+                user = None
+            if user is not None and user.user_id == user_id:
+                user_cache.set(user_id, user)
+                return user
+
+    db_user = await database.get_user_by_id(db, user_id)
+    if db_user is None:
+        return None
+
+    user = CachedUser(user_id=db_user.user_id, user_email=db_user.user_email)
+    user_cache.set(user_id, user)
+    if use_redis:
+        try:
+            await redis.set(_redis_key(user_id), json.dumps(asdict(user)), px=max(1, int(USER_CACHE_TTL * 1000)))
+        except RedisError:
+            pass
+    return user
+
+
+async def invalidate_user(user_id: int, redis=None):
+    # drops the user from this worker and from redis, other workers keep their
+    # local copy until USER_CACHE_TTL
+    user_cache.invalidate(user_id)
+    if USER_CACHE_REDIS and redis is not None:
+        try:
+            await redis.delete(_redis_key(user_id))
+        except RedisError:
+            pass